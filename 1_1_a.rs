@@ -0,0 +1,17 @@
+struct State {
+    n: i32,
+}
+
+fn main() {
+    let mut state: State = State {
+        n: 0,
+    };
+    state.n = 1;
+    if state.n == 1 {
+        print!("one\ntwo\n");
+        state.n = state.n + 2;
+        println!("{}", state.n);
+    }
+    return;
+}
+
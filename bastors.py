@@ -1,38 +1,256 @@
 #!/usr/bin/env python3
 import argparse
+import os
 import sys
+from bastors.build import (
+    CACHE_SIZE,
+    RUSTC_FLAGS,
+    BinaryCache,
+    BuildError,
+    build_cargo,
+    build_rustc,
+    default_cache_dir,
+    report,
+)
+from bastors.bundle import BundleError, bundle, program_name
+from bastors.cargo import create_project, package_name
 from bastors.lex import LexError
-from bastors.parse import Parser, ParseError
-from bastors.goto_elimination import GotoEliminationError, eliminate_goto
-from bastors.rustify import Rustify
+from bastors.outlining import OUTLINE_SIZE
+from bastors.parse import ParseError
+from bastors.pgo import build_pgo, report as report_pgo
+from bastors.goto_elimination import GotoBudgetError, GotoEliminationError
+from bastors.inlining import INLINE_THRESHOLD
+from bastors.pipeline import transpiler
+from bastors.source_map import SourceMap
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-o", "--output", help="file to output rust to")
-    parser.add_argument("input")
+    parser.add_argument(
+        "--stats", action="store_true", help="print GOTO elimination statistics"
+    )
+    parser.add_argument(
+        "--max-growth",
+        type=float,
+        help="abort if GOTO elimination grows the program more than this factor",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="print time and peak memory spent in each pass as JSON",
+    )
+    parser.add_argument(
+        "--buffered-output",
+        action="store_true",
+        help="make PRINT write to one buffered, locked stdout",
+    )
+    parser.add_argument(
+        "-O",
+        "--opt-level",
+        type=int,
+        default=0,
+        choices=[0, 1, 2, 3],
+        help="optimization level (default: 0)",
+    )
+    parser.add_argument(
+        "--inline-threshold",
+        type=int,
+        default=INLINE_THRESHOLD,
+        metavar="N",
+        help="with -O 1 or higher, inline GOSUB routines of at most N statements, "
+        "and routines called once, 0 to not inline (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cargo",
+        metavar="DIR",
+        help="write a Cargo project, with a release profile tuned for speed, to DIR",
+    )
+    parser.add_argument(
+        "--target-cpu-native",
+        action="store_true",
+        help="with --cargo, build for the CPU of the building machine",
+    )
+    parser.add_argument(
+        "--build",
+        action="store_true",
+        help="compile with rustc -O, or cargo with --cargo, to the binary --output "
+        "or one named after the input, reusing binaries cached for the same code",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        default=default_cache_dir(),
+        help="with --build, cache binaries in DIR (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        metavar="MB",
+        default=CACHE_SIZE >> 20,
+        help="with --build, keep at most MB megabytes of binaries cached "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="transpile all inputs into one program, which runs the one named "
+        "by the name it is invoked as, or by its first argument",
+    )
+    parser.add_argument(
+        "--split",
+        action="store_true",
+        help="write every GOSUB routine, and regions of main moved into routines "
+        "of their own, to module files next to the output",
+    )
+    parser.add_argument(
+        "--outline-size",
+        type=int,
+        default=OUTLINE_SIZE,
+        metavar="N",
+        help="with --split, move regions of main of up to N statements into "
+        "routines, 0 to not move any (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--source-map",
+        metavar="FILE",
+        help="write a JSON map of the lines of Rust to the TinyBasic statements "
+        "they were generated from to FILE, and build with line tables",
+    )
+    parser.add_argument(
+        "--line-comments",
+        action="store_true",
+        help="start the code of every statement with a comment naming its label "
+        "or line",
+    )
+    parser.add_argument(
+        "--instrument",
+        action="store_true",
+        help="count how often every statement runs and every branch is taken, "
+        "written to NAME.counts, or $BASTORS_COUNTS, at exit",
+    )
+    parser.add_argument(
+        "--pgo",
+        metavar="INPUT",
+        help="with --build, optimize with the profile of a run with the file INPUT "
+        "as input, and report the speedup over rustc -O",
+    )
+    parser.add_argument("input", nargs="+")
     args = parser.parse_args()
 
-    try:
-        f = open(args.input, "r")
-        program = f.read()
-    except IOError:
-        print("could not read file: %s" % args.input)
-        sys.exit()
+    if args.bundle:
+        if args.stats or args.timings:
+            parser.error("--stats and --timings cannot be combined with --bundle")
+        name = "bundle"
+    elif len(args.input) > 1:
+        parser.error("more than one input requires --bundle")
+    else:
+        name = program_name(args.input[0])
+    package = package_name(args.input[0] if not args.bundle else name)
+
+    sources = list()
+    for path in args.input:
+        try:
+            with open(path, "r") as f:
+                sources.append((program_name(path), f.read()))
+        except IOError:
+            print("could not read file: %s" % path)
+            sys.exit()
+
+    output = args.output or sys.stdout
+    if args.cargo:
+        if args.output:
+            parser.error("--cargo and --output cannot be combined")
+        output = create_project(args.cargo, package, args.target_cpu_native)
+    elif args.target_cpu_native:
+        parser.error("--target-cpu-native requires --cargo")
+    elif args.build:
+        # The output names the binary, the Rust is only kept in memory
+        output = None
+        binary = args.output or name
+        for path in args.input:
+            if os.path.abspath(binary) == os.path.abspath(path):
+                parser.error(
+                    "the binary would replace the input, name it with --output"
+                )
+
+    if args.pgo and (not args.build or args.cargo or args.bundle):
+        parser.error("--pgo requires --build, without --cargo or --bundle")
 
+    rust_options = {"buffered_output": args.buffered_output}
+    if args.split:
+        if args.bundle:
+            parser.error("--split cannot be combined with --bundle")
+        if args.build and not args.cargo:
+            parser.error("--split with --build requires --cargo")
+        if not isinstance(output, str):
+            parser.error("--split requires --output or --cargo")
+        rust_options["module_dir"] = os.path.dirname(os.path.abspath(output))
+    if args.line_comments:
+        rust_options["line_comments"] = True
+    if args.instrument:
+        rust_options["instrument"] = "%s.counts" % name
+    source_map = None
+    if args.source_map:
+        if args.bundle:
+            parser.error("--source-map cannot be combined with --bundle")
+        source_map = SourceMap()
+        rust_options["source_map"] = source_map
+
+    options = dict(
+        max_growth=args.max_growth,
+        out=output,
+        rust_options=rust_options,
+        opt_level=args.opt_level,
+        inline_threshold=args.inline_threshold,
+        outline_size=args.outline_size if args.split else None,
+    )
+    passes = None
+    if not args.bundle:
+        passes = transpiler(stats=args.stats, measure_memory=args.timings, **options)
     try:
-        tree = eliminate_goto(Parser(program).parse())
+        if passes is not None:
+            rust = passes.run(sources[0][1])
+        else:
+            rust = bundle(sources, **options)
     except ParseError as err:
         print("parse error: %s" % err)
         sys.exit(1)
     except LexError as err:
         print("syntax error: %s [%d:%d]" % (err, err.line, err.col))
         sys.exit(1)
-    except GotoEliminationError as err:
+    except GotoBudgetError as err:
+        print(err)
+        if args.stats:
+            passes.dump_stats(sys.stderr)
+        sys.exit(1)
+    except (GotoEliminationError, BundleError) as err:
         print(err)
         sys.exit(1)
 
-    out = open(args.output, "w") if args.output else sys.stdout
+    if args.stats:
+        passes.dump_stats(sys.stderr)
+    if args.timings:
+        passes.dump_timings(sys.stderr)
+    if source_map is not None:
+        with open(args.source_map, "w") as f:
+            source_map.dump(f)
 
-    rust = Rustify()
-    rust.visit(tree)
-    rust.output(out)
+    if args.build:
+        cache = BinaryCache(args.cache_dir, args.cache_size << 20)
+        try:
+            if args.cargo:
+                result = build_cargo(args.cargo, package, cache)
+            elif args.pgo:
+                result = build_pgo(rust, binary, args.pgo, cache)
+            else:
+                flags = RUSTC_FLAGS
+                if source_map is not None:
+                    flags = flags + ["-C", "debuginfo=line-tables-only"]
+                result = build_rustc(rust, binary, cache, flags)
+        except BuildError as err:
+            print(err, file=sys.stderr)
+            sys.exit(1)
+        if args.pgo:
+            report_pgo(result)
+        else:
+            report(result)
@@ -0,0 +1,151 @@
+"""
+This module provides analyses of the statement tree, used when generating
+code and by the optimization passes: which variables statements read and
+write and which GOSUB routines they call.
+"""
+from collections import namedtuple
+import bastors.parse as parse
+from bastors.visitor import Visitor
+
+# The variables read and written, and the GOSUB targets called, by a block
+# of statements. Targets are strings, like the contexts of the Rustify class.
+Usage = namedtuple("Usage", ["reads", "writes", "calls"])
+
+
+def expression_variables(exp, variables=None):
+    """ Return the set of variables read by an expression """
+    if variables is None:
+        variables = set()
+
+    if isinstance(exp, parse.VariableExpression):
+        variables.add(exp.var)
+    elif isinstance(exp, parse.ArithmeticExpression):
+        expression_variables(exp.left, variables)
+        expression_variables(exp.right, variables)
+    elif isinstance(exp, (parse.ParenExpression, parse.NotExpression)):
+        expression_variables(exp.exp, variables)
+    elif isinstance(exp, parse.BooleanExpression):
+        condition_variables(exp.conditions, variables)
+    return variables
+
+
+def condition_variables(conditions, variables=None):
+    """ Return the set of variables read by a list of conditions """
+    if variables is None:
+        variables = set()
+
+    for cond in conditions or []:
+        if isinstance(cond, (parse.VariableCondition, parse.NotVariableCondition)):
+            variables.add(cond.var)
+        elif isinstance(cond, parse.Condition):
+            expression_variables(cond.left, variables)
+            expression_variables(cond.right, variables)
+    return variables
+
+
+# pylint: disable=C0103,C0116
+class UsageCollector(Visitor):
+    """
+    This class visit all nodes of a statement tree and collects the
+    variables read and written and the GOSUB routines called.
+    """
+
+    def __init__(self):
+        super().__init__(self.__default)
+        self.reads = set()
+        self.writes = set()
+        self.calls = set()
+
+    def __default(self, node):
+        pass
+
+    def usage(self):
+        return Usage(self.reads, self.writes, self.calls)
+
+    def visit_Program(self, node):
+        for statements in node.statements.values():
+            for statement in statements:
+                yield statement
+
+    def visit_Let(self, node):
+        self.writes.add(node.lval.var)
+        expression_variables(node.rval, self.reads)
+
+    def visit_Input(self, node):
+        for var in node.variables:
+            self.writes.add(var.var)
+
+    def visit_Print(self, node):
+        for exp in node.exp_list:
+            expression_variables(exp, self.reads)
+
+    def visit_Gosub(self, node):
+        self.calls.add(str(node.target_label))
+
+    def visit_If(self, node):
+        condition_variables(node.conditions, self.reads)
+        for statement in node.statements:
+            yield statement
+
+    def visit_Loop(self, node):
+        condition_variables(node.conditions, self.reads)
+        for statement in node.statements:
+            yield statement
+
+    def visit_Block(self, node):
+        for statement in node.statements:
+            yield statement
+
+    def visit_For(self, node):
+        self.writes.add(node.var.var)
+        self.reads.add(node.var.var)
+        for exp in (node.start, node.stop, node.step):
+            expression_variables(exp, self.reads)
+        for statement in node.statements:
+            yield statement
+
+
+def statement_usage(statements):
+    """ Return the Usage of a list of statements, not following calls """
+    collector = UsageCollector()
+    for statement in statements:
+        collector.visit(statement)
+    return collector.usage()
+
+
+def context_usage(program):
+    """ Return the Usage of every context of the program, not following
+        calls. The contexts are keyed by their string names. """
+    return {
+        str(context): statement_usage(statements)
+        for context, statements in program.statements.items()
+    }
+
+
+def function_effects(program):
+    """
+    Return the Usage of every context of the program including the
+    variables read and written by all routines it calls, directly or
+    through other routines.
+    """
+    usage = context_usage(program)
+    effects = {
+        context: Usage(set(use.reads), set(use.writes), set(use.calls))
+        for context, use in usage.items()
+    }
+
+    changed = True
+    while changed:
+        changed = False
+        for effect in effects.values():
+            for callee in list(effect.calls):
+                if callee not in effects:
+                    continue
+                other = effects[callee]
+                size = len(effect.reads) + len(effect.writes) + len(effect.calls)
+                effect.reads.update(other.reads)
+                effect.writes.update(other.writes)
+                effect.calls.update(other.calls)
+                if len(effect.reads) + len(effect.writes) + len(effect.calls) != size:
+                    changed = True
+    return effects
@@ -0,0 +1,236 @@
+"""
+This module compiles transpiled programs, with rustc -O or with cargo for
+a project written by bastors.cargo, and keeps the binaries in a cache.
+
+Compiling takes far longer than transpiling, and the same Rust is often
+compiled again. A binary is cached under a hash of everything that went
+into it: the Rust (and Cargo files), the version of the compiler and the
+flags. Building unchanged code again copies the cached binary instead of
+running the compiler.
+
+Binaries are published in the cache by renaming a complete copy into
+place, so that builds running at the same time never see half written
+binaries. When the cache grows larger than its maximum size, the binaries
+used least recently are removed.
+"""
+from collections import namedtuple
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from bastors.cargo import binary_path
+
+# Default maximum size of a binary cache, in bytes
+CACHE_SIZE = 512 << 20
+
+# Flags rustc is run with
+RUSTC_FLAGS = ["-O"]
+
+# Flags cargo build is run with
+CARGO_FLAGS = ["--release", "--offline", "--locked", "--quiet"]
+
+# The binary built, whether it came from the cache and the seconds spent
+BuildResult = namedtuple("BuildResult", ["binary", "cached", "time"])
+
+
+class BuildError(Exception):
+    """ Raised when the compiler fails, with its diagnostics """
+
+
+def default_cache_dir():
+    """ Return the directory binaries are cached in by default """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "bastors", "binaries")
+
+
+TOOL_OUTPUTS = dict()
+
+
+def tool_output(*command):
+    """ Return the output of a command describing the tools, run once """
+    if command not in TOOL_OUTPUTS:
+        TOOL_OUTPUTS[command] = subprocess.check_output(command).decode("utf-8")
+    return TOOL_OUTPUTS[command]
+
+
+def tool_version(tool):
+    """ Return the verbose version of rustc or cargo, which tells the
+        release, commit and host it builds for """
+    return tool_output(tool, "-vV")
+
+
+def native_features():
+    """ Return the target features of the CPU of this machine, which code
+        built with -C target-cpu=native uses """
+    return tool_output("rustc", "-C", "target-cpu=native", "--print", "cfg")
+
+
+def publish(source, destination):
+    """ Copy the file source to destination, which appears at once, and
+        is never seen partly written """
+    directory = os.path.dirname(os.path.abspath(destination))
+    fd, temp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    os.close(fd)
+    try:
+        shutil.copy(source, temp)
+        os.replace(temp, destination)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+class BinaryCache:
+    """
+    A directory of binaries, named by the hash of what they were built
+    from, holding at most max_size bytes.
+    """
+
+    def __init__(self, directory=None, max_size=CACHE_SIZE):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        """ Return the key of a binary built from parts, strings """
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key):
+        """ Return the path of the binary cached for key, or None """
+        path = os.path.join(self.directory, key)
+        try:
+            os.utime(path)  # marks it as used recently
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, binary):
+        """ Add a copy of the file binary for key, and return its path """
+        path = os.path.join(self.directory, key)
+        publish(binary, path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """ Remove the binaries used least recently, but not keep, until
+            the cache is no larger than its maximum size """
+        entries = list()
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith("."):
+                continue  # being published
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # removed by another build
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+
+def run_compiler(command, cwd=None):
+    """ Run a compiler, raising BuildError with its output if it fails """
+    process = subprocess.run(command, cwd=cwd, stderr=subprocess.PIPE, check=False)
+    if process.returncode != 0:
+        raise BuildError(process.stderr.decode("utf-8", "replace"))
+
+
+def copy_cached(cache, key, output):
+    """ Copy the binary cached for key to output, return False if none """
+    path = cache.get(key) if cache is not None else None
+    if path is None:
+        return False
+    try:
+        publish(path, output)
+    except FileNotFoundError:
+        return False  # evicted meanwhile
+    return True
+
+
+def build_rustc(rust, output, cache=None, flags=None):
+    """
+    Compile the Rust code rust, a str, with rustc and the flags, RUSTC_FLAGS
+    by default, to the binary output. The binary is taken from and added to
+    cache, a BinaryCache, if given. Return a BuildResult.
+    """
+    start = time.perf_counter()
+    flags = list(RUSTC_FLAGS if flags is None else flags)
+    key = None
+    if cache is not None:
+        parts = [rust, tool_version("rustc"), " ".join(flags)]
+        if "target-cpu=native" in flags:
+            parts.append(native_features())
+        key = cache.key(*parts)
+        if copy_cached(cache, key, output):
+            return BuildResult(output, True, time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "main.rs")
+        with open(source, "w") as file:
+            file.write(rust)
+        binary = os.path.join(directory, "main")
+        run_compiler(["rustc"] + flags + ["-o", binary, source])
+        if cache is not None:
+            cache.put(key, binary)
+        publish(binary, output)
+    return BuildResult(output, False, time.perf_counter() - start)
+
+
+def build_cargo(directory, name, cache=None):
+    """
+    Build the Cargo project in directory, written by bastors.cargo for the
+    package name, with cargo build --release. The binary is taken from and
+    added to cache, a BinaryCache, if given. Return a BuildResult.
+    """
+    start = time.perf_counter()
+    output = binary_path(directory, name)
+    key = None
+    if cache is not None:
+        parts = [tool_version("cargo"), tool_version("rustc"), " ".join(CARGO_FLAGS)]
+        sources = sorted(
+            os.path.join("src", file_name)
+            for file_name in os.listdir(os.path.join(directory, "src"))
+            if file_name.endswith(".rs")
+        )
+        for path in ["Cargo.toml", "Cargo.lock", ".cargo/config.toml"] + sources:
+            try:
+                with open(os.path.join(directory, path)) as file:
+                    text = file.read()
+            except FileNotFoundError:
+                text = ""
+            parts.extend([path, text])
+            if path == ".cargo/config.toml" and "target-cpu=native" in text:
+                parts.append(native_features())
+        key = cache.key(*parts)
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        if copy_cached(cache, key, output):
+            return BuildResult(output, True, time.perf_counter() - start)
+
+    run_compiler(["cargo", "build"] + CARGO_FLAGS, cwd=directory)
+    if cache is not None:
+        cache.put(key, output)
+    return BuildResult(output, False, time.perf_counter() - start)
+
+
+def report(result, file=sys.stderr):
+    """ Write a line telling how the binary of a BuildResult was built """
+    how = "cached" if result.cached else "compiled"
+    print("%s: %s in %.3fs" % (result.binary, how, result.time), file=file)
@@ -0,0 +1,118 @@
+"""
+This module bundles many TinyBasic programs into one Rust program, built
+into a single multi-call binary, so that one run of rustc, and one link
+against std, covers them all.
+
+Every program becomes a module of its own, with its own State, input
+function and GOSUB functions, see the module option of Rustify. The main
+function of the bundle runs the program named by the file name the binary
+was invoked as, through a symbolic link named after the program, or else
+by the first argument:
+
+    $ ./bundle fibonacci
+    $ ln -s bundle fibonacci && ./fibonacci
+"""
+import io
+import os
+import re
+from bastors.cargo import RESERVED_NAMES
+from bastors.pipeline import OUTPUT_BUFFER_SIZE, transpiler
+
+DISPATCH = """\
+const PROGRAMS: [(&str, fn()); %(count)d] = [
+%(programs)s];
+
+fn main() {
+    let mut args = std::env::args();
+    let invoked = args.next().unwrap_or_default();
+    let invoked = std::path::Path::new(&invoked)
+        .file_name()
+        .and_then(|name| name.to_str())
+        .unwrap_or("")
+        .to_string();
+    let name = if PROGRAMS.iter().any(|&(program, _)| program == invoked) {
+        invoked.clone()
+    } else {
+        args.next().unwrap_or_default()
+    };
+    match PROGRAMS.iter().find(|&&(program, _)| program == name) {
+        Some(&(_, run)) => run(),
+        None => {
+            eprintln!("usage: {} PROGRAM, where PROGRAM is one of:", invoked);
+            for (program, _) in PROGRAMS.iter() {
+                eprintln!("    {}", program);
+            }
+            std::process::exit(2);
+        }
+    }
+}
+"""
+
+
+class BundleError(Exception):
+    """ Raised when programs cannot be bundled together """
+
+
+def program_name(path):
+    """ Return the name a program is run by in a bundle, the name of its
+        file without the extension """
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def module_names(names):
+    """ Return distinct Rust module names for the programs names """
+    modules = list()
+    for name in names:
+        module = re.sub(r"[^A-Za-z0-9_]", "_", name).lower()
+        if not module or not module[0].isalpha() or module in RESERVED_NAMES:
+            module = "bas_" + module
+        candidate, suffix = module, 1
+        while candidate in modules or candidate == "main":
+            suffix += 1
+            candidate = "%s_%d" % (module, suffix)
+        modules.append(candidate)
+    return modules
+
+
+def dispatcher(names, modules):
+    """ Return the Rust code of the main function of a bundle, running the
+        main function of the module of the program invoked by name """
+    programs = "".join(
+        '    ("%s", %s::main),\n' % (name, module) for name, module in zip(names, modules)
+    )
+    return DISPATCH % {"count": len(names), "programs": programs}
+
+
+def bundle(sources, out=None, rust_options=None, **options):
+    """
+    Transpile the programs sources, pairs of the name a program is run by
+    and its TinyBasic source, into one Rust program. The code is written
+    to out, a file or the path of one, if given, otherwise it is returned
+    as a str. The rust_options and further options are passed on to
+    transpiler() for every program, an instrumented program writes its
+    counts to a file named after it.
+    """
+    if isinstance(out, str):
+        with open(out, "w", buffering=OUTPUT_BUFFER_SIZE) as file:
+            return bundle(sources, file, rust_options, **options)
+
+    names = [name for name, _ in sources]
+    for name in names:
+        if not name or '"' in name or "\\" in name:
+            raise BundleError("cannot run a program named %r" % name)
+    if len(set(names)) != len(names):
+        raise BundleError("programs of the same name cannot be bundled")
+
+    target = out if out is not None else io.StringIO()
+    modules = module_names(names)
+    for (name, source), module in zip(sources, modules):
+        module_options = dict(rust_options or dict())
+        module_options["module"] = module
+        if module_options.get("instrument") is not None:
+            module_options["instrument"] = "%s.counts" % name
+        passes = transpiler(out=target, rust_options=module_options, **options)
+        passes.run(source)
+    target.write(dispatcher(names, modules))
+    if out is None:
+        return target.getvalue()
+    return None
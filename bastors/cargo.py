@@ -0,0 +1,100 @@
+"""
+This module writes the files of a Cargo project around a transpiled
+program, so that it is built with a release profile tuned for programs
+like these: all optimizations, link time optimization across the whole
+program, a single codegen unit and aborting on panic, which also leaves
+the unwinding code out of the binary. The project has no dependencies and
+a complete Cargo.lock, so it builds offline:
+
+    cargo build --release --offline
+
+Optionally the code is also generated for the CPU it is built on, with
+-C target-cpu=native in .cargo/config.toml. The binary is then not
+portable to older CPUs of the same architecture.
+"""
+import os
+import re
+
+# Names cargo refuses as package names
+RESERVED_NAMES = set(
+    """
+    as async await break const continue crate dyn else enum extern false fn
+    for if impl in let loop match mod move mut pub ref return self static
+    struct super trait true type unsafe use where while abstract become box
+    do final macro override priv typeof unsized virtual yield try
+    core std alloc proc_macro proc-macro test build deps examples incremental
+    """.split()
+)
+
+CARGO_TOML = """[package]
+name = "{name}"
+version = "0.1.0"
+edition = "2021"
+publish = false
+
+[dependencies]
+
+[profile.release]
+opt-level = 3
+lto = "fat"
+codegen-units = 1
+panic = "abort"
+debug = false
+incremental = false
+"""
+
+CARGO_LOCK = """# This file is automatically @generated by Cargo.
+# It is not intended for manual editing.
+version = 3
+
+[[package]]
+name = "{name}"
+version = "0.1.0"
+"""
+
+NATIVE_CONFIG = """[build]
+rustflags = ["-C", "target-cpu=native"]
+"""
+
+
+def package_name(path):
+    """ Return a name cargo accepts for the package of the program in the
+        file at path, made from the name of the file """
+    name = os.path.splitext(os.path.basename(path))[0]
+    name = re.sub(r"[^A-Za-z0-9_-]", "_", name).lower()
+    if not name or not name[0].isalpha() or name in RESERVED_NAMES:
+        name = "bas_" + name
+    return name
+
+
+def write_file(path, text):
+    """ Write text to the file at path, replacing what is there """
+    with open(path, "w") as out:
+        out.write(text)
+
+
+def create_project(directory, name, native=False):
+    """
+    Create the Cargo project directory, or update the one there, for a
+    package named name, see package_name(). With native the code is
+    generated for the CPU of the machine building it. Return the path of
+    the source file, src/main.rs, the program should be written to.
+    """
+    os.makedirs(os.path.join(directory, "src"), exist_ok=True)
+    write_file(os.path.join(directory, "Cargo.toml"), CARGO_TOML.format(name=name))
+    write_file(os.path.join(directory, "Cargo.lock"), CARGO_LOCK.format(name=name))
+    write_file(os.path.join(directory, ".gitignore"), "/target\n")
+
+    config = os.path.join(directory, ".cargo", "config.toml")
+    if native:
+        os.makedirs(os.path.dirname(config), exist_ok=True)
+        write_file(config, NATIVE_CONFIG)
+    elif os.path.exists(config):
+        os.remove(config)
+    return os.path.join(directory, "src", "main.rs")
+
+
+def binary_path(directory, name):
+    """ Return the path of the binary cargo build --release builds in the
+        project directory, unless the target directory is moved """
+    return os.path.join(directory, "target", "release", name)
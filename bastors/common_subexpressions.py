@@ -0,0 +1,260 @@
+"""
+This module provides local common subexpression elimination, run on a
+program after constant folding.
+
+Within a block, an arithmetic expression computed more than once with the
+same values of the variables it reads, as the 42*S+127 of
+
+    LET S=(42*S+127)-((42*S+127)/126*126)
+
+is computed once into a temporary variable, which the repeated expressions
+are replaced by. A LET or INPUT assigning a variable the expression reads,
+or a GOSUB or a nested block that may assign it, starts a new value of the
+expression. The temporary is assigned right before the first statement
+that surely evaluates the expression, so that it can not divide by zero
+where the original program did not: a condition after the first one of an
+IF is only evaluated depending on the ones before it. The blocks nested in
+If, Loop, For and Block statements are handled as blocks of their own.
+"""
+import json
+import sys
+import bastors.parse as parse
+from bastors.analysis import expression_variables, function_effects, statement_usage
+from bastors.visitor import Transformer
+
+# Times the choice of expressions to replace is revised, see __eliminate()
+MAX_ROUNDS = 8
+
+
+class CommonSubexpressionStats:
+    """
+    Reports what the common subexpression elimination did, with --stats:
+        temporaries: temporaries introduced for repeated expressions
+        replaced: expressions replaced by a temporary
+    """
+
+    def __init__(self):
+        self.temporaries = 0
+        self.replaced = 0
+
+    def as_dict(self):
+        """ Return the statistics as a structure suitable for JSON """
+        return dict(vars(self))
+
+    def dump(self, file=sys.stdout):
+        """ Write the statistics as JSON to file """
+        json.dump(self.as_dict(), file, indent=2)
+        print(file=file)
+
+
+def strip_parens(exp):
+    """ Return the expression inside any parentheses around it """
+    while isinstance(exp, parse.ParenExpression):
+        exp = exp.exp
+    return exp
+
+
+class Values:
+    """ Numbers the values variables are assigned in a block, so that two
+        evaluations of an expression can be told to give the same value """
+
+    def __init__(self):
+        self._versions = dict()
+        self._assignments = 0
+        self._unknown = 0  # bumped when anything may have been assigned
+
+    def key(self, exp):
+        """ Return a key equal for evaluations of exp giving equal values """
+        variables = sorted(expression_variables(exp))
+        versions = tuple(self._versions.get(var, 0) for var in variables)
+        return repr(exp), tuple(variables), versions, self._unknown
+
+    def assign(self, variables):
+        """ Note that the variables were assigned new values """
+        for var in variables:
+            self._assignments += 1
+            self._versions[var] = self._assignments
+
+    def assign_all(self):
+        """ Note that any variable may have been assigned a new value """
+        self._unknown += 1
+
+
+# pylint: disable=C0103,C0116
+class Walk:
+    """
+    One walk over a block, rewriting the expressions in chosen, keys of
+    Values, to temporaries from the first statement in first that surely
+    evaluates them. Records the statements every expression is found in,
+    and the first statement surely evaluating it.
+    """
+
+    def __init__(self, effects, chosen, first, new_name):
+        self._effects = effects
+        self._chosen = chosen
+        self._first = first
+        self._new_name = new_name
+        self._values = Values()
+        self._defined = dict()
+        self._inserts = list()
+        self._index = 0
+        self.found = dict()  # key: the statements the expression is in
+        self.sure = dict()  # key: the first statement surely evaluating it
+        self.replaced = 0
+
+    def __candidate(self, exp):
+        return (
+            isinstance(exp, parse.ArithmeticExpression)
+            and exp.left is not None
+            and expression_variables(exp)
+        )
+
+    def expression(self, exp, sure):
+        """ Return the expression rewritten, surely evaluated if sure """
+        inner = strip_parens(exp)
+        if self.__candidate(inner):
+            key = self._values.key(inner)
+            self.found.setdefault(key, list()).append(self._index)
+            if sure:
+                self.sure.setdefault(key, self._index)
+            if key in self._chosen and self._index >= self._first[key]:
+                if key not in self._defined:
+                    definition = inner._replace(
+                        left=self.expression(inner.left, sure),
+                        right=self.expression(inner.right, sure),
+                    )
+                    name = self._new_name()
+                    self._inserts.append(
+                        parse.Let(None, parse.VariableExpression(name), definition)
+                    )
+                    self._defined[key] = name
+                self.replaced += 1
+                return parse.VariableExpression(self._defined[key])
+
+        if isinstance(exp, parse.ArithmeticExpression):
+            return exp._replace(
+                left=self.expression(exp.left, sure),
+                right=self.expression(exp.right, sure),
+            )
+        if isinstance(exp, (parse.ParenExpression, parse.NotExpression)):
+            return exp._replace(exp=self.expression(exp.exp, sure))
+        if isinstance(exp, parse.BooleanExpression):
+            return exp._replace(conditions=self.conditions(exp.conditions, sure))
+        return exp
+
+    def conditions(self, conditions, sure):
+        """ Return the conditions rewritten. Only the first one is surely
+            evaluated, the others depend on the ones before them. """
+        result = list()
+        for cond in conditions:
+            if isinstance(cond, parse.Condition):
+                cond = cond._replace(
+                    left=self.expression(cond.left, sure),
+                    right=self.expression(cond.right, sure),
+                )
+            result.append(cond)
+            sure = False
+        return result
+
+    def __statement(self, statement):
+        if isinstance(statement, parse.Let):
+            return statement._replace(rval=self.expression(statement.rval, True))
+        if isinstance(statement, parse.Print):
+            return statement._replace(
+                exp_list=[self.expression(exp, True) for exp in statement.exp_list]
+            )
+        if isinstance(statement, parse.If):
+            return statement._replace(
+                conditions=self.conditions(statement.conditions, True)
+            )
+        if isinstance(statement, parse.For):
+            return statement._replace(
+                start=self.expression(statement.start, True),
+                stop=self.expression(statement.stop, True),
+                step=self.expression(statement.step, True),
+            )
+        return statement
+
+    def __assignments(self, statement):
+        usage = statement_usage([statement])
+        self._values.assign(usage.writes)
+        for call in usage.calls:
+            effect = self._effects.get(call)
+            if effect is None:
+                self._values.assign_all()
+            else:
+                self._values.assign(effect.writes)
+
+    def block(self, statements):
+        """ Return the block rewritten """
+        result = list()
+        for index, statement in enumerate(statements):
+            self._index = index
+            self._inserts = list()
+            statement = self.__statement(statement)
+            result.extend(self._inserts)
+            result.append(statement)
+            self.__assignments(statement)
+        return result
+
+
+class CommonSubexpressions(Transformer):
+    """
+    This class rewrites the blocks of a program with repeated expressions
+    replaced by temporaries, see the module documentation.
+    """
+
+    def __init__(self, program, stats):
+        super().__init__()
+        self._effects = function_effects(program)
+        self._stats = stats
+        self._temps = 0
+
+    def __temp_name(self):
+        name = "c%d" % self._temps
+        self._temps += 1
+        return name
+
+    def visit_block(self, statements):
+        block = list()
+        for statement in statements:
+            block.extend((yield statement))
+        return self.__eliminate(block)
+
+    def __eliminate(self, block):
+        """
+        Return the block with its repeated expressions replaced. Once an
+        expression is replaced, the expressions inside it are only found in
+        the definition of the temporary. They are repeated no more unless
+        they are also found elsewhere, so the walk is redone until the
+        expressions chosen stay the same.
+        """
+        walk = Walk(self._effects, set(), dict(), None)
+        walk.block(block)
+        first = walk.sure
+        chosen = set()
+        temps = self._temps
+        result = block
+        for _ in range(MAX_ROUNDS):
+            repeated = set()
+            for key, indexes in walk.found.items():
+                if key in first and sum(1 for i in indexes if i >= first[key]) > 1:
+                    repeated.add(key)
+            if repeated == chosen:
+                break
+            chosen = repeated
+            self._temps = temps
+            walk = Walk(self._effects, chosen, first, self.__temp_name)
+            result = walk.block(block)
+        self._stats.temporaries += self._temps - temps
+        self._stats.replaced += walk.replaced
+        return result
+
+
+def eliminate_common_subexpressions(program, stats=None):
+    """ Return the program with expressions repeated within a block
+        computed once. What was done is counted in stats, a
+        CommonSubexpressionStats, if given. """
+    if stats is None:
+        stats = CommonSubexpressionStats()
+    return CommonSubexpressions(program, stats).visit(program)
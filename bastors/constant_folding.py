@@ -0,0 +1,461 @@
+"""
+This module provides constant folding and constant propagation, run on a
+program after GOTO elimination.
+
+Expressions with constant operands are evaluated, with the semantics of
+the i32 arithmetic of the generated Rust: division truncates toward zero,
+and expressions that would overflow or divide by zero are left alone.
+Variables are replaced by their values where these are known, starting
+from zero in main, except a zero divisor. Branches that are always taken are inlined, the ones
+that are never taken removed.
+"""
+import json
+import sys
+import bastors.parse as parse
+from bastors.analysis import function_effects, statement_usage
+from bastors.goto_elimination import Break, Loop
+from bastors.inlining import Block, BlockBreak, breaks_out
+from bastors.visitor import Transformer
+
+I32_MIN = -(1 << 31)
+I32_MAX = (1 << 31) - 1
+
+TRUE = parse.TrueFalseCondition("true", parse.ConditionEnum.INITIAL)
+FALSE = parse.TrueFalseCondition("false", parse.ConditionEnum.INITIAL)
+
+# Statements after which the rest of a block is never run
+TERMINATORS = (Break, BlockBreak, parse.Return, parse.End)
+
+RELATIONS = {
+    "=": lambda left, right: left == right,
+    "<>": lambda left, right: left != right,
+    "<": lambda left, right: left < right,
+    ">": lambda left, right: left > right,
+    "<=": lambda left, right: left <= right,
+    ">=": lambda left, right: left >= right,
+}
+
+
+class FoldingStats:
+    """
+    Counts what the constant folding did, reported with --stats:
+        expressions: arithmetic expressions replaced by their value
+        propagated: variable reads replaced by a known value
+        conditions: conditions replaced by true or false
+        branches: If statements removed or replaced by their body
+        loops: loops whose condition became constant
+    """
+
+    def __init__(self):
+        self.expressions = 0
+        self.propagated = 0
+        self.conditions = 0
+        self.branches = 0
+        self.loops = 0
+
+    def as_dict(self):
+        """ Return the statistics as a structure suitable for JSON """
+        return dict(vars(self))
+
+    def dump(self, file=sys.stdout):
+        """ Write the statistics as JSON to file """
+        json.dump(self.as_dict(), file, indent=2)
+        print(file=file)
+
+
+def literal(value):
+    """ Return the expression for an integer value """
+    if value < 0:
+        return parse.ArithmeticExpression(None, "-", str(-value))
+    return str(value)
+
+
+def constant_value(exp):
+    """ Return the integer value of a literal expression, or None """
+    if isinstance(exp, int) and not isinstance(exp, bool):
+        return exp
+    if isinstance(exp, str) and exp.isdigit():
+        return int(exp)
+    if (
+        isinstance(exp, parse.ArithmeticExpression)
+        and exp.left is None
+        and isinstance(exp.right, str)
+        and exp.right.isdigit()
+    ):
+        return -int(exp.right) if exp.operator == "-" else int(exp.right)
+    return None
+
+
+def arithmetic(operator, left, right):
+    """ Return left operator right as evaluated by i32 arithmetic, or None
+        if that overflows or divides by zero. """
+    if operator == "+":
+        value = left + right
+    elif operator == "-":
+        value = left - right
+    elif operator == "*":
+        value = left * right
+    elif operator == "/":
+        if right == 0:
+            return None
+        value = abs(left) // abs(right)
+        if (left < 0) != (right < 0):
+            value = -value
+    else:
+        return None
+
+    if not I32_MIN <= value <= I32_MAX:
+        return None
+    return value
+
+
+def condition_value(cond):
+    """ Return True or False for a constant condition, otherwise None """
+    if isinstance(cond, parse.TrueFalseCondition):
+        return cond.value == "true"
+    return None
+
+
+def has_break(statements):
+    """ Return True if the block breaks out of the loop it is the body of """
+    stack = [statements]
+    while stack:
+        for statement in stack.pop():
+            if isinstance(statement, Break):
+                return True
+            if isinstance(statement, (parse.If, Block)):
+                stack.append(statement.statements)
+    return False
+
+
+def terminates(statements):
+    """ Return True if the block never falls through to what follows it """
+    if not statements:
+        return False
+    last = statements[-1]
+    if isinstance(last, Loop):
+        # A loop without conditions is only left by a Break
+        return last.conditions is None and not has_break(last.statements)
+    return isinstance(last, TERMINATORS)
+
+
+def merge(env, other):
+    """ Return the values known in both env and other """
+    return {
+        var: value
+        for var, value in env.items()
+        if var in other
+        and type(other[var]) is type(value)  # pylint: disable=C0123
+        and other[var] == value
+    }
+
+
+# pylint: disable=C0103,C0116
+class ConstantFolder(Transformer):
+    """
+    This class rewrites a program with its constant expressions folded. The
+    values known at the statement being visited are kept in self._env,
+    integers for numeric variables and booleans for the flags introduced
+    by GOTO elimination.
+    """
+
+    def __init__(self, program, stats=None):
+        super().__init__()
+        self._stats = stats if stats is not None else FoldingStats()
+        self._effects = function_effects(program)
+        self._booleans = set()
+        written = set()
+        for effect in self._effects.values():
+            written.update(effect.writes)
+        self._unwritten = set()
+        for effect in self._effects.values():
+            self._unwritten.update(effect.reads - written)
+        self._env = dict()
+        self._collect_booleans(program)
+
+    def _collect_booleans(self, program):
+        stack = list(program.statements.values())
+        while stack:
+            for statement in stack.pop():
+                if isinstance(statement, parse.Let):
+                    if isinstance(statement.rval, parse.BooleanExpression):
+                        self._booleans.add(statement.lval.var)
+                elif hasattr(statement, "statements"):
+                    stack.append(statement.statements)
+
+    def __value(self, var):
+        if var in self._env:
+            return self._env[var]
+        if var in self._unwritten:
+            return 0
+        return None
+
+    def __kill(self, variables):
+        if variables is None:
+            self._env.clear()
+            return
+        for var in variables:
+            self._env.pop(var, None)
+
+    def __writes(self, statements):
+        """ Return the variables a block may write, following calls, or
+            None if that is not known """
+        usage = statement_usage(statements)
+        writes = set(usage.writes)
+        for call in usage.calls:
+            effect = self._effects.get(call)
+            if effect is None:
+                return None
+            writes.update(effect.writes)
+        return writes
+
+    def __fold(self, exp):
+        if isinstance(exp, parse.VariableExpression):
+            value = self.__value(exp.var)
+            if isinstance(value, bool) or value is None:
+                return exp
+            self._stats.propagated += 1
+            return literal(value)
+
+        if isinstance(exp, parse.ArithmeticExpression):
+            return self.__fold_arithmetic(exp)
+
+        if isinstance(exp, parse.ParenExpression):
+            inner = self.__fold(exp.exp)
+            if isinstance(inner, (str, parse.VariableExpression)):
+                return inner
+            if constant_value(inner) is not None:
+                return inner
+            return exp._replace(exp=inner)
+
+        if isinstance(exp, parse.BooleanExpression):
+            conditions, _ = self.__fold_conditions(exp.conditions)
+            return exp._replace(conditions=conditions)
+
+        return exp
+
+    def __fold_arithmetic(self, exp):
+        counts = (self._stats.expressions, self._stats.propagated)
+        right = self.__fold(exp.right)
+        right_value = constant_value(right)
+        if exp.operator == "/" and right_value == 0:
+            # rustc rejects dividing by a constant zero even in a branch
+            # that is never run, keep the divisor the program wrote
+            self._stats.expressions, self._stats.propagated = counts
+            right = exp.right
+            right_value = constant_value(right)
+        if exp.left is None:
+            if right_value is not None and exp.operator in ("-", "+"):
+                value = -right_value if exp.operator == "-" else right_value
+                if I32_MIN <= value <= I32_MAX:
+                    if constant_value(exp) is None:
+                        self._stats.expressions += 1
+                    return literal(value)
+            return exp._replace(right=right)
+
+        left = self.__fold(exp.left)
+        left_value = constant_value(left)
+        if left_value is not None and right_value is not None:
+            value = arithmetic(exp.operator, left_value, right_value)
+            if value is None:
+                # rustc rejects constant expressions that overflow or
+                # divide by zero, keep what the program said
+                self._stats.expressions, self._stats.propagated = counts
+                return exp
+            self._stats.expressions += 1
+            return literal(value)
+
+        # Identities, expressions have no side effects to keep
+        if right_value == 0 and exp.operator in ("+", "-"):
+            return left
+        if left_value == 0 and exp.operator == "+":
+            return right
+        if right_value == 1 and exp.operator in ("*", "/"):
+            return left
+        if left_value == 1 and exp.operator == "*":
+            return right
+        if 0 in (left_value, right_value) and exp.operator == "*":
+            return "0"
+        return exp._replace(left=left, right=right)
+
+    def __fold_condition(self, cond):
+        if isinstance(cond, (parse.VariableCondition, parse.NotVariableCondition)):
+            value = self.__value(cond.var)
+            if not isinstance(value, bool):
+                return cond
+            if isinstance(cond, parse.NotVariableCondition):
+                value = not value
+        elif isinstance(cond, parse.Condition):
+            left = self.__fold(cond.left)
+            right = self.__fold(cond.right)
+            left_value = constant_value(left)
+            right_value = constant_value(right)
+            if left_value is None or right_value is None:
+                return cond._replace(left=left, right=right)
+            value = RELATIONS[cond.operator](left_value, right_value)
+        else:
+            return cond
+
+        self._stats.conditions += 1
+        return parse.TrueFalseCondition("true" if value else "false", cond.type)
+
+    def __fold_conditions(self, conditions):
+        """
+        Return the folded conditions and their value, or None if that is not
+        known. The conditions are a list of AND-ed groups that are OR-ed
+        together, as && binds harder than || in the generated Rust.
+        """
+        groups = list()
+        for cond in conditions:
+            if cond.type != parse.ConditionEnum.AND or not groups:
+                groups.append(list())
+            groups[-1].append(self.__fold_condition(cond))
+
+        kept = list()
+        for group in groups:
+            values = [condition_value(cond) for cond in group]
+            if False in values:
+                continue
+            unknown = [cond for cond in group if condition_value(cond) is None]
+            if not unknown:
+                return [TRUE], True
+            kept.append(unknown)
+
+        if not kept:
+            return [FALSE], False
+
+        folded = list()
+        for group in kept:
+            for index, cond in enumerate(group):
+                if index > 0:
+                    cond_type = parse.ConditionEnum.AND
+                elif folded:
+                    cond_type = parse.ConditionEnum.OR
+                else:
+                    cond_type = parse.ConditionEnum.INITIAL
+                folded.append(cond._replace(type=cond_type))
+        return folded, None
+
+    def visit_Program(self, node):
+        statements = dict()
+        for context, block in node.statements.items():
+            self._context = context
+            self._env = dict()
+            if context == "main":
+                # The variables of the State struct start out zeroed
+                for effect in self._effects.values():
+                    for var in effect.writes:
+                        self._env[var] = False if var in self._booleans else 0
+            statements[context] = yield from self.visit_block(block)
+        return node._replace(statements=statements)
+
+    def visit_block(self, statements):
+        block = list()
+        for statement in statements:
+            block.extend((yield statement))
+            if terminates(block):
+                break  # the rest is never run
+        return block
+
+    def visit_Let(self, node):
+        rval = self.__fold(node.rval)
+        value = None
+        if isinstance(rval, parse.BooleanExpression):
+            if len(rval.conditions) == 1:
+                value = condition_value(rval.conditions[0])
+        else:
+            value = constant_value(rval)
+
+        if value is None:
+            self._env.pop(node.lval.var, None)
+        else:
+            self._env[node.lval.var] = value
+        return [node._replace(rval=rval)]
+
+    def visit_Print(self, node):
+        exp_list = [
+            exp if isinstance(exp, str) and exp.startswith('"') else self.__fold(exp)
+            for exp in node.exp_list
+        ]
+        return [node._replace(exp_list=exp_list)]
+
+    def visit_Input(self, node):
+        self.__kill(var.var for var in node.variables)
+        return [node]
+
+    def visit_Gosub(self, node):
+        effect = self._effects.get(str(node.target_label))
+        self.__kill(None if effect is None else effect.writes)
+        return [node]
+
+    def visit_If(self, node):
+        conditions, value = self.__fold_conditions(node.conditions)
+        if value is False:
+            self._stats.branches += 1
+            return []
+
+        if value is True:
+            self._stats.branches += 1
+            statements = yield from self.visit_block(node.statements)
+            return statements
+
+        before = dict(self._env)
+        statements = yield from self.visit_block(node.statements)
+        if terminates(statements):
+            self._env = before
+        else:
+            self._env = merge(before, self._env)
+        if not statements:
+            self._stats.branches += 1
+            return []
+        return [node._replace(conditions=conditions, statements=statements)]
+
+    def visit_Loop(self, node):
+        self.__kill(self.__writes(node.statements))
+        before = dict(self._env)
+        statements = yield from self.visit_block(node.statements)
+
+        conditions = node.conditions
+        if conditions is not None:
+            conditions, value = self.__fold_conditions(conditions)
+            if value is True:
+                self._stats.loops += 1
+                conditions = None
+            elif value is False and not has_break(statements):
+                # The body is run exactly once
+                self._stats.loops += 1
+                return statements
+
+        self._env = before
+        return [node._replace(conditions=conditions, statements=statements)]
+
+    def visit_Block(self, node):
+        writes = self.__writes(node.statements)
+        before = dict(self._env)
+        statements = yield from self.visit_block(node.statements)
+        if not breaks_out(statements, node.name):
+            return statements
+
+        # Left early or not, what the block does not write is unchanged
+        self._env = before
+        self.__kill(writes)
+        return [node._replace(statements=statements)]
+
+    def visit_For(self, node):
+        start = self.__fold(node.start)
+        stop = self.__fold(node.stop)
+        step = self.__fold(node.step)
+        self.__kill(self.__writes([node]))
+        before = dict(self._env)
+        statements = yield from self.visit_block(node.statements)
+        self._env = before
+        return [
+            node._replace(start=start, stop=stop, step=step, statements=statements)
+        ]
+
+
+def fold_constants(program, stats=None):
+    """ Return the program with constant expressions folded, constants
+        propagated and branches on constant conditions resolved. What was
+        done is counted in stats, a FoldingStats, if given. """
+    return ConstantFolder(program, stats).visit(program)
@@ -0,0 +1,258 @@
+"""
+This module recognizes counted loops among the loops left by GOTO
+elimination and turns them into For statements, which are emitted as Rust
+range loops that rustc optimizes much better.
+
+BASIC writes a counted loop as
+
+    10 ...
+       LET I=I+1
+       IF I<=N THEN GOTO 10
+
+which GOTO elimination turns into a Loop whose body ends by stepping I by
+a constant and whose condition compares I with N. If the rest of the body
+does not assign I or anything N depends on, and does not leave the loop
+early, I is an induction variable and, for a positive step, the Loop is
+equivalent to
+
+    LET R=N
+    IF R<I THEN LET R=I         (the body runs at least once)
+    FOR I=I TO R STEP STEP
+        ...
+    NEXT I
+
+where the FOR loop variable is a Rust local, and the For leaves I with the
+value it has after the Loop. When the first value of I and N are constants
+the last value is computed here instead.
+"""
+import json
+import sys
+import bastors.parse as parse
+from bastors.analysis import expression_variables, function_effects, statement_usage
+from bastors.constant_folding import constant_value, literal
+from bastors.goto_elimination import Break, Loop
+from bastors.inlining import BlockBreak
+from bastors.visitor import Transformer
+
+# Statements that leave the loop before the induction variable is stepped
+EXITS = (Break, BlockBreak, parse.Return)
+
+
+class CountedLoopStats:
+    """
+    Reports what the counted loop recognition did, with --stats:
+        loops: Loops turned into For statements
+        constant: those of them with constant bounds
+    """
+
+    def __init__(self):
+        self.loops = 0
+        self.constant = 0
+
+    def as_dict(self):
+        """ Return the statistics as a structure suitable for JSON """
+        return dict(vars(self))
+
+    def dump(self, file=sys.stdout):
+        """ Write the statistics as JSON to file """
+        json.dump(self.as_dict(), file, indent=2)
+        print(file=file)
+
+
+def exits_early(statements):
+    """ Return True if the body of a loop can leave it other than through
+        its condition: by a Break that is not in a nested loop, by breaking
+        out of a Block or by returning """
+    stack = [(statements, False)]
+    while stack:
+        block, nested = stack.pop()
+        for statement in block:
+            if isinstance(statement, EXITS):
+                if not nested or not isinstance(statement, Break):
+                    return True
+            if hasattr(statement, "statements"):
+                inner = nested or isinstance(statement, (Loop, parse.For))
+                stack.append((statement.statements, inner))
+    return False
+
+
+def induction_step(statement, var):
+    """ Return the constant step if statement is LET var=var+step, LET
+        var=step+var or LET var=var-step, otherwise None """
+    if not isinstance(statement, parse.Let) or statement.lval.var != var:
+        return None
+    exp = statement.rval
+    if not isinstance(exp, parse.ArithmeticExpression) or exp.left is None:
+        return None
+
+    def is_var(side):
+        return isinstance(side, parse.VariableExpression) and side.var == var
+
+    if exp.operator == "+" and is_var(exp.left):
+        step = constant_value(exp.right)
+    elif exp.operator == "+" and is_var(exp.right):
+        step = constant_value(exp.left)
+    elif exp.operator == "-" and is_var(exp.left):
+        step = constant_value(exp.right)
+        step = None if step is None else -step
+    else:
+        return None
+    return step if step != 0 else None
+
+
+def induction_bound(conditions, var, step):
+    """
+    Return the inclusive bound of var for the loop conditions, and the
+    distance from the bound the relation allows, or None if the conditions
+    do not bound var in the direction it is stepped.
+    """
+    if conditions is None or len(conditions) != 1:
+        return None
+    cond = conditions[0]
+    if not isinstance(cond, parse.Condition):
+        return None
+
+    mirror = {"<": ">", ">": "<", "<=": ">=", ">=": "<="}
+    if isinstance(cond.left, parse.VariableExpression) and cond.left.var == var:
+        operator, bound = cond.operator, cond.right
+    elif isinstance(cond.right, parse.VariableExpression) and cond.right.var == var:
+        operator, bound = mirror.get(cond.operator), cond.left
+    else:
+        return None
+
+    if var in expression_variables(bound):
+        return None
+    if step > 0 and operator in ("<", "<="):
+        return bound, -1 if operator == "<" else 0
+    if step < 0 and operator in (">", ">="):
+        return bound, 1 if operator == ">" else 0
+    return None
+
+
+def last_value(start, stop, step):
+    """ Return the last value a loop counting from start toward the
+        inclusive stop runs its body with, at least start """
+    last = max(start, stop) if step > 0 else min(start, stop)
+    return start + (last - start) // step * step
+
+
+# pylint: disable=C0103,C0116
+class CountedLoops(Transformer):
+    """
+    This class rewrites the Loops of a program that count an induction
+    variable to For statements, see the module documentation.
+    """
+
+    def __init__(self, program, stats):
+        super().__init__()
+        self._effects = function_effects(program)
+        self._stats = stats
+        self._block = list()  # the statements before the one visited
+        self._temps = 0
+
+    def __temp_name(self):
+        name = "r%d" % self._temps
+        self._temps += 1
+        return name
+
+    def __usage(self, statements):
+        """ Return the variables a block may write and the variables the
+            routines it calls may read, or None if that is not known """
+        usage = statement_usage(statements)
+        writes = set(usage.writes)
+        reads = set()
+        for call in usage.calls:
+            effect = self._effects.get(call)
+            if effect is None:
+                return None
+            writes.update(effect.writes)
+            reads.update(effect.reads)
+        return writes, reads
+
+    def visit_block(self, statements):
+        block = list()
+        for statement in statements:
+            self._block = block
+            block.extend((yield statement))
+        return block
+
+    def visit_Loop(self, node):
+        before = self._block
+        statements = yield from self.visit_block(node.statements)
+        loop = node._replace(statements=statements)
+        if not statements or not isinstance(statements[-1], parse.Let):
+            return [loop]
+
+        var = statements[-1].lval.var
+        step = induction_step(statements[-1], var)
+        if step is None:
+            return [loop]
+        bounded = induction_bound(node.conditions, var, step)
+        if bounded is None:
+            return [loop]
+        bound, offset = bounded
+
+        # The loop variable is a Rust local, so neither the body nor the
+        # routines it calls may use the variable itself
+        body = statements[:-1]
+        usage = self.__usage(body)
+        if usage is None or exits_early(body):
+            return [loop]
+        writes, callee_reads = usage
+        if var in writes or var in callee_reads:
+            return [loop]
+        if writes & expression_variables(bound):
+            return [loop]
+
+        self._stats.loops += 1
+        start = None
+        if before and isinstance(before[-1], parse.Let) and before[-1].lval.var == var:
+            start = constant_value(before[-1].rval)
+        stop = constant_value(bound)
+        if start is not None and stop is not None:
+            self._stats.constant += 1
+            return self.__constant_loop(node, var, start, stop + offset, step, body)
+        return self.__loop(node, var, bound, offset, step, body)
+
+    def __constant_loop(self, node, var, start, stop, step, body):
+        variable = parse.VariableExpression(var)
+        last = last_value(start, stop, step)
+        return [
+            parse.For(
+                variable, literal(start), literal(last), literal(step), body, node.label
+            )
+        ]
+
+    def __loop(self, node, var, bound, offset, step, body):
+        variable = parse.VariableExpression(var)
+        last = parse.VariableExpression(self.__temp_name())
+        if offset:
+            if not isinstance(bound, (str, parse.VariableExpression)):
+                bound = parse.ParenExpression(bound)
+            bound = parse.ArithmeticExpression(bound, "+" if offset > 0 else "-", "1")
+
+        # The body runs at least once, with the first value
+        statements = [
+            parse.Let(None, last, bound),
+            parse.If(
+                None,
+                [
+                    parse.Condition(
+                        last, "<" if step > 0 else ">", variable, parse.ConditionEnum.INITIAL
+                    )
+                ],
+                [parse.Let(None, last, variable)],
+            ),
+        ]
+        statements.append(
+            parse.For(variable, variable, last, literal(step), body, node.label)
+        )
+        return statements
+
+
+def recognize_counted_loops(program, stats=None):
+    """ Return the program with counted loops turned into For statements.
+        What was done is counted in stats, a CountedLoopStats, if given. """
+    if stats is None:
+        stats = CountedLoopStats()
+    return CountedLoops(program, stats).visit(program)
@@ -0,0 +1,245 @@
+"""
+This module provides dead store elimination, run on a program after GOTO
+elimination and constant folding.
+
+A liveness analysis walks every block backwards, keeping the set of
+variables whose value may still be read. A LET assigning a variable that
+is not live is removed, and variables that are only ever assigned thereby
+disappear from the State struct of the generated Rust. The flags of the
+GOTO elimination that nothing tests are removed the same way. A FOR loop
+whose variable is not live after it gets value_used False, and the value
+the loop leaves in the variable is not assigned. INPUT still reads a
+number for a variable that is not live, but its values_used tell not to
+assign it.
+
+Variables are global, so at a RETURN everything read anywhere in the
+program is live, and a GOSUB reads what the routine, or the routines it
+calls, may read. A first walk over the program finds the variables live
+at the end of every loop body, iterating each loop until they are stable.
+Every loop starts from the live set it had when last visited, so a loop
+nested in others only takes another round when something around it
+changed. A second walk then rewrites every block once.
+"""
+import json
+import sys
+import bastors.parse as parse
+from bastors.analysis import (
+    condition_variables,
+    context_usage,
+    expression_variables,
+    function_effects,
+)
+from bastors.visitor import Transformer
+
+
+class DeadStoreStats:
+    """
+    Reports what the dead store elimination removed, with --stats:
+        stores: LET statements removed
+        branches: IF statements left without a body and removed
+        variables: variables no longer assigned anywhere
+    """
+
+    def __init__(self):
+        self.stores = 0
+        self.branches = 0
+        self.variables = list()
+
+    def as_dict(self):
+        """ Return the statistics as a structure suitable for JSON """
+        return dict(vars(self))
+
+    def dump(self, file=sys.stdout):
+        """ Write the statistics as JSON to file """
+        json.dump(self.as_dict(), file, indent=2)
+        print(file=file)
+
+
+def count_statements(program, node_type):
+    """ Return the number of statements of node_type in the program """
+    count = 0
+    stack = list(program.statements.values())
+    while stack:
+        for statement in stack.pop():
+            if isinstance(statement, node_type):
+                count += 1
+            if hasattr(statement, "statements"):
+                stack.append(statement.statements)
+    return count
+
+
+def assigned_variables(program):
+    """ Return the set of variables assigned anywhere in the program """
+    variables = set()
+    for usage in context_usage(program).values():
+        variables.update(usage.writes)
+    return variables
+
+
+# pylint: disable=C0103,C0116
+class DeadStoreEliminator(Transformer):
+    """
+    This class rewrites a program without the assignments that are never
+    read. Blocks are visited backwards; self._live holds the variables live
+    after the statement being visited and is updated to the ones live
+    before it. The program is visited twice, see the module documentation;
+    the live sets of the loop bodies are kept by the path of the loop.
+    """
+
+    def __init__(self, program):
+        super().__init__()
+        self._effects = function_effects(program)
+        # What a caller may read after a GOSUB returns
+        self._observed = set()
+        for usage in self._effects.values():
+            self._observed.update(usage.reads)
+        self._live = set()
+        self._exits = list()  # live sets after the enclosing loops
+        self._block_exits = dict()  # live sets after the enclosing blocks
+        self._loops = dict()  # live sets at the end of loop bodies, by path
+        self._path = list()  # indexes of the statement visited in its blocks
+        self._analysing = False
+
+    def __loop_key(self):
+        return (self._context, tuple(self._path))
+
+    def visit_block(self, statements):
+        block = list()
+        for index in reversed(range(len(statements))):
+            self._path.append(index)
+            block.extend(reversed((yield statements[index])))
+            self._path.pop()
+        block.reverse()
+        return block
+
+    def visit_Program(self, node):
+        statements = dict()
+        for analysing in (True, False):
+            self._analysing = analysing
+            for context, block in node.statements.items():
+                self._context = context
+                # Falling off the end of main ends the program, falling off
+                # the end of a routine returns to the caller
+                self._live = set() if context == "main" else set(self._observed)
+                statements[context] = yield from self.visit_block(block)
+        return node._replace(statements=statements)
+
+    def visit_Let(self, node):
+        if node.lval.var not in self._live:
+            return []
+        self._live.discard(node.lval.var)
+        expression_variables(node.rval, self._live)
+        return [node]
+
+    def visit_Input(self, node):
+        values_used = list()
+        for var in reversed(node.variables):
+            values_used.append(var.var in self._live)
+            self._live.discard(var.var)
+        values_used.reverse()
+        return [node._replace(values_used=tuple(values_used))]
+
+    def visit_Print(self, node):
+        for exp in node.exp_list:
+            expression_variables(exp, self._live)
+        return [node]
+
+    def visit_Gosub(self, node):
+        effect = self._effects.get(str(node.target_label))
+        self._live.update(self._observed if effect is None else effect.reads)
+        return [node]
+
+    def visit_Return(self, node):
+        self._live = set(self._observed)
+        return [node]
+
+    def visit_End(self, node):
+        self._live = set()
+        return [node]
+
+    def visit_Break(self, node):
+        self._live = set(self._exits[-1])
+        return [node]
+
+    def visit_BlockBreak(self, node):
+        self._live = set(self._block_exits[node.name])
+        return [node]
+
+    def visit_Block(self, node):
+        self._block_exits[node.name] = set(self._live)
+        statements = yield from self.visit_block(node.statements)
+        del self._block_exits[node.name]
+        return [node._replace(statements=statements)]
+
+    def visit_If(self, node):
+        after = set(self._live)
+        statements = yield from self.visit_block(node.statements)
+        if not statements:
+            self._live = after
+            return []
+        self._live.update(after)
+        condition_variables(node.conditions, self._live)
+        return [node._replace(statements=statements)]
+
+    def visit_Loop(self, node):
+        after = set(self._live)
+        self._exits.append(after)
+        key = self.__loop_key()
+        body_live = self._loops.get(key, set())
+        while True:
+            # The end of the body either loops back or leaves the loop
+            self._live = set(body_live)
+            if node.conditions is not None:
+                self._live.update(after)
+                condition_variables(node.conditions, self._live)
+            statements = yield from self.visit_block(node.statements)
+            if not self._analysing or self._live == body_live:
+                break
+            body_live = self._live
+        self._loops[key] = body_live
+        self._exits.pop()
+        return [node._replace(statements=statements)]
+
+    def visit_For(self, node):
+        var = node.var.var
+        # Leaving early keeps the loop variable, the end of the loop
+        # assigns it the value after the loop
+        after = set(self._live)
+        self._exits.append(after)
+        done = after - {var}
+        key = self.__loop_key()
+        body_live = self._loops.get(key, set())
+        while True:
+            # The body may run any number of times, also none, and the loop
+            # variable is stepped after it
+            self._live = body_live | done | {var}
+            statements = yield from self.visit_block(node.statements)
+            if not self._analysing or self._live <= body_live:
+                break
+            body_live = body_live | self._live
+        self._loops[key] = body_live
+        self._exits.pop()
+        # The loop variable is assigned the start before the loop
+        self._live = (body_live | done) - {var}
+        for exp in (node.start, node.stop, node.step):
+            expression_variables(exp, self._live)
+        return [node._replace(statements=statements, value_used=var in after)]
+
+
+def eliminate_dead_stores(program, stats=None):
+    """ Return the program without assignments whose value is never read.
+        What was removed is reported in stats, a DeadStoreStats, if
+        given. """
+    result = DeadStoreEliminator(program).visit(program)
+    if stats is not None:
+        # Count what is gone in the end, the program is visited twice
+        stats.stores += count_statements(program, parse.Let) - count_statements(
+            result, parse.Let
+        )
+        stats.branches += count_statements(program, parse.If) - count_statements(
+            result, parse.If
+        )
+        stats.variables = sorted(
+            assigned_variables(program) - assigned_variables(result)
+        )
+    return result
@@ -14,6 +14,8 @@ def expression(exp):
         return "not %s" % expression(exp.exp)
 
     if isinstance(exp, parse.ArithmeticExpression):
+        if exp.left is None:  # unary expression
+            return "%s%s" % (exp.operator, expression(exp.right))
         return "%s %s %s" % (expression(exp.left), exp.operator, expression(exp.right),)
 
     if isinstance(exp, parse.BooleanExpression):
@@ -83,7 +85,7 @@ class Print(Visitor):
             print("\n%s:" % context, file=self._out)
             self._indent += 1
             for statement in node.statements[context]:
-                self.visit(statement)
+                yield statement
             self._indent -= 1
 
     def visit_Input(self, node):
@@ -110,7 +112,7 @@ class Print(Visitor):
         self.__print("Loop", node.label)
         self._indent += 1
         for statement in node.statements:
-            self.visit(statement)
+            yield statement
 
         if node.conditions is not None:
             conditions = parse.invert_conditions(node.conditions)
@@ -121,12 +123,22 @@ class Print(Visitor):
 
         self._indent -= 1
 
+    def visit_Block(self, node):
+        self.__print("Block %s" % node.name, node.label)
+        self._indent += 1
+        for statement in node.statements:
+            yield statement
+        self._indent -= 1
+
+    def visit_BlockBreak(self, node):
+        self.__print("Break %s" % node.name, node.label)
+
     def visit_If(self, node):
         self.__print("If %s Then" % format_condition(node.conditions), node.label)
 
         self._indent += 1
         for statement in node.statements:
-            self.visit(statement)
+            yield statement
         self._indent -= 1
 
 
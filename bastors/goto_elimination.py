@@ -1,6 +1,8 @@
 """ This moudle handles the elimination of GOTO statements from a program """
 from collections import namedtuple
+import json
 import sys
+import time
 import bastors.parse as parse
 import bastors.debug as debug
 
@@ -24,7 +26,9 @@ class GotoLabelPair:
         """
         for index, goto_index in enumerate(self.goto_path):
             if index >= len(self.label_path):
-                return True
+                # The GOTO is inside the labeled statement, which it jumps
+                # back to the start of
+                return False
             label_index = self.label_path[index]
             if goto_index < label_index:
                 return True
@@ -32,7 +36,7 @@ class GotoLabelPair:
                 return False
         return False
 
-    def __path_in_loop(self, statements, path):
+    def __path_in_loop(self, statements, path):  # pylint: disable=R0201
         """
         Given a list of statements and a path, return true if the statement's
         parent block is a loop.
@@ -40,16 +44,14 @@ class GotoLabelPair:
         if len(path) <= 1:
             return False
 
-        for i, index in enumerate(path):
-            statement = statements[index]
-
-            if i == len(path) - 2:
-                return isinstance(statement, Loop) or isinstance(statement, parse.For)
-
+        block = statements
+        for index in path[:-2]:
+            statement = block[index]
             if isinstance(statement, (Loop, parse.If)):
-                return self.__path_in_loop(statement.statements, path[1:])
+                block = statement.statements
 
-        return False
+        statement = block[path[-2]]
+        return isinstance(statement, (Loop, parse.For))
 
     def goto_in_loop(self):
         """ Return True if GOTO is in a Loop block """
@@ -75,12 +77,13 @@ class GotoLabelPair:
                 None,
                 parse.VariableExpression(temp_name),
                 parse.BooleanExpression(conds),
+                goto_stmt.position,
             )
             block.insert(self.goto_path[len(self.goto_path) - 1], temp_var)
-            goto_stmt = parse.If(
-                goto_stmt.label,
-                [parse.VariableCondition(temp_name, parse.ConditionEnum.INITIAL)],
-                goto_stmt.statements,
+            goto_stmt = goto_stmt._replace(
+                conditions=[
+                    parse.VariableCondition(temp_name, parse.ConditionEnum.INITIAL)
+                ]
             )
             # Update the GotoLabelPair to account for new statement
             self.goto_path[-1] += 1
@@ -154,8 +157,11 @@ class GotoLabelPair:
         return "4.1" if before else "4.2"
 
 
-Loop = namedtuple("Loop", ["label", "conditions", "statements"])
-Break = namedtuple("Break", ["label"])
+# Loops and breaks have the position of the GOTO they were made from
+Loop = namedtuple(
+    "Loop", ["label", "conditions", "statements", "position"], defaults=[None]
+)
+Break = namedtuple("Break", ["label", "position"], defaults=[None])
 
 # pylint: disable=W0603
 TEMP_VAR_NUM = 0  # global
@@ -165,11 +171,109 @@ class GotoEliminationError(Exception):
     """ An error while eliminating GOTOs """
 
 
-def eliminate_goto(program):
+class GotoBudgetError(GotoEliminationError):
+    """ Raised when GOTO elimination grows the program beyond its budget """
+
+    def __init__(self, message, stats):
+        super(GotoBudgetError, self).__init__(message)
+        self.stats = stats
+
+
+# One elimination step, the time and the statement count around it
+Step = namedtuple("Step", ["case", "context", "nodes_before", "nodes_after", "time"])
+
+CASES = ["1.1", "1.2", "2.1", "2.2", "3.1", "3.2", "4.1", "4.2"]
+
+
+class EliminationStats:
+    """
+    Collects statistics while eliminating GOTOs: how many times each of the
+    cases (1.1 ... 4.2) was applied, the time spent in each case and the
+    number of statements before and after every step. Pass an instance to
+    eliminate_goto() and call as_dict() for a report.
+    """
+
+    def __init__(self):
+        self.counts = dict.fromkeys(CASES, 0)
+        self.times = dict.fromkeys(CASES, 0.0)
+        self.steps = list()
+        self.nodes_before = 0
+        self.nodes_after = 0
+        self.max_depth = 0
+        self.temps = 0
+
+    def add_step(self, step):
+        """ Record a performed elimination step """
+        self.counts[step.case] += 1
+        self.times[step.case] += step.time
+        self.steps.append(step)
+
+    def growth(self):
+        """ Return how many times larger the program has grown """
+        if self.nodes_before == 0:
+            return 1.0
+        return self.nodes_after / self.nodes_before
+
+    def as_dict(self):
+        """ Return the statistics as a structure suitable for JSON """
+        return {
+            "cases": {
+                case: {"count": self.counts[case], "time": self.times[case]}
+                for case in CASES
+            },
+            "steps": [step._asdict() for step in self.steps],
+            "nodes_before": self.nodes_before,
+            "nodes_after": self.nodes_after,
+            "growth": self.growth(),
+            "max_depth": self.max_depth,
+            "temps": self.temps,
+        }
+
+    def dump(self, file=sys.stdout):
+        """ Write the statistics as JSON to file """
+        json.dump(self.as_dict(), file, indent=2)
+        print(file=file)
+
+
+def count_nodes(statements):
+    """
+    Return the number of statements, counting the statements of nested
+    blocks as well, and the deepest level of nesting.
+    """
+    count = 0
+    max_depth = 0
+    stack = [(statements, 1)]
+    while stack:
+        block, depth = stack.pop()
+        max_depth = max(max_depth, depth)
+        for statement in block:
+            count += 1
+            if hasattr(statement, "statements"):
+                stack.append((statement.statements, depth + 1))
+    return count, max_depth
+
+
+def count_program(program):
+    """ Return count_nodes() summed over all contexts of the program """
+    count = 0
+    max_depth = 0
+    for statements in program.statements.values():
+        nodes, depth = count_nodes(statements)
+        count += nodes
+        max_depth = max(max_depth, depth)
+    return count, max_depth
+
+
+def eliminate_goto(program, stats=None, max_growth=None):
     """
     This function will loop until there is no more GOTO statements found in
     the provided program.
 
+    If stats, an EliminationStats instance, is given it will be filled in
+    with statistics about the elimination. If max_growth is given a
+    GotoBudgetError is raised as soon as the program has grown more than
+    max_growth times its original number of statements.
+
     Base Algorithm:
       1) Take the original program as input
       2) Collect all goto and label statements as pairs
@@ -209,6 +313,13 @@ def eliminate_goto(program):
     global TEMP_VAR_NUM
     TEMP_VAR_NUM = 0
     statements = program.statements
+    measure = stats is not None or max_growth is not None
+    if stats is None:
+        stats = EliminationStats()
+    if measure:
+        stats.nodes_before, stats.max_depth = count_program(program)
+        stats.nodes_after = stats.nodes_before
+
     while True:  # loop until no GOTOs found
         found = False
         for context in statements.keys():
@@ -216,34 +327,32 @@ def eliminate_goto(program):
             if pair is not None:
                 found = True
                 case = pair.classify()
-                if case == "1.1":
-                    algo_1_1_same_level_same_block__before(pair, statements[context])
-                    break
-                if case == "1.2":
-                    algo_1_2_same_level_same_block__after(pair, statements[context])
-                    break
-                if case == "2.1":
-                    algo_2_1__goto_in_parent_block__before(pair, statements[context])
-                    break
-                if case == "2.2":
-                    algo_2_2__goto_in_parent_block__after(pair, statements[context])
-                    break
-                if case == "3.1":
-                    algo_3_1__label_in_parent_block__before(pair, statements[context])
-                    break
-                if case == "3.2":
-                    algo_3_2__label_in_parent_block__after(pair, statements[context])
-                    break
-                if case == "4.1":
-                    algo_4_1__label_in_disjunct__before(pair, statements[context])
-                    break
-                if case == "4.2":
-                    algo_4_2__label_in_disjunct__after(pair, statements[context])
+                if case not in ALGORITHMS:
+                    # No matches among supported cases
+                    debug.dump(program)
+                    raise GotoEliminationError("Unsupported GOTO case")
+
+                if not measure:
+                    ALGORITHMS[case](pair, statements[context])
                     break
 
-                # No matches among supported cases
-                debug.dump(program)
-                raise GotoEliminationError("Unsupported GOTO case")
+                nodes_before = stats.nodes_after
+                start = time.perf_counter()
+                ALGORITHMS[case](pair, statements[context])
+                elapsed = time.perf_counter() - start
+                nodes_after, depth = count_program(program)
+
+                stats.nodes_after = nodes_after
+                stats.max_depth = max(stats.max_depth, depth)
+                stats.temps = TEMP_VAR_NUM
+                stats.add_step(Step(case, context, nodes_before, nodes_after, elapsed))
+                if max_growth is not None and stats.growth() > max_growth:
+                    raise GotoBudgetError(
+                        "GOTO elimination grew program from %d to %d statements"
+                        % (stats.nodes_before, stats.nodes_after),
+                        stats,
+                    )
+                break
 
         if found is False:
             break  # no GOTOs found in program!
@@ -268,15 +377,27 @@ def get_block(statements, path):
     Given a list of statements and a path, return the block the statments
     belongs to.
     """
-    for i, index in enumerate(path):
-        if i == len(path) - 1:
-            return statements
+    if len(path) == 0:
+        return None
 
-        statement = statements[index]
+    block = statements
+    for index in path[:-1]:
+        statement = block[index]
         if isinstance(statement, (Loop, parse.If)):
-            return get_block(statement.statements, path[1:])
+            block = statement.statements
+    return block
 
-    return None
+
+def index_of(block, statement):
+    """
+    Return the index of statement in block. Unlike list.index() this looks
+    for the very same statement, and does not compare (possibly deeply
+    nested) statements for equality.
+    """
+    for index, candidate in enumerate(block):
+        if candidate is statement:
+            return index
+    raise ValueError("statement not in block")
 
 
 def get_temp_name():
@@ -306,6 +427,7 @@ def algo_1_1_same_level_same_block__before(pair, statements):
             goto_stmt.label,
             parse.invert_conditions(goto_stmt.conditions),
             block[between],
+            goto_stmt.position,
         )
         block[pair.goto_path[-1]] = if_stmt
         del block[between]
@@ -331,7 +453,7 @@ def algo_1_2_same_level_same_block__after(pair, statements):
     # Insert a loop statement where the label was and create a loop based
     # on the goto statement condition.
     #
-    loop_stmt = Loop(None, goto_stmt.conditions, block[between])
+    loop_stmt = Loop(None, goto_stmt.conditions, block[between], goto_stmt.position)
     block[pair.label_path[-1]] = loop_stmt
     #
     # Remove statements between the label statements and the goto statement
@@ -391,8 +513,8 @@ def algo_2_1__goto_in_parent_block__before(pair, statements):
             new_conditions = stmt.conditions + [
                 parse.VariableCondition(temp_name, parse.ConditionEnum.OR)
             ]
-            new_if = parse.If(stmt.label, new_conditions, stmt.statements)
-            block[block.index(stmt)] = new_if
+            new_if = stmt._replace(conditions=new_conditions)
+            block[index_of(block, stmt)] = new_if
             label_block = new_if
         #
         # Step 3, conditionally execute statements after goto statement
@@ -418,7 +540,7 @@ def algo_2_1__goto_in_parent_block__before(pair, statements):
         #
         # Step 4, move the goto statement down to child block from step 2
         #
-        label_block_index = block.index(label_block)
+        label_block_index = index_of(block, label_block)
         if isinstance(label_block, parse.If):
             label_block.statements.insert(0, block[pair.goto_path[path_index]])
         else:
@@ -492,13 +614,16 @@ def algo_2_2__goto_in_parent_block__after(pair, statements):
     stmts = block[label_block_index : pair.goto_path[-1]]
     del block[label_block_index : pair.goto_path[-1]]
     loop_stmt = Loop(
-        None, [parse.VariableCondition(temp_name, parse.ConditionEnum.INITIAL)], stmts,
+        None,
+        [parse.VariableCondition(temp_name, parse.ConditionEnum.INITIAL)],
+        stmts,
+        goto_stmt.position,
     )
     block.insert(label_block_index, loop_stmt)
     #
     # Step 3, move GOTO to first in loop
     #
-    new_goto_index = block.index(goto_stmt)
+    new_goto_index = index_of(block, goto_stmt)
     del block[new_goto_index]
     stmts.insert(0, goto_stmt)
 
@@ -523,7 +648,8 @@ def move_up_a_block(pair, statements, temp_name, is_after):
             parse.If(
                 None,
                 [parse.VariableCondition(temp_name, parse.ConditionEnum.INITIAL)],
-                [Break(None)],
+                [Break(None, goto_stmt.position)],
+                goto_stmt.position,
             ),
         )
     else:
@@ -553,6 +679,34 @@ def move_up_a_block(pair, statements, temp_name, is_after):
         pair.label_path[len(pair.goto_path) - 1] += 1
 
 
+def clear_before_goto_block(pair, statements, temp_name):
+    """
+    The temporary variable of a GOTO is only assigned where the GOTO was,
+    but tested in every block the GOTO is moved up through. Assign it false
+    before the statement holding those blocks, in the block of the label,
+    so that it is not left true by an earlier run of them, in a loop or an
+    earlier call of a GOSUB routine. A GOTO inside the labeled statement
+    jumps back to the assignment, which takes over the label.
+    """
+    depth = len(pair.label_path) - 1
+    block = get_block(statements, pair.label_path)
+    index = pair.goto_path[depth]
+    clear = parse.Let(
+        None,
+        parse.VariableExpression(temp_name),
+        parse.BooleanExpression(
+            [parse.TrueFalseCondition("false", parse.ConditionEnum.INITIAL)]
+        ),
+    )
+    if index == pair.label_path[-1]:
+        clear = clear._replace(label=block[index].label)
+        block[index] = block[index]._replace(label=None)
+    elif index < pair.label_path[-1]:
+        pair.label_path[-1] += 1
+    block.insert(index, clear)
+    pair.goto_path[depth] += 1
+
+
 def algo_3(pair, statements, is_after):
     """
     The parts of 3.1 algo and 3.2 algo that are equal:
@@ -570,6 +724,7 @@ def algo_3(pair, statements, is_after):
     # Step 1, introduce new variable and use it for goto conditional
     #
     temp_name = pair.goto_temp_var()
+    clear_before_goto_block(pair, statements, temp_name)
 
     while True:
         move_up_a_block(pair, statements, temp_name, is_after)
@@ -597,33 +752,16 @@ def algo_3_2__label_in_parent_block__after(pair, statements):
     """
     1 ... 4) Decribed in algo_3()
 
-    5)       Apply Case 1.1 algorithm
+    5)       Apply Case 1.2 algorithm
 
-    6)       Re-initialize the temporary variable (introduced in step#1) to
-             false, just before the statement where label was applied
+    The temporary variable (introduced in step#1) is re-initialized to
+    false in the loop, see clear_before_goto_block()
     """
     algo_3(pair, statements, True)
-    path_index = len(pair.goto_path) - 1
-    block = get_block(statements, pair.goto_path)
-    goto_stmt = block[pair.goto_path[path_index]]
-    goto_conds = goto_stmt.conditions
     #
     # Step 5, apply algo 1.2
     #
     algo_1_2_same_level_same_block__after(pair, statements)
-    #
-    # Step 6, Re-initialize the temporary variable
-    #
-    if pair.label_in_loop():
-        let_stmt = parse.Let(
-            None,
-            parse.VariableExpression(goto_conds[0].var),
-            parse.BooleanExpression(
-                [parse.TrueFalseCondition("false", parse.ConditionEnum.INITIAL)]
-            ),
-        )
-        block = get_block(statements, pair.label_path)
-        block.insert(pair.label_path[-1], let_stmt)
 
 
 def algo_4(pair, statements, is_after):
@@ -679,6 +817,19 @@ def algo_4_2__label_in_disjunct__after(pair, statements):
     algo_2_2__goto_in_parent_block__after(pair, statements)
 
 
+# Maps a classification from GotoLabelPair.classify() to its algorithm
+ALGORITHMS = {
+    "1.1": algo_1_1_same_level_same_block__before,
+    "1.2": algo_1_2_same_level_same_block__after,
+    "2.1": algo_2_1__goto_in_parent_block__before,
+    "2.2": algo_2_2__goto_in_parent_block__after,
+    "3.1": algo_3_1__label_in_parent_block__before,
+    "3.2": algo_3_2__label_in_parent_block__after,
+    "4.1": algo_4_1__label_in_disjunct__before,
+    "4.2": algo_4_2__label_in_disjunct__after,
+}
+
+
 def convert_to_conditional(goto, label, index, statements):
     """
     This function converts a bare GOTO to a conditional GOTO.
@@ -696,7 +847,7 @@ def convert_to_conditional(goto, label, index, statements):
     conditional GOTOs.
     """
     cond = parse.TrueFalseCondition("true", parse.ConditionEnum.INITIAL)
-    replacement = parse.If(label, [cond], [goto])
+    replacement = parse.If(label, [cond], [goto], goto.position)
     statements[index] = replacement
 
 
@@ -712,44 +863,51 @@ def find_goto(statements, path):
       50 END
     Gives a path of [1, 0], the initial 1 leads us to the IF statement and
     the second 0 leads us to the GOTO in the THEN block.
+
+    The blocks are walked using an explicit stack of [block, next index]
+    entries, so that deeply nested programs do not exhaust the Python stack.
     """
-    for index, statement in enumerate(statements):
+    stack = [[statements, 0]]
+    while stack:
+        entry = stack[-1]
+        block, index = entry
+        if index >= len(block):
+            stack.pop()
+            continue
+        entry[1] += 1
+
+        statement = block[index]
         if isinstance(statement, parse.Goto):
-            if len(statements) != 1:
-                convert_to_conditional(statement, statement.label, index, statements)
-                path.insert(0, index)
+            # Every parent entry has already moved past its child block
+            path[:0] = [parent[1] - 1 for parent in stack[:-1]]
+            if len(block) != 1:
+                convert_to_conditional(statement, statement.label, index, block)
+                path.append(index)
             return statement.target_label
 
-        if isinstance(statement, Loop):
-            label = find_goto(statement.statements, path)
-            if label is not None:
-                path.insert(0, index)
-                return label
-
-        if isinstance(statement, parse.If):
-            label = find_goto(statement.statements, path)
-            if label is not None:
-                path.insert(0, index)
-                return label
+        if isinstance(statement, (Loop, parse.If)):
+            stack.append([statement.statements, 0])
     return None
 
 
 def find_label(target, statements, path):
     """ Find the path to the label target of a GOTO statement """
-    for index, statement in enumerate(statements):
+    stack = [[statements, 0]]
+    while stack:
+        entry = stack[-1]
+        block, index = entry
+        if index >= len(block):
+            stack.pop()
+            continue
+        entry[1] += 1
+
+        statement = block[index]
         if target == statement.label:
-            path.insert(0, index)
+            path[:0] = [parent[1] - 1 for parent in stack]
             return True
 
-        if isinstance(statement, Loop):
-            if find_label(target, statement.statements, path):
-                path.insert(0, index)
-                return True
-
-        if isinstance(statement, parse.If):
-            if find_label(target, statement.statements, path):
-                path.insert(0, index)
-                return True
+        if isinstance(statement, (Loop, parse.If)):
+            stack.append([statement.statements, 0])
     return False
 
 
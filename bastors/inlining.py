@@ -0,0 +1,186 @@
+"""
+This module provides inlining of GOSUB routines, run on a program after
+GOTO elimination so that the passes following it can optimize across what
+used to be calls.
+
+A routine is inlined if it is small, at most INLINE_THRESHOLD statements,
+or called from one place only, and it does not call itself. Routines are
+handled callees first, so that a routine is as small as it gets before it
+is considered for inlining into its callers. Routines left without callers
+are removed from the program.
+
+A RETURN at the end of a routine just goes away. A RETURN anywhere else
+becomes a BlockBreak out of a Block around the inlined statements, a
+labeled block in the generated Rust. An END keeps ending the program.
+"""
+from collections import namedtuple
+import itertools
+import json
+import sys
+import bastors.parse as parse
+from bastors.analysis import function_effects
+from bastors.goto_elimination import count_nodes
+from bastors.visitor import Transformer
+
+# A block of inlined statements that can be left early by a BlockBreak
+Block = namedtuple("Block", ["label", "name", "statements"])
+BlockBreak = namedtuple("BlockBreak", ["label", "name"])
+
+# Routines of at most this many statements are inlined at every call
+INLINE_THRESHOLD = 12
+
+
+class InlineStats:
+    """
+    Reports what the inlining did, with --stats:
+        calls: GOSUB statements replaced by the routine they call
+        removed: routines inlined everywhere and removed
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.removed = list()
+
+    def as_dict(self):
+        """ Return the statistics as a structure suitable for JSON """
+        return dict(vars(self))
+
+    def dump(self, file=sys.stdout):
+        """ Write the statistics as JSON to file """
+        json.dump(self.as_dict(), file, indent=2)
+        print(file=file)
+
+
+def count_calls(statements):
+    """ Return a dict with the number of GOSUB statements calling every
+        target in a dict of contexts and their statements. Targets are
+        strings, like the contexts of function_effects(). """
+    counts = dict()
+    stack = list(statements.values())
+    while stack:
+        for statement in stack.pop():
+            if isinstance(statement, parse.Gosub):
+                target = str(statement.target_label)
+                counts[target] = counts.get(target, 0) + 1
+            elif hasattr(statement, "statements"):
+                stack.append(statement.statements)
+    return counts
+
+
+def breaks_out(statements, name):
+    """ Return True if the statements break out of the block named name """
+    stack = [statements]
+    while stack:
+        for statement in stack.pop():
+            if isinstance(statement, BlockBreak) and statement.name == name:
+                return True
+            if hasattr(statement, "statements"):
+                stack.append(statement.statements)
+    return False
+
+
+def callees_first(contexts, effects):
+    """ Return the contexts ordered so that routines come before the
+        contexts calling them, as far as recursion allows """
+    order = list()
+    done = set()
+    for root in sorted(contexts, key=lambda context: context == "main"):
+        if root in done:
+            continue
+        done.add(root)
+        stack = [(root, iter(sorted(effects[root].calls)))]
+        while stack:
+            context, callees = stack[-1]
+            callee = next(callees, None)
+            if callee is None:
+                stack.pop()
+                order.append(context)
+            elif callee in contexts and callee not in done:
+                done.add(callee)
+                stack.append((callee, iter(sorted(effects[callee].calls))))
+    return order
+
+
+# pylint: disable=C0103,C0116
+class ReturnRewriter(Transformer):
+    """ This class rewrites the statements of a routine to be inlined,
+        turning RETURN into a break out of the named block. """
+
+    def __init__(self, name):
+        super().__init__()
+        self._name = name
+
+    def visit_Return(self, node):
+        return [BlockBreak(node.label, self._name)]
+
+
+class Inliner(Transformer):
+    """
+    This class rewrites a block of statements with calls to the routines
+    in inline replaced by their statements. The statements of all contexts
+    are passed in as routines, keyed by their string names.
+    """
+
+    def __init__(self, routines, inline, stats, names):
+        super().__init__()
+        self._routines = routines
+        self._inline = inline
+        self._stats = stats
+        self._names = names  # numbers the blocks, to give them unique names
+
+    def visit_Gosub(self, node):
+        target = str(node.target_label)
+        if target not in self._inline:
+            return [node]
+
+        self._stats.calls += 1
+        name = "f_%s_%d" % (target, next(self._names))
+        statements = ReturnRewriter(name).transform(self._routines[target])
+        if statements and isinstance(statements[-1], BlockBreak):
+            statements = statements[:-1]
+        if not breaks_out(statements, name):
+            return statements
+        return [Block(node.label, name, statements)]
+
+
+def inline_gosubs(program, threshold=INLINE_THRESHOLD, stats=None):
+    """
+    Return the program with small routines and routines with one caller
+    inlined. Routines are small if they have at most threshold statements,
+    a threshold of 0 turns inlining off. What was done is counted in stats,
+    an InlineStats, if given.
+    """
+    if threshold <= 0:
+        return program
+    if stats is None:
+        stats = InlineStats()
+
+    keys = {str(context): context for context in program.statements}
+    routines = {str(context): block for context, block in program.statements.items()}
+    effects = function_effects(program)
+    names = itertools.count()
+    recursive = set(
+        context for context, effect in effects.items() if context in effect.calls
+    )
+
+    for context in callees_first(routines, effects):
+        counts = count_calls(routines)
+        inline = set()
+        for target in effects[context].calls:
+            if target not in routines or target in recursive or target == context:
+                continue
+            size, _ = count_nodes(routines[target])
+            if size <= threshold or counts.get(target) == 1:
+                inline.add(target)
+        if inline:
+            inliner = Inliner(routines, inline, stats, names)
+            routines[context] = inliner.transform(routines[context])
+
+    counts = count_calls(routines)
+    statements = dict()
+    for context, block in routines.items():
+        if context != "main" and context not in counts:
+            stats.removed.append(context)
+            continue
+        statements[keys[context]] = block
+    return program._replace(statements=statements)
@@ -0,0 +1,114 @@
+"""
+This module reads the counts written by instrumented programs, see the
+instrument option of Rustify and --instrument. Every line of a counts file
+is a counter: the line, column and label (- for none) of a TinyBasic
+statement, what was counted, and the count.
+
+    10 4 100 statement 1200
+    12 1 - taken 1100
+    12 1 - not-taken 100
+
+Statements are counted every time they run. The branches of an IF, and of
+the loops GOTO elimination makes from a GOTO back, count how often they
+were taken, the body of the IF run or the loop run again, and not taken.
+
+Run as a script it lists the lines of the program by how often they ran,
+and the branches taken or not taken the most:
+
+    $ python3 bastors.py --instrument --build -o prog prog.bas
+    $ ./prog < input
+    $ python3 -m bastors.instrument prog.counts prog.bas
+"""
+from collections import namedtuple
+import sys
+from bastors.parse import Position
+
+# The environment variable naming the file an instrumented program writes
+# its counts to, instead of the one it was generated with
+COUNTS_VARIABLE = "BASTORS_COUNTS"
+
+Counter = namedtuple("Counter", ["position", "kind", "count"])
+
+
+def read_counts(file):
+    """ Return the Counters of the counts file, an open file """
+    counters = list()
+    for text in file:
+        fields = text.split()
+        if len(fields) != 5:
+            continue
+        line, col, label, kind, count = fields
+        label = None if label == "-" else int(label)
+        position = Position(label, int(line), int(col))
+        counters.append(Counter(position, kind, int(count)))
+    return counters
+
+
+def line_counts(counters):
+    """ Return a dict from the lines of the program to the number of times
+        the statements on them ran """
+    lines = dict()
+    for counter in counters:
+        if counter.kind == "statement":
+            line = counter.position.line
+            lines[line] = lines.get(line, 0) + counter.count
+    return lines
+
+
+def branch_counts(counters):
+    """ Return a dict from the positions of branching statements to their
+        counts, pairs of the times taken and not taken """
+    branches = dict()
+    for counter in counters:
+        if counter.kind in ("taken", "not-taken"):
+            taken, not_taken = branches.get(counter.position, (0, 0))
+            if counter.kind == "taken":
+                taken += counter.count
+            else:
+                not_taken += counter.count
+            branches[counter.position] = (taken, not_taken)
+    return branches
+
+
+def report(counters, source=None, file=sys.stdout):
+    """ Write the lines of the program by how often they ran, and the
+        branches, to file, with the text of the lines of source, the
+        TinyBasic program, if given """
+    texts = source.splitlines() if source is not None else list()
+
+    def text(line):
+        return texts[line - 1].strip() if line <= len(texts) else ""
+
+    lines = line_counts(counters)
+    print("%12s %6s" % ("runs", "line"), file=file)
+    for line, count in sorted(lines.items(), key=lambda item: (-item[1], item[0])):
+        print("%12d %6d  %s" % (count, line, text(line)), file=file)
+
+    branches = branch_counts(counters)
+    if branches:
+        print(file=file)
+        print("%12s %12s %6s" % ("taken", "not taken", "line"), file=file)
+    for position, (taken, not_taken) in sorted(
+        branches.items(), key=lambda item: (-sum(item[1]), item[0].line)
+    ):
+        line = position.line
+        print("%12d %12d %6d  %s" % (taken, not_taken, line, text(line)), file=file)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: %s COUNTS [SOURCE]" % sys.argv[0])
+        sys.exit()
+
+    try:
+        with open(sys.argv[1], "r") as FP:
+            COUNTERS = read_counts(FP)
+        SOURCE = None
+        if len(sys.argv) > 2:
+            with open(sys.argv[2], "r") as FP:
+                SOURCE = FP.read()
+    except IOError as err:
+        print("could not read file: %s" % err.filename)
+        sys.exit(1)
+
+    report(COUNTERS, SOURCE)
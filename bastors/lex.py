@@ -14,7 +14,7 @@ Formal grammar of Tiny Basic (https://en.wikipedia.org/wiki/Tiny_BASIC)
                   END
     expr-list ::= (string|expression) (, (string|expression) )*
     var-list ::= var (, var)*
-    expression ::= term ((+|-) term)*
+    expression ::= (+|-|ε) term ((+|-) term)*
     term ::= factor ((*|/) factor)*
     factor ::= var | number | (expression)
     var ::= A | B | C ... | Y | Z
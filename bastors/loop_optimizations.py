@@ -0,0 +1,321 @@
+"""
+This module provides optimizations of the loops left by GOTO elimination and
+counted loop recognition, run before dead store elimination.
+
+A For loop with an empty body, like the busy wait
+
+    FOR J=1 TO 500
+    NEXT J
+
+does nothing but leave its variable with its final value, so it is replaced
+by assignments of that value.
+
+Expressions, and comparisons in conditions, that only read variables the
+loop does not write are invariant. They are computed once, into temporary
+variables assigned before the loop, instead of on every iteration. Loops
+calling routines whose effects are not known are left alone. An expression
+may then be evaluated where the original program never evaluated it, for a
+loop that runs no iterations or in a branch that is not taken. Arithmetic
+overflow is as much an error of the program there as it is anywhere else,
+but a division by zero must not be, so divisions are only hoisted when the
+loop is sure to evaluate them before it does anything else.
+"""
+import json
+import sys
+import bastors.parse as parse
+from bastors.analysis import expression_variables, function_effects, statement_usage
+from bastors.constant_folding import constant_value, literal
+from bastors.counted_loops import last_value
+from bastors.visitor import Transformer
+
+
+class LoopStats:
+    """
+    Reports what the loop optimizations did, with --stats:
+        removed: empty For loops replaced by their final value
+        hoisted: invariant expressions and comparisons moved out of loops
+    """
+
+    def __init__(self):
+        self.removed = 0
+        self.hoisted = 0
+
+    def as_dict(self):
+        """ Return the statistics as a structure suitable for JSON """
+        return dict(vars(self))
+
+    def dump(self, file=sys.stdout):
+        """ Write the statistics as JSON to file """
+        json.dump(self.as_dict(), file, indent=2)
+        print(file=file)
+
+
+def divides(exp):
+    """ Return True if evaluating the expression divides """
+    if isinstance(exp, parse.ArithmeticExpression):
+        return exp.operator == "/" or divides(exp.left) or divides(exp.right)
+    if isinstance(exp, (parse.ParenExpression, parse.NotExpression)):
+        return divides(exp.exp)
+    return False
+
+
+def final_value(node):
+    """
+    Return the statements assigning the variable of a For loop the value
+    the loop leaves in it, for loops with a constant step, or None if the
+    value cannot be computed without running the loop.
+    """
+    step = constant_value(node.step)
+    if step is None or step == 0:
+        return None
+    variable = node.var
+    start = constant_value(node.start)
+    stop = constant_value(node.stop)
+    if start is not None and stop is not None:
+        if stop >= start if step > 0 else stop <= start:
+            start = last_value(start, stop, step) + step
+        return [parse.Let(node.label, variable, literal(start))]
+    if variable.var in expression_variables(node.stop):
+        return None
+
+    stop_exp = node.stop
+    if not isinstance(stop_exp, (str, parse.VariableExpression)):
+        stop_exp = parse.ParenExpression(stop_exp)
+    sign = "+" if step > 0 else "-"
+    if abs(step) == 1:
+        after = parse.ArithmeticExpression(stop_exp, sign, "1")
+    else:
+        if step > 0:
+            distance = parse.ArithmeticExpression(stop_exp, "-", variable)
+        else:
+            distance = parse.ArithmeticExpression(variable, "-", stop_exp)
+        iterations = parse.ArithmeticExpression(
+            parse.ArithmeticExpression(
+                parse.ParenExpression(distance), "/", str(abs(step))
+            ),
+            "+",
+            "1",
+        )
+        after = parse.ArithmeticExpression(
+            variable,
+            sign,
+            parse.ArithmeticExpression(
+                parse.ParenExpression(iterations), "*", str(abs(step))
+            ),
+        )
+    runs = parse.Condition(
+        variable, "<=" if step > 0 else ">=", stop_exp, parse.ConditionEnum.INITIAL
+    )
+    return [
+        parse.Let(node.label, variable, node.start),
+        parse.If(None, [runs], [parse.Let(None, variable, after)]),
+    ]
+
+
+# pylint: disable=C0103,C0116
+class Hoister(Transformer):
+    """
+    This class rewrites the statements of a loop body with the expressions
+    not reading any of writes replaced by temporaries, named by calling
+    new_name. The assignments of the temporaries are collected in hoisted,
+    to go before the loop. The statements passed to rewrite() one at a time
+    tell whether the loop surely evaluates their expressions first.
+    """
+
+    def __init__(self, writes, new_name):
+        super().__init__()
+        self._writes = writes
+        self._new_name = new_name
+        self._temps = dict()  # the temporaries of expressions already hoisted
+        self._first = False
+        self.hoisted = list()
+
+    def rewrite(self, statement, first):
+        """ Rewrite a statement of the loop body, first if the loop surely
+            evaluates its expressions before doing anything else """
+        self._first = first
+        return self.transform([statement])
+
+    def __invariant(self, exp):
+        variables = expression_variables(exp)
+        return variables and not variables & self._writes
+
+    def __temp(self, value):
+        key = repr(value)  # conditions are lists, which do not hash
+        if key not in self._temps:
+            self._temps[key] = self._new_name()
+            self.hoisted.append(
+                parse.Let(None, parse.VariableExpression(self._temps[key]), value)
+            )
+        return parse.VariableExpression(self._temps[key])
+
+    def expression(self, exp, first=None):
+        """ Return the expression with its invariant parts hoisted """
+        if first is None:
+            first = self._first
+        inner = exp.exp if isinstance(exp, parse.ParenExpression) else exp
+        if isinstance(inner, parse.ArithmeticExpression) and inner.left is not None:
+            if self.__invariant(inner) and (first or not divides(inner)):
+                return self.__temp(inner)
+
+        if isinstance(exp, parse.ArithmeticExpression):
+            return exp._replace(
+                left=self.expression(exp.left, first),
+                right=self.expression(exp.right, first),
+            )
+        if isinstance(exp, (parse.ParenExpression, parse.NotExpression)):
+            return exp._replace(exp=self.expression(exp.exp, first))
+        if isinstance(exp, parse.BooleanExpression):
+            return exp._replace(conditions=self.conditions(exp.conditions, first))
+        return exp
+
+    def conditions(self, conditions, first=None):
+        """ Return the conditions with their invariant comparisons, and the
+            invariant parts of the other ones, hoisted """
+        if first is None:
+            first = self._first
+        result = list()
+        for cond in conditions:
+            if isinstance(cond, parse.Condition):
+                sides = parse.ArithmeticExpression(cond.left, "-", cond.right)
+                if self.__invariant(sides) and (first or not divides(sides)):
+                    comparison = parse.BooleanExpression(
+                        [cond._replace(type=parse.ConditionEnum.INITIAL)]
+                    )
+                    temp = self.__temp(comparison)
+                    cond = parse.VariableCondition(temp.var, cond.type)
+                else:
+                    cond = cond._replace(
+                        left=self.expression(cond.left, first),
+                        right=self.expression(cond.right, first),
+                    )
+            result.append(cond)
+        return result
+
+    def visit_Let(self, node):
+        return [node._replace(rval=self.expression(node.rval))]
+
+    def visit_Print(self, node):
+        return [node._replace(exp_list=[self.expression(exp) for exp in node.exp_list])]
+
+    def visit_If(self, node):
+        conditions = self.conditions(node.conditions)
+        self._first = False
+        statements = yield from self.visit_block(node.statements)
+        return [node._replace(conditions=conditions, statements=statements)]
+
+    def visit_Loop(self, node):
+        self._first = False
+        statements = yield from self.visit_block(node.statements)
+        conditions = node.conditions
+        if conditions is not None:
+            conditions = self.conditions(conditions)
+        return [node._replace(conditions=conditions, statements=statements)]
+
+    def visit_For(self, node):
+        start = self.expression(node.start)
+        stop = self.expression(node.stop)
+        step = self.expression(node.step)
+        self._first = False
+        statements = yield from self.visit_block(node.statements)
+        return [
+            node._replace(start=start, stop=stop, step=step, statements=statements)
+        ]
+
+    def visit_Block(self, node):
+        self._first = False
+        statements = yield from self.visit_block(node.statements)
+        return [node._replace(statements=statements)]
+
+
+class LoopOptimizer(Transformer):
+    """
+    This class rewrites the loops of a program, see the module
+    documentation. Loops are visited outside in, so that an expression
+    invariant in several nested loops is hoisted out of all of them.
+    """
+
+    def __init__(self, program, stats):
+        super().__init__()
+        self._effects = function_effects(program)
+        self._stats = stats
+        self._temps = 0
+
+    def __temp_name(self):
+        name = "h%d" % self._temps
+        self._temps += 1
+        return name
+
+    def __writes(self, statements):
+        """ Return the variables a block, or the routines it calls, may
+            write, or None if that is not known """
+        usage = statement_usage(statements)
+        writes = set(usage.writes)
+        for call in usage.calls:
+            effect = self._effects.get(call)
+            if effect is None:
+                return None
+            writes.update(effect.writes)
+        return writes
+
+    def __hoist(self, statements, writes, runs):
+        """ Return the assignments of the temporaries hoisted out of the
+            body of a loop, which runs at least once if runs, and the
+            body rewritten """
+        hoister = Hoister(writes, self.__temp_name)
+        body = list()
+        first = runs
+        for statement in statements:
+            body.extend(hoister.rewrite(statement, first))
+            # Nothing but assignments ran before the next statement
+            first = first and isinstance(statement, parse.Let)
+        return hoister, body, first
+
+    def visit_Loop(self, node):
+        hoisted = list()
+        writes = self.__writes(node.statements)
+        if writes is not None:
+            hoister, body, first = self.__hoist(node.statements, writes, True)
+            conditions = node.conditions
+            if conditions is not None:
+                conditions = hoister.conditions(conditions, first)
+            hoisted = hoister.hoisted
+            node = node._replace(conditions=conditions, statements=body)
+            self._stats.hoisted += len(hoisted)
+
+        statements = yield from self.visit_block(node.statements)
+        return hoisted + [node._replace(statements=statements)]
+
+    def visit_For(self, node):
+        hoisted = list()
+        writes = self.__writes(node.statements)
+        if writes is not None:
+            start = constant_value(node.start)
+            stop = constant_value(node.stop)
+            step = constant_value(node.step)
+            runs = None not in (start, stop, step) and (
+                stop >= start if step >= 0 else stop <= start
+            )
+            hoister, body, _ = self.__hoist(
+                node.statements, writes | {node.var.var}, runs
+            )
+            hoisted = hoister.hoisted
+            node = node._replace(statements=body)
+            self._stats.hoisted += len(hoisted)
+
+        statements = yield from self.visit_block(node.statements)
+        if not statements:
+            final = final_value(node)
+            if final is not None:
+                self._stats.removed += 1
+                return hoisted + final
+        return hoisted + [node._replace(statements=statements)]
+
+
+def optimize_loops(program, stats=None):
+    """ Return the program with empty For loops removed and invariant
+        expressions hoisted out of loops. What was done is counted in
+        stats, a LoopStats, if given. """
+    if stats is None:
+        stats = LoopStats()
+    return LoopOptimizer(program, stats).visit(program)
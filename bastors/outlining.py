@@ -0,0 +1,110 @@
+"""
+This module provides outlining of main, run on a program right before it
+is turned into Rust.
+
+GOTO elimination leaves most of a program in main, often in one loop, and
+rustc takes far longer on one huge function than on many small ones.
+Regions of main of up to OUTLINE_SIZE statements are moved into routines
+of their own, called by a GOSUB where the region was, so that rustc can
+compile them apart, in parallel codegen units and incrementally.
+
+All variables of a routine live in State, and Rustify copies the locals
+of main that a routine uses to and from State around the call, so moving
+statements into a routine does not change what they do. A region must
+not leave the block it is in other than by ending the program: it holds
+no RETURN, no Break out of a loop around it and no BlockBreak. Regions are
+made of consecutive statements of a block, and blocks with statements
+too big to move as a whole are searched for regions in turn.
+"""
+import json
+import sys
+import bastors.parse as parse
+from bastors.counted_loops import exits_early
+from bastors.goto_elimination import count_nodes
+from bastors.visitor import Transformer
+
+# Regions of main up to this many statements are moved into routines
+OUTLINE_SIZE = 64
+
+
+class OutlineStats:
+    """
+    Reports what the outlining did, with --stats:
+        routines: routines made of regions of main
+        statements: statements moved into those routines
+    """
+
+    def __init__(self):
+        self.routines = 0
+        self.statements = 0
+
+    def as_dict(self):
+        """ Return the statistics as a structure suitable for JSON """
+        return dict(vars(self))
+
+    def dump(self, file=sys.stdout):
+        """ Write the statistics as JSON to file """
+        json.dump(self.as_dict(), file, indent=2)
+        print(file=file)
+
+
+# pylint: disable=C0103,C0116
+class Outliner(Transformer):
+    """
+    This class rewrites the blocks of main with their regions moved into
+    new contexts of the program, named main_1, main_2 and so on, see the
+    module documentation.
+    """
+
+    def __init__(self, contexts, size, stats):
+        super().__init__()
+        self._contexts = contexts
+        self._size = size
+        self._stats = stats
+
+    def __routine(self, region, nodes):
+        """ Return the statements to replace a region with, a GOSUB of a
+            new routine, or the region itself if it is too small """
+        if nodes <= max(1, self._size // 4):
+            return region
+        self._stats.routines += 1
+        self._stats.statements += nodes
+        name = "main_%d" % self._stats.routines
+        self._contexts[name] = region
+        return [parse.Gosub(None, name)]
+
+    def visit_block(self, statements):
+        result = list()
+        region = list()
+        nodes = 0
+        for statement in statements:
+            size, _ = count_nodes([statement])
+            if size <= self._size and not exits_early([statement]):
+                if nodes + size > self._size:
+                    result.extend(self.__routine(region, nodes))
+                    region, nodes = list(), 0
+                region.append(statement)
+                nodes += size
+                continue
+
+            result.extend(self.__routine(region, nodes))
+            region, nodes = list(), 0
+            result.extend((yield statement))
+        result.extend(self.__routine(region, nodes))
+        return result
+
+
+def outline_main(program, size=OUTLINE_SIZE, stats=None):
+    """ Return the program with regions of main of up to size statements
+        moved into routines of their own, when main is larger than that.
+        What was done is counted in stats, an OutlineStats, if given. """
+    if stats is None:
+        stats = OutlineStats()
+    main = program.statements.get("main")
+    if main is None or count_nodes(main)[0] <= size:
+        return program
+
+    contexts = dict(program.statements)
+    outliner = Outliner(contexts, size, stats)
+    contexts["main"] = outliner.transform(main)
+    return parse.Program(contexts)
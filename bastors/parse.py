@@ -2,6 +2,8 @@
     line ::= number statement CR | statement CR
     statement ::= PRINT expr-list
                   IF expression operator expression THEN statement
+                  FOR var = expression TO expression (STEP expression|ε)
+                  NEXT var
                   GOTO number
                   INPUT var-list
                   LET var = expression
@@ -13,7 +15,7 @@
                   END
     expr-list ::= (string|expression) (, (string|expression) )*
     var-list ::= var (, var)*
-    expression ::= term ((+|-) term)*
+    expression ::= (+|-|ε) term ((+|-) term)*
     term ::= factor ((*|/) factor)*
     factor ::= var | number | (expression)
     var ::= A | B | C ... | Y | Z
@@ -90,17 +92,34 @@ def invert_conditions(conditions):
 #
 # These are the statements that we currently construct from TinyBasic
 #
+# Statements read from a line of the source have the position of the
+# line, the label it had and where the statement starts, kept through the
+# passes so that generated code can be traced back to it.
+#
+Position = namedtuple("Position", ["label", "line", "col"])
+
 Program = namedtuple("Program", "statements")
-Let = namedtuple("Let", ["label", "lval", "rval"])
-If = namedtuple("If", ["label", "conditions", "statements"])
-Goto = namedtuple("Goto", ["label", "target_label"])
-Print = namedtuple("Print", ["label", "exp_list"])
-Gosub = namedtuple("Gosub", ["label", "target_label"])
-Return = namedtuple("Return", ["label"])
-Input = namedtuple("Input", ["label", "variables"])
-For = namedtuple("For", ["var", "start", "stop", "step", "statements", "label"])
-Next = namedtuple("Next", ["label"])
-End = namedtuple("End", ["label"])
+Let = namedtuple("Let", ["label", "lval", "rval", "position"], defaults=[None])
+If = namedtuple(
+    "If", ["label", "conditions", "statements", "position"], defaults=[None]
+)
+Goto = namedtuple("Goto", ["label", "target_label", "position"], defaults=[None])
+Print = namedtuple("Print", ["label", "exp_list", "position"], defaults=[None])
+Gosub = namedtuple("Gosub", ["label", "target_label", "position"], defaults=[None])
+Return = namedtuple("Return", ["label", "position"], defaults=[None])
+Input = namedtuple(
+    "Input", ["label", "variables", "position", "values_used"], defaults=[None, None]
+)
+# The value_used of a For is False where nothing reads the value its
+# variable has after the loop, the values_used of an Input, if set, tell
+# the same for each of its variables, see dead_store_elimination.py
+For = namedtuple(
+    "For",
+    ["var", "start", "stop", "step", "statements", "label", "position", "value_used"],
+    defaults=[None, True],
+)
+Next = namedtuple("Next", ["label", "position"], defaults=[None])
+End = namedtuple("End", ["label", "position"], defaults=[None])
 
 ArithmeticExpression = namedtuple("ArithmeticExpression", ["left", "operator", "right"])
 BooleanExpression = namedtuple("BooleanExpression", ["conditions"])
@@ -180,11 +199,17 @@ class Parser:  # pylint: disable=too-few-public-methods
 
     def __parse_exp(self):
         """
-        expression ::= term ((+|-) term)*
+        expression ::= (+|-|ε) term ((+|-) term)*
         term ::= factor ((*|/) factor)*
         factor ::= var | number | (expression)
         """
+        sign = None
+        if self._current_token.value in ("-", "+"):
+            sign = self._current_token.value
+            self.__eat(lex.TokenEnum.ARITHMETIC_OP)
         node = self.__parse_term()
+        if sign == "-":  # Rust has no unary plus, so that one just goes
+            node = ArithmeticExpression(None, sign, node)
 
         while self._current_token.value in ("-", "+"):
             token = self._current_token
@@ -319,8 +344,7 @@ class Parser:  # pylint: disable=too-few-public-methods
         self.__eat(lex.TokenEnum.VARIABLE)
         self.__eat(lex.TokenEnum.RELATION_OP)
 
-        start = int(self._current_token.value)
-        self.__eat(lex.TokenEnum.NUMBER)
+        start = self.__parse_exp()
 
         if (self._current_token.type != lex.TokenEnum.STATEMENT or
             self._current_token.value != "TO"):
@@ -330,16 +354,14 @@ class Parser:  # pylint: disable=too-few-public-methods
             raise ParseError("expected TO keyword [%d:%d]" % (line, col), line, col)
         self.__eat(lex.TokenEnum.STATEMENT)
 
-        stop = int(self._current_token.value)
-        self.__eat(lex.TokenEnum.NUMBER)
+        stop = self.__parse_exp()
 
         if (self._current_token.type == lex.TokenEnum.STATEMENT and
             self._current_token.value == "STEP"):
             self.__eat(lex.TokenEnum.STATEMENT)
-            step = int(self._current_token.value)
-            self.__eat(lex.TokenEnum.NUMBER)
+            step = self.__parse_exp()
         else:
-            step = 1
+            step = "1"
 
         statements = list()
         while True:
@@ -403,14 +425,18 @@ class Parser:  # pylint: disable=too-few-public-methods
         if fwd_label is not None:
             label = fwd_label
 
-        if self._current_token.type == lex.TokenEnum.VARIABLE:
-            return self.__parse_let(label)
-
         if self._current_token.type == lex.TokenEnum.COMMENT:
             self.__eat(lex.TokenEnum.COMMENT)
             return self.__process_line(label)
 
-        return self.__parse_statement(label)
+        token = self._current_token
+        if token.type == lex.TokenEnum.VARIABLE:
+            statement = self.__parse_let(label)
+        else:
+            statement = self.__parse_statement(label)
+        if statement is None:
+            return None
+        return statement._replace(position=Position(label, token.line, token.col))
 
     def __parse_program(self):
         while True:
@@ -429,12 +455,14 @@ class Parser:  # pylint: disable=too-few-public-methods
 
         return Program(self._statements)
 
-    def parse(self):
+    def parse(self, tokens=None):
         """ Attempts to parse a TineBasic program based on the tokens received
             from the lexer (lex.py). See the namedtuples above for what
-            statements are generated to a list on the program node. """
-        lexer = lex.Lexer(self._code)
-        self._token_iter = iter(lexer.get_tokens())
+            statements are generated to a list on the program node.
+            Already lexed tokens can be passed in instead. """
+        if tokens is None:
+            tokens = lex.Lexer(self._code).get_tokens()
+        self._token_iter = iter(tokens)
         self._current_token = next(self._token_iter)
 
         return self.__parse_program()
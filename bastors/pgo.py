@@ -0,0 +1,132 @@
+"""
+This module builds transpiled programs with profile-guided optimization,
+all of it locally with rustc and llvm-profdata:
+
+    1. build the program with -C profile-generate
+    2. run it with a recorded training input as the input of its INPUTs
+    3. merge the profiles written with llvm-profdata
+    4. build it again with -C profile-use
+
+The optimized binary and one built with plain rustc -O are then timed on
+the training input, to report what the profile gained. llvm-profdata must
+read the profiles of the LLVM rustc is built on, the one of the llvm-tools
+rustup component does:
+
+    $ rustup component add llvm-tools
+"""
+from collections import namedtuple
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from bastors.build import RUSTC_FLAGS, BuildError, build_rustc, tool_output
+
+# Times each binary is run on the training input, the fastest run counts
+TIMING_RUNS = 3
+
+# The binary built and the seconds the plain -O and the optimized binary
+# took on the training input
+PGOResult = namedtuple("PGOResult", ["binary", "plain_time", "pgo_time"])
+
+
+def llvm_version(output):
+    """ Return the major LLVM version named in the output of a tool """
+    match = re.search(r"LLVM version:? (\d+)", output)
+    return int(match.group(1)) if match else None
+
+
+def find_profdata():
+    """ Return the path of an llvm-profdata for the LLVM of rustc, the one
+        of llvm-tools in the sysroot of rustc, or else one in PATH """
+    wanted = llvm_version(tool_output("rustc", "-vV"))
+    host = re.search(r"host: (\S+)", tool_output("rustc", "-vV")).group(1)
+    sysroot = tool_output("rustc", "--print", "sysroot").strip()
+    candidates = [
+        os.path.join(sysroot, "lib", "rustlib", host, "bin", "llvm-profdata"),
+        shutil.which("llvm-profdata"),
+    ]
+    found = list()
+    for path in candidates:
+        if path is None or not os.access(path, os.X_OK):
+            continue
+        version = llvm_version(tool_output(path, "merge", "--version"))
+        if version == wanted:
+            return path
+        found.append("%s (LLVM %s)" % (path, version))
+    raise BuildError(
+        "no llvm-profdata for LLVM %s of rustc%s, install it with "
+        "rustup component add llvm-tools"
+        % (wanted, ", found " + ", ".join(found) if found else "")
+    )
+
+
+def run_training(binary, training):
+    """ Run binary with the file training as its input, return the seconds
+        it took """
+    with open(training, "rb") as stdin:
+        start = time.perf_counter()
+        process = subprocess.run(
+            [os.path.abspath(binary)],
+            stdin=stdin,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            check=False,
+        )
+        elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise BuildError(
+            "%s failed on %s: %s"
+            % (binary, training, process.stderr.decode("utf-8", "replace"))
+        )
+    return elapsed
+
+
+def build_pgo(rust, output, training, cache=None):
+    """
+    Compile the Rust code rust, a str, to the binary output, optimized with
+    the profile of a run on the file training. The plain -O binary it is
+    compared against is taken from and added to cache, a BinaryCache, if
+    given. Return a PGOResult.
+    """
+    profdata = find_profdata()
+    with tempfile.TemporaryDirectory() as directory:
+        profiles = os.path.join(directory, "profiles")
+        instrumented = os.path.join(directory, "instrumented")
+        flags = RUSTC_FLAGS + ["-C", "profile-generate=%s" % profiles]
+        build_rustc(rust, instrumented, flags=flags)
+        run_training(instrumented, training)
+
+        merged = os.path.join(directory, "merged.profdata")
+        process = subprocess.run(
+            [profdata, "merge", "-o", merged, profiles],
+            stderr=subprocess.PIPE,
+            check=False,
+        )
+        if process.returncode != 0:
+            raise BuildError(process.stderr.decode("utf-8", "replace"))
+
+        flags = RUSTC_FLAGS + ["-C", "profile-use=%s" % merged]
+        build_rustc(rust, output, flags=flags)
+        plain = os.path.join(directory, "plain")
+        build_rustc(rust, plain, cache)
+
+        plain_time = min(run_training(plain, training) for _ in range(TIMING_RUNS))
+        pgo_time = min(run_training(output, training) for _ in range(TIMING_RUNS))
+    return PGOResult(output, plain_time, pgo_time)
+
+
+def report(result, file=sys.stderr):
+    """ Write how much faster the binary of a PGOResult ran """
+    print(
+        "%s: %.3fs with -O, %.3fs with the profile, %.2fx"
+        % (
+            result.binary,
+            result.plain_time,
+            result.pgo_time,
+            result.plain_time / result.pgo_time if result.pgo_time else 0.0,
+        ),
+        file=file,
+    )
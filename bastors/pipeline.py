@@ -0,0 +1,295 @@
+"""
+This module provides a pass manager that runs the phases of the transpiler,
+from lexing to emitting Rust, one after the other. Every pass is timed and
+can have its peak memory use measured with tracemalloc, and the result of a
+pass can be cached so that running the same source through the same passes
+again skips the work.
+"""
+from collections import namedtuple
+import hashlib
+import json
+import pickle
+import sys
+import time
+import tracemalloc
+import bastors.lex as lex
+import bastors.parse as parse
+from bastors.common_subexpressions import (
+    CommonSubexpressionStats,
+    eliminate_common_subexpressions,
+)
+from bastors.constant_folding import FoldingStats, fold_constants
+from bastors.counted_loops import CountedLoopStats, recognize_counted_loops
+from bastors.dead_store_elimination import DeadStoreStats, eliminate_dead_stores
+from bastors.goto_elimination import EliminationStats, eliminate_goto
+from bastors.inlining import INLINE_THRESHOLD, InlineStats, inline_gosubs
+from bastors.loop_optimizations import LoopStats, optimize_loops
+from bastors.outlining import OutlineStats, outline_main
+from bastors.pythonify import pythonify
+from bastors.rustify import rustify
+
+# A pass is a function taking the result of the previous pass. The key is
+# folded into the cache key and should describe any options of the pass.
+Pass = namedtuple("Pass", ["name", "func", "key", "cacheable"])
+
+# The time, in seconds, and peak memory, in bytes, spent on running a pass
+Timing = namedtuple("Timing", ["name", "time", "peak_memory", "cached"])
+
+# Buffer size used when emitting code straight to a file
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+
+class PassManager:
+    """
+    Runs registered passes in order, feeding each pass the result of the
+    previous one. After run() the timings of all passes are found in
+    timings, the result of every pass in results and the statistics that
+    passes chose to report in stats.
+
+    If a cache, any dict like object, is given the results of cacheable
+    passes are stored in it, pickled, keyed by a hash of the input and all
+    passes run so far.
+    """
+
+    def __init__(self, cache=None, measure_memory=False):
+        self._passes = list()
+        self._cache = cache
+        self._measure_memory = measure_memory
+        self.timings = list()
+        self.results = dict()
+        self.stats = dict()
+
+    def __index(self, name):
+        for index, pss in enumerate(self._passes):
+            if pss.name == name:
+                return index
+        raise KeyError("no pass named %s" % name)
+
+    def register(self, name, func, key="", cacheable=True, before=None, after=None):
+        """
+        Add a pass, last or before or after the pass with the given name.
+        Passes that mutate the result of an earlier pass should not be
+        cacheable unless the earlier pass is not either.
+        """
+        pss = Pass(name, func, key, cacheable)
+        if before is not None:
+            self._passes.insert(self.__index(before), pss)
+        elif after is not None:
+            self._passes.insert(self.__index(after) + 1, pss)
+        else:
+            self._passes.append(pss)
+
+    def passes(self):
+        """ Return the names of the registered passes, in order """
+        return [pss.name for pss in self._passes]
+
+    def __cache_get(self, key):
+        if self._cache is None or key not in self._cache:
+            return False, None
+        return True, pickle.loads(self._cache[key])
+
+    def __cache_put(self, key, value):
+        if self._cache is None:
+            return
+        try:
+            self._cache[key] = pickle.dumps(value)
+        except RecursionError:
+            pass  # too deeply nested to pickle, just do not cache it
+
+    def __run_pass(self, pss, value):
+        if self._measure_memory:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+
+        start = time.perf_counter()
+        value = pss.func(value)
+        elapsed = time.perf_counter() - start
+
+        peak = None
+        if self._measure_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            peak -= before
+        self.timings.append(Timing(pss.name, elapsed, peak, False))
+        return value
+
+    def run(self, value):
+        """ Run all passes on value and return the result of the last one """
+        self.timings = list()
+        self.results = dict()
+        key = hashlib.sha256(repr(value).encode("utf-8")).hexdigest()
+
+        started = False
+        if self._measure_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started = True
+        try:
+            for pss in self._passes:
+                key = hashlib.sha256(
+                    ("%s|%s|%s" % (key, pss.name, pss.key)).encode("utf-8")
+                ).hexdigest()
+
+                hit, cached = self.__cache_get(key) if pss.cacheable else (False, None)
+                if hit:
+                    value = cached
+                    self.timings.append(Timing(pss.name, 0.0, None, True))
+                else:
+                    value = self.__run_pass(pss, value)
+                    if pss.cacheable:
+                        self.__cache_put(key, value)
+                self.results[pss.name] = value
+        finally:
+            if started:
+                tracemalloc.stop()
+        return value
+
+    def timings_dict(self):
+        """ Return the timings of the last run as a structure for JSON """
+        return {
+            "passes": [timing._asdict() for timing in self.timings],
+            "total": sum(timing.time for timing in self.timings),
+        }
+
+    def dump_timings(self, file=sys.stdout):
+        """ Write the timings of the last run as JSON to file """
+        json.dump(self.timings_dict(), file, indent=2)
+        print(file=file)
+
+    def dump_stats(self, file=sys.stdout):
+        """ Write the statistics reported by passes as JSON to file """
+        json.dump(
+            {name: stats.as_dict() for name, stats in self.stats.items()},
+            file,
+            indent=2,
+        )
+        print(file=file)
+
+
+def emitter(out, options, python=False):
+    """
+    Return an emit pass writing Rust to out, a file or the path of one,
+    as it is generated. Without out the pass returns the code as a str.
+    The options are passed on to Rustify. With python the pass generates
+    Python instead, see pythonify.py.
+    """
+
+    def emit(program):
+        if python:
+            code = pythonify(program)
+            if out is None:
+                return code
+            if isinstance(out, str):
+                with open(out, "w") as file:
+                    file.write(code)
+            else:
+                out.write(code)
+            return None
+        if out is None:
+            return rustify(program, **options)
+        if isinstance(out, str):
+            with open(out, "w", buffering=OUTPUT_BUFFER_SIZE) as file:
+                return rustify(program, file, **options)
+        return rustify(program, out, **options)
+
+    return emit
+
+
+def transpiler(  # pylint: disable=R0913
+    stats=False,
+    max_growth=None,
+    cache=None,
+    measure_memory=False,
+    out=None,
+    rust_options=None,
+    opt_level=0,
+    inline_threshold=INLINE_THRESHOLD,
+    outline_size=None,
+    python=False,
+):
+    """
+    Return a PassManager with the passes turning TinyBasic source into
+    Rust: lex, parse, goto_elimination and emit. Further passes can be
+    registered around those. See emitter() for out and rust_options.
+
+    The opt_level selects optimizations:
+        0: none
+        1: inline GOSUB routines, keep variables used in main in locals,
+           fold constants, compute repeated expressions once and remove
+           dead stores
+        2: also turn counted loops into Rust range loops
+        3: also remove empty loops and hoist invariant expressions out of
+           loops
+    See inline_gosubs() for inline_threshold. With outline_size, regions
+    of main are moved into routines of their own, see outline_main().
+    With python the emit pass generates Python instead of Rust, see
+    pythonify.py, and the rust_options are not used.
+    """
+    rust_options = dict(rust_options or dict())
+    rust_options.setdefault("promote_locals", opt_level >= 1)
+    manager = PassManager(cache, measure_memory)
+    elimination_stats = EliminationStats() if stats else None
+    if elimination_stats is not None:
+        manager.stats["goto_elimination"] = elimination_stats
+
+    manager.register("lex", lambda source: lex.Lexer(source).get_tokens())
+    manager.register("parse", lambda tokens: parse.Parser(None).parse(tokens))
+    manager.register(
+        "goto_elimination",
+        lambda program: eliminate_goto(program, elimination_stats, max_growth),
+        key="max_growth=%s" % max_growth,
+        # Statistics are only collected when the pass really runs
+        cacheable=not stats,
+    )
+
+    def optimization(name, func, pass_stats, key=""):
+        """ Register a pass func(program, stats) reporting to pass_stats """
+        if stats:
+            manager.stats[name] = pass_stats
+        else:
+            pass_stats = None
+        manager.register(
+            name,
+            lambda program: func(program, pass_stats),
+            key=key,
+            cacheable=not stats,
+        )
+
+    if opt_level >= 1:
+        optimization(
+            "inlining",
+            lambda program, pass_stats: inline_gosubs(
+                program, inline_threshold, pass_stats
+            ),
+            InlineStats(),
+            key="inline_threshold=%d" % inline_threshold,
+        )
+        optimization("constant_folding", fold_constants, FoldingStats())
+    if opt_level >= 2:
+        optimization("counted_loops", recognize_counted_loops, CountedLoopStats())
+    if opt_level >= 3:
+        optimization("loop_optimizations", optimize_loops, LoopStats())
+    if opt_level >= 1:
+        optimization(
+            "common_subexpressions",
+            eliminate_common_subexpressions,
+            CommonSubexpressionStats(),
+        )
+        optimization(
+            "dead_store_elimination", eliminate_dead_stores, DeadStoreStats()
+        )
+    if outline_size:
+        optimization(
+            "outlining",
+            lambda program, pass_stats: outline_main(
+                program, outline_size, pass_stats
+            ),
+            OutlineStats(),
+            key="outline_size=%d" % outline_size,
+        )
+    manager.register(
+        "emit",
+        emitter(out, rust_options, python),
+        key="python" if python else repr(sorted(rust_options.items())),
+        # A source map is only filled in when the pass really runs
+        cacheable=out is None and rust_options.get("source_map") is None,
+    )
+    return manager
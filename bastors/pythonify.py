@@ -0,0 +1,475 @@
+"""
+Converts a TinyBasic program without GOTOs to Python code, and runs it.
+
+Pythonify generates the code from the output of GOTO elimination, and of
+the optimizations after it, the same structured program Rustify turns into
+Rust. The code is a module of its own, with the helpers it needs written in
+front of it, see PRELUDE:
+
+    * every context becomes a function, main() and f_100() for GOSUB 100
+    * variables used in main only are locals of main, the variables of the
+      routines are module globals
+    * a Loop becomes a while loop, its conditions tested at the end
+    * a Block becomes a try statement, left by raising the exception named
+      after it
+
+The Python behaves as the Rust built with rustc -O: i32 arithmetic wraps
+around, division rounds toward zero, FOR evaluates its bounds once, INPUT
+reads numbers separated by whitespace or commas, and the end of input, or
+END in a routine, ends the program. Dividing by zero raises
+ZeroDivisionError where the Rust panics. Python compiles at most 20 loops
+and try statements nested in one function, load() raises SyntaxError for
+programs nesting more.
+
+load() compiles the code, and keeps the code object under a hash of the
+code, so running the same program again skips the compiler. execute() runs
+a code object in a namespace of its own.
+
+    $ python3 -m bastors.pythonify program.bas < input
+"""
+import hashlib
+import sys
+import bastors.parse as parse
+from bastors.analysis import context_usage, function_effects, statement_usage
+from bastors.constant_folding import constant_value
+from bastors.counted_loops import exits_early
+from bastors.goto_elimination import eliminate_goto
+from bastors.lex import LexError
+from bastors.rustify import Declarations, VariableTypeEnum, print_text
+from bastors.visitor import Visitor
+
+# pylint: disable=C0116
+
+# Written in front of the code of every program. run() sets up the input
+# and output and calls main().
+PRELUDE = '''\
+import re
+import sys
+
+NUMBER = re.compile(r"[+-]?[0-9]+")
+
+
+class End(Exception):
+    """ Ends the program, from a routine or at the end of input """
+
+
+class Input:
+    """ Reads the numbers of INPUT, flushing the output first """
+
+    def __init__(self, file, out):
+        self.file = file
+        self.out = out
+        self.numbers = list()
+
+    def read(self):
+        self.out.flush()
+        while True:
+            if not self.numbers:
+                line = self.file.readline()
+                if not line:
+                    raise End()
+                self.numbers = line.replace(",", " ").split()
+                self.numbers.reverse()
+                continue
+            text = self.numbers.pop()
+            if NUMBER.fullmatch(text) and -(1 << 31) <= int(text) < (1 << 31):
+                return int(text)
+            self.numbers = list()
+            self.out.write("invalid number\\n")
+
+
+def div(left, right):
+    """ Divide as i32 does, rounding toward zero """
+    if right == 0:
+        raise ZeroDivisionError("attempt to divide by zero")
+    quotient = abs(left) // abs(right)
+    if (left < 0) != (right < 0):
+        return -quotient
+    if quotient >= 1 << 31:
+        raise OverflowError("attempt to divide with overflow")
+    return quotient
+
+'''
+
+# The code running a program, after all functions
+RUN_FUNCTION = '''\
+def run(stdin=None, stdout=None):
+    global INPUT, write%(globals)s
+    stdout = sys.stdout if stdout is None else stdout
+    INPUT = Input(sys.stdin if stdin is None else stdin, stdout)
+    write = stdout.write
+%(initial)s    try:
+        main()
+    except End:
+        pass
+    stdout.flush()
+
+
+if __name__ == "__main__":
+    run()
+'''
+
+# Code objects of the Python code compiled by load(), by hash of the code
+CODE_CACHE = dict()
+
+
+def wrap(code):
+    """ Return Python for the i32 value of the Python expression code """
+    return "((%s + 0x80000000 & 0xFFFFFFFF) - 0x80000000)" % code
+
+
+# pylint: disable=C0103
+class Pythonify(Visitor):
+    """ This class visits all nodes of a program without GOTOs and creates
+        Python code from it, see the module documentation. The code is
+        kept in memory until getvalue() is called. """
+
+    def __init__(self):
+        super().__init__()
+        self._lines = list()
+        self._indent = 0
+        self._context = "main"
+        self._types = dict()
+        self._locals = set()
+        self._globals = set()
+        self._effects = dict()
+        self._blocks = list()
+
+    def __add_line(self, indent, code):
+        self._lines.append("%s%s\n" % ("    " * indent, code))
+
+    def __in_function(self):
+        return self._context != "main"
+
+    def __exp(self, exp):
+        if isinstance(exp, parse.VariableExpression):
+            return exp.var
+
+        if isinstance(exp, parse.ArithmeticExpression):
+            if exp.left is None:  # unary expression
+                if exp.operator == "-":
+                    return wrap("-%s" % self.__exp(exp.right))
+                return self.__exp(exp.right)
+            if exp.operator == "/":
+                return "div(%s, %s)" % (self.__exp(exp.left), self.__exp(exp.right))
+            return wrap(
+                "%s %s %s"
+                % (self.__exp(exp.left), exp.operator, self.__exp(exp.right))
+            )
+
+        if isinstance(exp, parse.BooleanExpression):
+            return "(%s)" % self.__format_cond(exp.conditions)
+
+        if isinstance(exp, parse.ParenExpression):
+            return self.__exp(exp.exp)
+
+        value = int(exp)
+        return str(value) if value >= 0 else "(%d)" % value
+
+    def __format_cond(self, conditions):
+        """ Turns a list of conditions into a Python condition, and binds
+            tighter than or in Python as && does in Rust """
+        code = ""
+        for cond in conditions:
+            if cond.type == parse.ConditionEnum.AND:
+                code += " and "
+            elif cond.type == parse.ConditionEnum.OR:
+                code += " or "
+
+            if isinstance(cond, parse.VariableCondition):
+                code += cond.var
+            elif isinstance(cond, parse.NotVariableCondition):
+                code += "not %s" % cond.var
+            elif isinstance(cond, parse.TrueFalseCondition):
+                code += "True" if cond.value == "true" else "False"
+            else:
+                relop = {"<>": "!=", "=": "=="}.get(cond.operator, cond.operator)
+                code += "%s %s %s" % (
+                    self.__exp(cond.left),
+                    relop,
+                    self.__exp(cond.right),
+                )
+        return code
+
+    def __initial(self, var):
+        if self._types.get(var) == VariableTypeEnum.BOOLEAN:
+            return "False"
+        return "0"
+
+    def __body(self, statements):
+        """ Visit the statements of a block one level deeper, with pass
+            for a block generating nothing """
+        self._indent += 1
+        count = len(self._lines)
+        for statement in statements:
+            yield statement
+        if len(self._lines) == count:
+            self.__add_line(self._indent, "pass")
+        self._indent -= 1
+
+    def __output_function(self, statements, usage):
+        if self.__in_function():
+            self.__add_line(0, "def f_%s():" % self._context)
+            used = sorted(usage.reads | usage.writes)
+            if used:
+                self.__add_line(1, "global %s" % ", ".join(used))
+        else:
+            self.__add_line(0, "def main():")
+            shared = sorted((usage.reads | usage.writes) & self._globals)
+            if shared:
+                self.__add_line(1, "global %s" % ", ".join(shared))
+            for var in sorted(self._locals):
+                self.__add_line(1, "%s = %s" % (var, self.__initial(var)))
+        yield from self.__body(statements)
+        self.__add_line(0, "")
+        self.__add_line(0, "")
+
+    def getvalue(self):
+        """ Return the Python code """
+        return "".join(self._lines)
+
+    def visit_Program(self, node):
+        """ Collect the variables of the TinyBasic program, then generate
+            a function for every context, main first """
+        declarations = Declarations()
+        declarations.visit(node)
+        self._types = dict(declarations.variables)
+        self._effects = function_effects(node)
+        usage = context_usage(node)
+        for context, use in usage.items():
+            if context != "main":
+                self._globals |= use.reads | use.writes
+        main = usage.get("main", statement_usage(list()))
+        self._locals = (main.reads | main.writes) - self._globals
+
+        for line in PRELUDE.splitlines():
+            self.__add_line(0, line)
+        self.__add_line(0, "")
+        contexts = sorted(node.statements.keys(), key=lambda c: (c != "main", str(c)))
+        for context in contexts:
+            self._context = str(context)
+            statements = node.statements[context]
+            yield from self.__output_function(statements, usage[str(context)])
+
+        for name in self._blocks:
+            self.__add_line(0, "class Block_%s(Exception):" % name)
+            self.__add_line(1, "pass")
+            self.__add_line(0, "")
+            self.__add_line(0, "")
+        names = sorted(self._globals)
+        code = RUN_FUNCTION % {
+            "globals": "".join(", %s" % var for var in names),
+            "initial": "".join(
+                "    %s = %s\n" % (var, self.__initial(var)) for var in names
+            ),
+        }
+        for line in code.splitlines():
+            self.__add_line(0, line)
+
+    def visit_End(self, node):
+        # pylint: disable=unused-argument
+        if self.__in_function():
+            self.__add_line(self._indent, "raise End()")
+        else:
+            self.__add_line(self._indent, "return")
+
+    def visit_Return(self, node):
+        # pylint: disable=unused-argument
+        self.__add_line(self._indent, "return")
+
+    def visit_Let(self, node):
+        code = "%s = %s" % (node.lval.var, self.__exp(node.rval))
+        self.__add_line(self._indent, code)
+
+    def visit_Input(self, node):
+        for var in node.variables:
+            self.__add_line(self._indent, "%s = INPUT.read()" % var.var)
+
+    def visit_Print(self, node):
+        """ Generate one write() of the whole line, the literals in a
+            % format string and the expressions in its arguments """
+        texts = [print_text(exp) for exp in node.exp_list]
+        template = "".join(
+            "%d" if text is None else text.replace("%", "%%") for text in texts
+        )
+        arguments = [
+            self.__exp(exp) for exp, text in zip(node.exp_list, texts) if text is None
+        ]
+        if not arguments:
+            code = "write(%r)" % (template.replace("%%", "%") + "\n")
+        else:
+            code = "write(%r %% (%s,))" % (template + "\n", ", ".join(arguments))
+        self.__add_line(self._indent, code)
+
+    def visit_Gosub(self, node):
+        self.__add_line(self._indent, "f_%s()" % node.target_label)
+
+    def __loop_writes(self, statements):
+        """ Return the variables the body of a loop, or the routines it
+            calls, may write, or None if that is not known """
+        usage = statement_usage(statements)
+        writes = set(usage.writes)
+        for call in usage.calls:
+            effect = self._effects.get(call)
+            if effect is None:
+                return None
+            writes.update(effect.writes)
+        return writes
+
+    def __loop_bound(self, var, name, exp, writes):
+        """ Return Python for a bound of a For loop, evaluated once on
+            entry. Unless it is a constant, or a variable not in writes, it
+            goes into a local named after the loop variable. """
+        value = constant_value(exp)
+        if value is not None:
+            return self.__exp(str(value))
+        if (
+            isinstance(exp, parse.VariableExpression)
+            and writes is not None
+            and exp.var not in writes
+        ):
+            return exp.var
+        local = "%s_%s" % (var, name)
+        self.__add_line(self._indent, "%s = %s" % (local, self.__exp(exp)))
+        return local
+
+    def visit_For(self, node):
+        """ Generate Python from a For statement. The bounds and the step
+            are evaluated once, before the loop. Where the body leaves the
+            variable to the loop and the step is a constant, the variable
+            runs through a range; it starts one step before the start, so
+            that one step after the loop leaves the first value not run
+            with in it. Otherwise the variable is counted in a while loop. """
+        var = node.var.var
+        step = constant_value(node.step)
+        body_writes = self.__loop_writes(node.statements)
+        writes = None
+        if body_writes is not None:
+            writes = body_writes | {var}  # assigned before the loop
+        stop = self.__loop_bound(var, "stop", node.stop, writes)
+        if (
+            step is None
+            or step == 0
+            or body_writes is None
+            or var in body_writes
+            or exits_early(node.statements)
+        ):
+            if step is None:
+                step = self.__loop_bound(var, "step", node.step, writes)
+                relation = "(%s <= %s if %s >= 0 else %s >= %s)" % (
+                    var,
+                    stop,
+                    step,
+                    var,
+                    stop,
+                )
+            else:
+                relation = "%s %s %s" % (var, "<=" if step >= 0 else ">=", stop)
+                step = self.__exp(str(step))
+            self.__add_line(self._indent, "%s = %s" % (var, self.__exp(node.start)))
+            self.__add_line(self._indent, "while %s:" % relation)
+            yield from self.__body(node.statements)
+            code = "%s = %s" % (var, wrap("%s + %s" % (var, step)))
+            self.__add_line(self._indent + 1, code)
+            return
+
+        start = self.__loop_bound(var, "start", node.start, writes)
+        end = "%s %s 1" % (stop, "+" if step > 0 else "-")
+        before = "%s %s %d" % (start, "-" if step > 0 else "+", abs(step))
+        after = "%s %s %d" % (var, "+" if step > 0 else "-", abs(step))
+        self.__add_line(self._indent, "%s = %s" % (var, before))
+        code = "for %s in range(%s, %s, %d):" % (var, start, end, step)
+        self.__add_line(self._indent, code)
+        yield from self.__body(node.statements)
+        code = "%s = %s" % (var, wrap(after))
+        self.__add_line(self._indent, code)
+
+    def visit_Loop(self, node):
+        """ Generate a while loop, testing the conditions at its end """
+        self.__add_line(self._indent, "while True:")
+        self._indent += 1
+        count = len(self._lines)
+        for statement in node.statements:
+            yield statement
+        if node.conditions is not None:
+            code = "if not (%s):" % self.__format_cond(node.conditions)
+            self.__add_line(self._indent, code)
+            self.__add_line(self._indent + 1, "break")
+        elif len(self._lines) == count:
+            self.__add_line(self._indent, "pass")
+        self._indent -= 1
+
+    def visit_Break(self, node):
+        # pylint: disable=unused-argument
+        self.__add_line(self._indent, "break")
+
+    def visit_Block(self, node):
+        """ Generate a try statement from the statements of an inlined
+            GOSUB routine, a BlockBreak raises the exception ending it """
+        if node.name not in self._blocks:
+            self._blocks.append(node.name)
+        self.__add_line(self._indent, "try:")
+        yield from self.__body(node.statements)
+        self.__add_line(self._indent, "except Block_%s:" % node.name)
+        self.__add_line(self._indent + 1, "pass")
+
+    def visit_BlockBreak(self, node):
+        self.__add_line(self._indent, "raise Block_%s()" % node.name)
+
+    def visit_If(self, node):
+        code = "if %s:" % self.__format_cond(node.conditions)
+        self.__add_line(self._indent, code)
+        yield from self.__body(node.statements)
+
+
+def pythonify(program):
+    """ Return the Python code, a str, for a program without GOTOs """
+    python = Pythonify()
+    python.visit(program)
+    return python.getvalue()
+
+
+def load(code):
+    """ Return the code object of the Python code, compiled once for every
+        code, see CODE_CACHE """
+    key = hashlib.sha256(code.encode("utf-8")).hexdigest()
+    if key not in CODE_CACHE:
+        CODE_CACHE[key] = compile(code, "<bastors %s>" % key[:12], "exec")
+    return CODE_CACHE[key]
+
+
+def execute(code_object, stdin=None, stdout=None):
+    """ Run the program of a code object returned by load(), with INPUT
+        reading stdin and PRINT writing stdout, the ones of the process by
+        default """
+    namespace = {"__name__": "bastors_program"}
+    exec(code_object, namespace)  # pylint: disable=W0122
+    namespace["run"](stdin, stdout)
+
+
+def run(source, stdin=None, stdout=None):
+    """ Turn the TinyBasic source into Python, without optimizations, and
+        run it, see execute() """
+    program = eliminate_goto(parse.Parser(source).parse())
+    execute(load(pythonify(program)), stdin, stdout)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit()
+
+    try:
+        FP = open(sys.argv[1], "r")
+        PROGRAM = FP.read()
+    except IOError:
+        print("could not read file: %s" % sys.argv[1])
+        sys.exit()
+
+    try:
+        run(PROGRAM)
+    except parse.ParseError as err:
+        print("parse error: %s" % err)
+        sys.exit(1)
+    except LexError as err:
+        print("syntax error: %s [%d:%d]" % (err, err.line, err.col))
+        sys.exit(1)
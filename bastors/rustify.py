@@ -1,14 +1,143 @@
 """ Converts a basic TinyBasic program (bas) to rust code (rs) """
-from collections import defaultdict
-from collections import namedtuple
 from enum import Enum
+import io
+import os
 import bastors.parse as parse
+from bastors.analysis import (
+    UsageCollector,
+    expression_variables,
+    function_effects,
+    statement_usage,
+)
+from bastors.constant_folding import I32_MAX, I32_MIN, constant_value
+from bastors.counted_loops import exits_early, last_value
+from bastors.goto_elimination import Loop
+from bastors.instrument import COUNTS_VARIABLE
 from bastors.visitor import Visitor
 
 # pylint: disable=C0116
 
-# Represent a line of Rust code at an indentation level
-Line = namedtuple("Line", ["indent", "code"])
+# Number of lines collected before they are written out in one go
+LINE_BATCH = 1024
+
+# Reads the next number from stdin, reusing the line buffer held in State.
+# Numbers are separated by whitespace or commas, so that one line can hold
+# the values of several variables. Ends the program at end of input.
+INPUT_FUNCTION = """\
+fn input_i32(state: &mut State) -> i32 {
+    let separator = |c: u8| c.is_ascii_whitespace() || c == b',';
+    loop {
+        let line = &state.input;
+        let mut pos = state.input_pos;
+        while pos < line.len() && separator(line[pos]) {
+            pos += 1;
+        }
+        if pos == line.len() {
+            state.input.clear();
+            state.input_pos = 0;
+            if state.stdin.read_until(b'\\n', &mut state.input).unwrap() == 0 {
+                %(exit)s
+            }
+            continue;
+        }
+        let start = pos;
+        while pos < line.len() && !separator(line[pos]) {
+            pos += 1;
+        }
+        state.input_pos = pos;
+        let number = std::str::from_utf8(&line[start..pos]).ok();
+        match number.and_then(|n| n.parse::<i32>().ok()) {
+            Some(i) => return i,
+            None => {
+                state.input_pos = state.input.len();
+                %(invalid)s
+            }
+        }
+    }
+}
+"""
+
+# Writes the decimal digits of an i32 to the buffered output two at a time,
+# without going through the formatting machinery of std::fmt
+WRITE_I32_FUNCTION = """\
+const DIGIT_PAIRS: &[u8; 200] = b"%s";
+
+fn write_i32(out: &mut impl Write, n: i32) {
+    let mut digits = [0u8; 11];
+    let mut pos = digits.len();
+    let mut value = n.unsigned_abs();
+    while value >= 100 {
+        let pair = (value %% 100) as usize * 2;
+        value /= 100;
+        pos -= 2;
+        digits[pos..pos + 2].copy_from_slice(&DIGIT_PAIRS[pair..pair + 2]);
+    }
+    if value >= 10 {
+        let pair = value as usize * 2;
+        pos -= 2;
+        digits[pos..pos + 2].copy_from_slice(&DIGIT_PAIRS[pair..pair + 2]);
+    } else {
+        pos -= 1;
+        digits[pos] = b'0' + value as u8;
+    }
+    if n < 0 {
+        pos -= 1;
+        digits[pos] = b'-';
+    }
+    out.write_all(&digits[pos..]).unwrap();
+}
+""" % "".join("%02d" % pair for pair in range(100))
+
+# The counters of an instrumented program and the function writing them
+# out, one line per counter with its name, see instrument.py
+COUNTS_FUNCTION = """\
+static mut COUNTS: [u64; %(count)d] = [0; %(count)d];
+static COUNTER_NAMES: [&str; %(count)d] = [
+%(names)s];
+
+fn dump_counts() {
+    let path = std::env::var("%(variable)s").unwrap_or_else(|_| String::from("%(path)s"));
+    let mut text = String::new();
+    for (index, name) in COUNTER_NAMES.iter().enumerate() {
+        let count = unsafe { COUNTS[index] };
+        text.push_str(&format!("{} {}\\n", name, count));
+    }
+    if let Err(err) = std::fs::write(&path, text) {
+        eprintln!("could not write {}: {}", path, err);
+    }
+}
+"""
+
+
+def print_text(exp):
+    """ Return the text a PRINT writes for a string or integer literal, or
+        None if exp is not one """
+    if isinstance(exp, str) and exp.startswith('"'):
+        return exp[1:-1]
+    value = constant_value(exp)
+    if value is not None and I32_MIN <= value <= I32_MAX:
+        return str(value)
+    return None
+
+
+def format_string(text):
+    """ Return text as the contents of a Rust format string """
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace(
+        "{", "{{"
+    ).replace("}", "}}").replace("\n", "\\n")
+
+
+def byte_string(text):
+    """ Return text as a Rust byte string literal """
+    escaped = list()
+    for byte in text.encode("utf-8"):
+        if byte == 0x0A:
+            escaped.append("\\n")
+        elif byte in b'"\\' or not 0x20 <= byte < 0x7F:
+            escaped.append("\\x%02x" % byte)
+        else:
+            escaped.append(chr(byte))
+    return 'b"%s"' % "".join(escaped)
 
 
 class VariableTypeEnum(Enum):
@@ -17,27 +146,211 @@ class VariableTypeEnum(Enum):
     INTEGER = 0
     BOOLEAN = 1
 
+
 # pylint: disable=C0103
+class Declarations(Visitor):
+    """ This class visit all nodes of the statement tree to collect what
+        needs to be declared ahead of the code: the variables that go into
+        the State struct and the crates to use. """
+
+    def __init__(self, buffered_output=False):
+        super().__init__(self.__default)
+        self.variables = set()
+        self.crates = set()
+        self.input = False
+        self.print_integers = False
+        self._context = "main"
+        if buffered_output:
+            self.crates.update(["std::io", "std::io::Write"])
+
+    def __default(self, node):
+        pass
+
+    def visit_Program(self, node):
+        for context in node.statements.keys():
+            self._context = str(context)
+            for statement in node.statements[context]:
+                yield statement
+
+    def visit_End(self, node):
+        # pylint: disable=unused-argument
+        if self._context != "main":
+            self.crates.add("std::process")
+
+    def visit_Input(self, node):
+        self.crates.update(["std::io", "std::io::BufRead", "std::process"])
+        self.input = True
+        for var in node.variables:
+            self.variables.add((var.var, VariableTypeEnum.INTEGER))
+
+    def visit_Print(self, node):
+        if any(print_text(exp) is None for exp in node.exp_list):
+            self.print_integers = True
+
+    def visit_Let(self, node):
+        if isinstance(node.rval, parse.BooleanExpression):
+            self.variables.add((node.lval.var, VariableTypeEnum.BOOLEAN))
+        else:
+            self.variables.add((node.lval.var, VariableTypeEnum.INTEGER))
+
+    def visit_For(self, node):
+        self.variables.add((node.var.var, VariableTypeEnum.INTEGER))
+        for statement in node.statements:
+            yield statement
+
+    def visit_Loop(self, node):
+        for statement in node.statements:
+            yield statement
+
+    def visit_Block(self, node):
+        for statement in node.statements:
+            yield statement
+
+    def visit_If(self, node):
+        for statement in node.statements:
+            yield statement
+
+
+class DeclaredUsage(UsageCollector):
+    """ This class collects the Usage of statements as the generated Rust
+        has it. The variable of a range loop whose value after the loop is
+        not used is a local of the Rust for loop only, see range_loop, the
+        function telling whether a For statement becomes a range loop. An
+        Input only writes the variables whose value is used. """
+
+    def __init__(self, range_loop):
+        super().__init__()
+        self._range_loop = range_loop
+
+    def visit_For(self, node):
+        if node.value_used or not self._range_loop(node):
+            yield from super().visit_For(node)
+            return
+
+        for exp in (node.start, node.stop, node.step):
+            expression_variables(exp, self.reads)
+        outer = (self.reads, self.writes)
+        self.reads, self.writes = set(), set()
+        for statement in node.statements:
+            yield statement
+        self.reads.discard(node.var.var)
+        outer[0].update(self.reads)
+        outer[1].update(self.writes)
+        self.reads, self.writes = outer
+
+    def visit_Input(self, node):
+        values_used = node.values_used or [True] * len(node.variables)
+        for var, used in zip(node.variables, values_used):
+            if used:
+                self.writes.add(var.var)
+
+
 class Rustify(Visitor):
     """ This class visit all nodes of the statement tree generated by
         the Parse class and create Rust code from it. It follows some kind
-        of visitor pattern, the base clase is defined in visitor.py """
+        of visitor pattern, the base clase is defined in visitor.py
+
+        Visiting a Program first collects the declarations (see the
+        Declarations class) and then writes the Rust code to out as it is
+        generated, one function at a time. Without out the code is kept in
+        memory until output() is called.
+
+        With buffered_output all PRINT statements write to one buffered
+        writer over a locked stdout, kept in State. It is flushed before
+        INPUT and before the process exits.
+
+        INPUT reads through one locked stdin and one line buffer kept in
+        State, see INPUT_FUNCTION.
+
+        With promote_locals the variables used in main are kept in local
+        variables of main, which the compiler can keep in registers. Only
+        the variables used by GOSUB routines go into State, and main copies
+        them to State before, and back after, calls of routines using them.
+
+        With module the program is generated as a Rust module of that
+        name, with a public main function, to be bundled with others into
+        one binary, see bundle.py.
+
+        With module_dir every routine is written to a file of its own in
+        that directory instead, as a module of the same name, f_100.rs for
+        f_100. The main file declares the modules, and rustc finds them
+        when module_dir is the directory of the main file.
 
-    def __init__(self):
+        With source_map, a SourceMap, every line generated for a statement
+        is mapped to the position of the statement in the TinyBasic source,
+        see source_map.py. Statements made by the passes, without a
+        position, are mapped to the statement following them in their
+        block, or else the statement holding the block. With line_comments
+        the code of every statement starts with a comment naming its label,
+        or line, in the TinyBasic source.
+
+        With instrument, the path of a file, the program counts how many
+        times every statement with a position runs, in a static array, and
+        writes the counts to that file when it exits, or the file named by
+        the BASTORS_COUNTS environment variable. Where the code of one
+        statement follows another of the same position it is counted once.
+        Every If and every Loop with conditions also counts how often its
+        branch was taken, the body of the if run or the loop run again, and
+        not taken. See instrument.py for reading the counts.
+        """
+
+    def __init__(  # pylint: disable=R0913
+        self,
+        out=None,
+        buffered_output=False,
+        promote_locals=False,
+        module=None,
+        module_dir=None,
+        source_map=None,
+        line_comments=False,
+        instrument=None,
+    ):
         super().__init__()
-        self._code = defaultdict(list)
+        if module is not None and module_dir is not None:
+            raise ValueError("a module cannot have routines in files")
+        self._out = out if out is not None else io.StringIO()
+        self._buffered_output = buffered_output
+        self._promote_locals = promote_locals
+        self._module = module
+        self._module_indent = 0
+        self._module_dir = module_dir
+        self._source_map = source_map
+        self._line_comments = line_comments
+        name = getattr(out, "name", None)
+        if isinstance(name, str) and name.endswith(".rs"):
+            self._file_name = os.path.basename(name)
+        else:
+            self._file_name = "main.rs"
+        self._line = 0  # lines written to the current file
+        self._position = None  # of the statement generated
+        self._commented = None  # position of the last line comment
+        self._instrument = instrument
+        self._counters = list()  # names of the counters of instrument
+        self._counted = None  # position of the last statement counter
+        self._locals = dict()
+        self._effects = dict()
+        self._buffered = out is None
+        self._lines = list()
         self._variables = set()
         self._loop_variables = set()
         self._crates = set()
+        self._input = False
+        self._print_integers = False
+        # (indent, text, position) of PRINTs not yet written
+        self._pending_text = None
         self._indent = 1
         self._context = "main"
 
+    def __var(self, var):
+        if var in self._loop_variables:
+            return var
+        if var in self._locals and not self.__in_function():
+            return var
+        return "state.%s" % var
+
     def __exp(self, exp):
         if isinstance(exp, parse.VariableExpression):
-            if exp.var in self._loop_variables:
-                return exp.var
-
-            return "state.%s" % exp.var
+            return self.__var(exp.var)
 
         if isinstance(exp, parse.ArithmeticExpression):
             if exp.left is None:  # unary expression
@@ -72,11 +385,11 @@ class Rustify(Visitor):
                 code += " || "
 
             if isinstance(cond, parse.VariableCondition):
-                code += "state.%s" % cond.var
+                code += self.__var(cond.var)
                 continue
 
             if isinstance(cond, parse.NotVariableCondition):
-                code += "!state.%s" % cond.var
+                code += "!%s" % self.__var(cond.var)
                 continue
 
             if isinstance(cond, parse.TrueFalseCondition):
@@ -98,117 +411,500 @@ class Rustify(Visitor):
         return self._context != "main"
 
     def __add_line(self, indent, code):
-        self._code[self._context].append(Line(indent, code))
+        if self._pending_text is not None:
+            self.__write_pending_text()
+        if code:
+            indent += self._module_indent
+        position = self._position
+        if position is not None:
+            if self._line_comments and code and position != self._commented:
+                self._commented = position
+                if position.label is not None:
+                    comment = "// L%s" % position.label
+                else:
+                    comment = "// line %d" % position.line
+                self.__append(indent, comment)
+            if self._source_map is not None:
+                self._source_map.add(self._file_name, self._line + 1, position)
+        self.__append(indent, code)
+
+    def __count(self, position, kind):
+        """ Count how often the code generated next runs, as kind of the
+            statement at position """
+        name = "%d %d %s %s" % (
+            position.line,
+            position.col,
+            "-" if position.label is None else position.label,
+            kind,
+        )
+        code = "unsafe { COUNTS[%d] += 1; }" % len(self._counters)
+        self._counters.append(name)
+        self.__add_line(self._indent, code)
 
-    def __output_state(self, file):
-        if len(self._variables) > 0:
-            print("struct State {", file=file)
+    def __count_statement(self, position):
+        if self._instrument is None or position is None:
+            return
+        if position != self._counted:
+            self._counted = position
+            self.__count(position, "statement")
+
+    def __output_counts(self):
+        if self._instrument is None:
+            return
+        names = "".join('    "%s",\n' % name for name in self._counters)
+        code = COUNTS_FUNCTION % {
+            "count": len(self._counters),
+            "names": names,
+            "variable": COUNTS_VARIABLE,
+            "path": self._instrument.replace("\\", "\\\\").replace('"', '\\"'),
+        }
+        for line in code.splitlines():
+            self.__add_line(0, line)
+        self.__add_line(0, "")
+
+    def __append(self, indent, code):
+        line = "%s%s\n" % ("    " * indent, code)
+        self._line += line.count("\n")
+        self._lines.append(line)
+        if len(self._lines) >= LINE_BATCH:
+            self.__flush()
+
+    def __flush(self):
+        self._out.write("".join(self._lines))
+        self._lines = list()
+
+    def __output_crates(self):
+        for crate in sorted(self._crates):
+            self.__add_line(0, "use %s;" % crate)
+
+    def __has_state(self):
+        return len(self._variables) > 0 or self._buffered_output or self._input
+
+    def __output_state(self):
+        if self.__has_state():
+            self.__add_line(0, "struct State {")
             for var, var_type in sorted(self._variables):
                 if var_type == VariableTypeEnum.BOOLEAN:
                     type_rep = "bool"
                 else:
                     type_rep = "i32"
-                print("%s%s: %s," % (" " * 4, var, type_rep), file=file)
-            print("}\n", file=file)
+                self.__add_line(1, "%s: %s," % (var, type_rep))
+            if self._buffered_output:
+                self.__add_line(1, "out: io::BufWriter<io::StdoutLock<'static>>,")
+            if self._input:
+                self.__add_line(1, "stdin: io::StdinLock<'static>,")
+                self.__add_line(1, "input: Vec<u8>,")
+                self.__add_line(1, "input_pos: usize,")
+            self.__add_line(0, "}\n")
+
+    def __output_input_function(self):
+        if not self._input:
+            return
+        exit_code = "process::exit(0x0);"
+        if self._buffered_output:
+            exit_code = "state.out.flush().unwrap();\n%s%s" % (" " * 16, exit_code)
+            invalid = 'writeln!(state.out, "invalid number").unwrap();\n%s%s' % (
+                " " * 16,
+                "state.out.flush().unwrap();",
+            )
+        else:
+            invalid = 'println!("invalid number");'
+        if self._instrument is not None:
+            exit_code = "dump_counts();\n%s%s" % (" " * 16, exit_code)
+        code = INPUT_FUNCTION % {"exit": exit_code, "invalid": invalid}
+        for line in code.splitlines():
+            self.__add_line(0, line)
+        self.__add_line(0, "")
+
+    def __output_print_function(self):
+        if not (self._buffered_output and self._print_integers):
+            return
+        for line in WRITE_I32_FUNCTION.splitlines():
+            self.__add_line(0, line)
+        self.__add_line(0, "")
 
-            decl = list()
-            decl.append(Line(self._indent, "let mut state: State = State {"))
+    def __output_state_decl(self):
+        if self.__has_state():
+            self.__add_line(self._indent, "let mut state: State = State {")
             for var, var_type in sorted(self._variables):
                 if var_type == VariableTypeEnum.BOOLEAN:
-                    decl.append(Line(self._indent + 1, "%s: false," % var))
+                    self.__add_line(self._indent + 1, "%s: false," % var)
                 else:
-                    decl.append(Line(self._indent + 1, "%s: 0," % var))
-            decl.append(Line(self._indent, "};"))
-            self._code["main"] = decl + self._code["main"]
-
-    def __output_function(self, name, code, argument, file):
-        print("fn %s(%s) {" % (name, argument), file=file)
-        for line in code:
-            print("%s%s" % (line.indent * (" " * 4), line.code), file=file)
-        print("}\n", file=file)
-
-    def __output_functions(self, file):
-        for fn in sorted(self._code.keys()):
-            if fn != "main":
-                name = "f_%s" % fn
-                argument = "state: &mut State" if len(self._variables) > 0 else None
+                    self.__add_line(self._indent + 1, "%s: 0," % var)
+            if self._buffered_output:
+                self.__add_line(
+                    self._indent + 1,
+                    "out: io::BufWriter::with_capacity(1 << 16, io::stdout().lock()),",
+                )
+            if self._input:
+                self.__add_line(self._indent + 1, "stdin: io::stdin().lock(),")
+                self.__add_line(self._indent + 1, "input: Vec::new(),")
+                self.__add_line(self._indent + 1, "input_pos: 0,")
+            self.__add_line(self._indent, "};")
+
+        for var, var_type in sorted(self._locals.items()):
+            # Variables start out zeroed, rustc warns where the program
+            # assigns them before reading them
+            self.__add_line(self._indent, "#[allow(unused_assignments)]")
+            if var_type == VariableTypeEnum.BOOLEAN:
+                self.__add_line(self._indent, "let mut %s: bool = false;" % var)
             else:
-                name = fn
-                argument = None
+                self.__add_line(self._indent, "let mut %s: i32 = 0;" % var)
 
-            self.__output_function(name, self._code[fn], argument or str(), file)
+    def __declared_usage(self, node):
+        """ Return the Usage of every context as the generated Rust has it,
+            see DeclaredUsage """
+        usage = dict()
+        for context, statements in node.statements.items():
+            collector = DeclaredUsage(lambda loop: self.__range_step(loop) is not None)
+            for statement in statements:
+                collector.visit(statement)
+            usage[str(context)] = collector.usage()
+        return usage
 
-    def __output_crates(self, file):
-        for crate in sorted(self._crates):
-            print("use %s;" % crate, file=file)
+    def __promote_locals(self, usage, variables):
+        """ Split the variables between locals of main and State """
+        types = dict(variables)
+        main = usage.get("main")
+        self._locals = dict()
+        if main is not None:
+            for var in main.reads | main.writes:
+                self._locals[var] = types.get(var, VariableTypeEnum.INTEGER)
+
+        in_functions = set()
+        for context, use in usage.items():
+            if context != "main":
+                in_functions |= use.reads | use.writes
+        return {
+            (var, types.get(var, VariableTypeEnum.INTEGER)) for var in in_functions
+        }
+
+    def __output_modules(self, contexts):
+        if self._module_dir is None:
+            return
+        names = ["f_%s" % context for context in contexts if str(context) != "main"]
+        for name in names:
+            self.__add_line(0, "mod %s;" % name)
+        for name in names:
+            self.__add_line(0, "use %s::%s;" % (name, name))
+        if names:
+            self.__add_line(0, "")
+
+    def __statements(self, statements):
+        """ Visit statements, with the lines generated for each mapped to
+            its position, see the class documentation """
+        outer = self._position
+        self._counted = None
+        positions = list()
+        following = outer
+        for statement in reversed(statements):
+            position = getattr(statement, "position", None)
+            if position is not None:
+                following = position
+            positions.append(following)
+        for statement, position in zip(statements, reversed(positions)):
+            self._position = position
+            if not isinstance(statement, Loop):
+                self.__count_statement(getattr(statement, "position", None))
+            yield statement
+        self._position = outer
+
+    def __output_function(self, statements):
+        public = ""
+        main_out = None
+        if self.__in_function():
+            name = "f_%s" % self._context
+            argument = "state: &mut State" if self.__has_state() else ""
+            if self._module_dir is not None:
+                self.__flush()
+                main_out = (self._out, self._file_name, self._line)
+                self._file_name = name + ".rs"
+                self._line = 0
+                path = os.path.join(self._module_dir, self._file_name)
+                self._out = open(path, "w", buffering=1 << 16)
+                self.__add_line(0, "use super::*;\n")
+                public = "pub(super) "
+        else:
+            name = "main"
+            argument = ""
+            if self._module is not None:
+                public = "pub "
+
+        self.__add_line(0, "%sfn %s(%s) {" % (public, name, argument))
+        if not self.__in_function():
+            self.__output_state_decl()
+        yield from self.__statements(statements)
+        if self._instrument is not None and not self.__in_function():
+            if not statements or not isinstance(statements[-1], parse.End):
+                self.__add_line(self._indent, "dump_counts();")
+        self.__add_line(0, "}\n")
+        self.__flush()
+        if main_out is not None:
+            self._out.close()
+            self._out, self._file_name, self._line = main_out
 
     def output(self, file):
-        """ Writes Rust code to the file specified in argument """
-        self.__output_crates(file)
-        self.__output_state(file)
-        self.__output_functions(file)
+        """ Writes Rust code to the file specified in argument, when the
+            code was generated in memory """
+        if self._buffered:
+            file.write(self._out.getvalue())
+
+    def getvalue(self):
+        """ Return the Rust code, when it was generated in memory """
+        return self._out.getvalue()
 
     def visit_Program(self, node):
-        """ Iterate through all statements in the TinyBasic program and
-            generate Rust"""
-        for context in node.statements.keys():
+        """ Collect the declarations of the TinyBasic program, then iterate
+            through all statements and generate Rust. Functions are
+            generated in the same order as their names sort. """
+        declarations = Declarations(self._buffered_output)
+        declarations.visit(node)
+        self._effects = function_effects(node)
+        usage = self.__declared_usage(node)
+        declared = set()
+        for use in usage.values():
+            declared |= use.reads | use.writes
+        self._variables = {
+            (var, var_type)
+            for var, var_type in declarations.variables
+            if var in declared
+        }
+        if self._promote_locals:
+            self._variables = self.__promote_locals(usage, self._variables)
+        self._crates = declarations.crates
+        self._input = declarations.input
+        self._print_integers = declarations.print_integers
+
+        if self._module is not None:
+            self.__add_line(0, "pub mod %s {" % self._module)
+            self._module_indent = 1
+        self.__output_crates()
+        self.__output_modules(sorted(node.statements.keys(), key=str))
+        self.__output_state()
+        self.__output_input_function()
+        self.__output_print_function()
+        for context in sorted(node.statements.keys(), key=str):
             self._context = str(context)
-            for statement in node.statements[context]:
-                self.visit(statement)
+            yield from self.__output_function(node.statements[context])
+        self.__output_counts()
+        if self._module is not None:
+            self._module_indent = 0
+            self.__add_line(0, "}\n")
+        self.__flush()
 
     def visit_End(self, node):
         # pylint: disable=unused-argument
+        if self._instrument is not None:
+            self.__add_line(self._indent, "dump_counts();")
         if self._context == "main":
+            # Returning drops State, which flushes the buffered output
             self.__add_line(self._indent, "return;")
         else:
-            self._crates.add("std::process")
+            if self._buffered_output:
+                self.__add_line(self._indent, "state.out.flush().unwrap();")
             self.__add_line(self._indent, "process::exit(0x0);")
 
-    def visit_For(self, node):
-        self._loop_variables.add(node.var.var)
+    def __loop_writes(self, statements):
+        """ Return the variables the body of a loop, or the routines it
+            calls, may write, or None if that is not known """
+        usage = statement_usage(statements)
+        writes = set(usage.writes)
+        for call in usage.calls:
+            effect = self._effects.get(call)
+            if effect is None:
+                return None
+            writes.update(effect.writes)
+        return writes
 
-        for_line = "for %s in (%d..%d).step_by(%d) {" % (node.var.var,
-                                                        node.start,
-                                                        node.stop,
-                                                        node.step)
-        self.__add_line(self._indent, for_line)
+    def __loop_reads(self, statements):
+        """ Return the variables the body of a loop, or the routines it
+            calls, may read, or None if that is not known """
+        usage = statement_usage(statements)
+        reads = set(usage.reads)
+        for call in usage.calls:
+            effect = self._effects.get(call)
+            if effect is None:
+                return None
+            reads.update(effect.reads)
+        return reads
 
+    def __loop_bound(self, var, name, exp, writes):
+        """ Return Rust for a bound of a For loop, evaluated once on entry.
+            Unless it is a constant, or a variable not in writes, the ones
+            the loop may assign, it goes into a local named after the loop
+            variable. """
+        value = constant_value(exp)
+        if value is not None:
+            return str(value)
+        if (
+            isinstance(exp, parse.VariableExpression)
+            and writes is not None
+            and exp.var not in writes
+        ):
+            return self.__exp(exp)
+        local = "%s_%s" % (var, name)
+        self.__add_line(self._indent, "let %s = %s;" % (local, self.__exp(exp)))
+        return local
+
+    def __range_for(self, node, step, writes):
+        """ Generate a Rust range loop from a For statement whose body
+            leaves the loop variable alone, then assign the variable the
+            value it has after the loop """
+        var = node.var.var
+        start = self.__loop_bound(var, "start", node.start, writes)
+        stop = self.__loop_bound(var, "stop", node.stop, writes)
+
+        # Exclusive ranges optimize better, use them where the end is known
+        # not to overflow
+        first, last = (start, stop) if step > 0 else (stop, start)
+        end_value = constant_value(node.stop if step > 0 else node.start)
+        if end_value is not None and end_value < I32_MAX:
+            iterator = "%s..%d" % (first, end_value + 1)
+        else:
+            iterator = "%s..=%s" % (first, last)
+        if step < 0:
+            iterator = "(%s).rev()" % iterator
+        if abs(step) != 1:
+            if step > 0:
+                iterator = "(%s)" % iterator
+            iterator = "%s.step_by(%d)" % (iterator, abs(step))
+        # rustc warns about a loop variable the body does not read
+        reads = self.__loop_reads(node.statements)
+        binding = var if reads is None or var in reads else "_"
+        self.__add_line(self._indent, "for %s in %s {" % (binding, iterator))
+
+        self._loop_variables.add(var)
         self._indent += 1
-        for stmt in node.statements:
-            self.visit(stmt)
+        yield from self.__statements(node.statements)
         self._indent -= 1
-
+        self._loop_variables.discard(var)
         self.__add_line(self._indent, "}")
-        self._loop_variables.clear()
 
+        # After the loop the variable holds the first value it did not run
+        # with, or the start if it did not run at all
+        start_value = constant_value(node.start)
+        stop_value = constant_value(node.stop)
+        sign, relop = ("+", ">=") if step > 0 else ("-", "<=")
+        if start_value is not None and stop_value is not None:
+            if stop_value >= start_value if step > 0 else stop_value <= start_value:
+                final = str(last_value(start_value, stop_value, step) + step)
+            else:
+                final = start
+        else:
+            if abs(step) == 1:
+                after = "%s %s 1" % (stop, sign)
+            else:
+                distance = (stop, start) if step > 0 else (start, stop)
+                after = "%s %s ((%s - %s) / %d + 1) * %d" % (
+                    (start, sign) + distance + (abs(step), abs(step))
+                )
+            final = "if %s %s %s { %s } else { %s }" % (
+                stop,
+                relop,
+                start,
+                after,
+                start,
+            )
+        if node.value_used:
+            self.__add_line(self._indent, "%s = %s;" % (self.__var(var), final))
 
-    def visit_Input(self, node):
-        self._crates.add("std::io")
+    def __counting_for(self, node, step, writes):
+        """ Generate a Rust while loop from a For statement, counting the
+            loop variable itself. Used where the body assigns the variable
+            or leaves the loop early, and where the step is not a nonzero
+            constant. """
+        var = node.var.var
+        counter = self.__var(var)
+        if writes is not None:
+            writes = writes | {var}  # assigned the start before the loop
+        stop = self.__loop_bound(var, "stop", node.stop, writes)
+        if step is None:
+            step = self.__loop_bound(var, "step", node.step, writes)
+            relation = "if %s >= 0 { %s <= %s } else { %s >= %s }" % (
+                step,
+                counter,
+                stop,
+                counter,
+                stop,
+            )
+        else:
+            relation = "%s %s %s" % (counter, "<=" if step >= 0 else ">=", stop)
+            step = "%s %d" % ("+" if step >= 0 else "-", abs(step))
+        self.__add_line(self._indent, "%s = %s;" % (counter, self.__exp(node.start)))
+        self.__add_line(self._indent, "while %s {" % relation)
 
-        for var in node.variables:
-            self._variables.add((var.var, VariableTypeEnum.INTEGER))
-            self.__add_line(self._indent, "loop {")
-            self.__add_line(self._indent + 1, "let mut input = String::new();")
+        self._indent += 1
+        yield from self.__statements(node.statements)
+        if not step.startswith(("+", "-")):
+            step = "+ %s" % step
+        self.__add_line(self._indent, "%s = %s %s;" % (counter, counter, step))
+        self._indent -= 1
+        self.__add_line(self._indent, "}")
 
-            self.__add_line(
-                self._indent + 1, "io::stdin().read_line(&mut input).unwrap();"
-            )
-            self.__add_line(self._indent + 1, "match input.trim().parse::<i32>() {")
-            self.__add_line(self._indent + 2, "Ok(i) => {")
-            self.__add_line(self._indent + 3, "%s = i;" % self.__exp(var))
-            self.__add_line(self._indent + 3, "break;")
-            self.__add_line(self._indent + 2, "}")
-            self.__add_line(self._indent + 2, 'Err(_) => println!("invalid number"),')
-            self.__add_line(self._indent + 1, "}")
-            self.__add_line(self._indent, "}")
+    def __range_step(self, node):
+        """ Return the step of a For statement generated as a range loop, or
+            None if the loop variable is counted by the generated code """
+        step = constant_value(node.step)
+        writes = self.__loop_writes(node.statements)
+        if (
+            step is None
+            or step == 0
+            or writes is None
+            or node.var.var in writes
+            or exits_early(node.statements)
+        ):
+            return None
+        return step
+
+    def visit_For(self, node):
+        """ Generate Rust from a For statement. The bounds and the step are
+            evaluated once, before the loop. Where the body leaves the loop
+            variable to the loop the variable is a Rust local counted by a
+            range loop, otherwise the variable itself is counted. """
+        step = self.__range_step(node)
+        writes = self.__loop_writes(node.statements)
+        if step is None:
+            yield from self.__counting_for(node, constant_value(node.step), writes)
+        else:
+            yield from self.__range_for(node, step, writes)
+
+    def visit_Input(self, node):
+        if self._buffered_output:
+            self.__add_line(self._indent, "state.out.flush().unwrap();")
+        argument = "state" if self.__in_function() else "&mut state"
+        values_used = node.values_used or [True] * len(node.variables)
+        for var, used in zip(node.variables, values_used):
+            if used:
+                code = "%s = input_i32(%s);" % (self.__exp(var), argument)
+            else:
+                code = "input_i32(%s);" % argument
+            self.__add_line(self._indent, code)
 
     def visit_Gosub(self, node):
-        if self.__in_function():
+        if not self.__has_state():
+            argument = ""
+        elif self.__in_function():
             argument = "state"
         else:
             argument = "&mut state"
+
+        spilled = set()
+        reloaded = list()
+        effects = self._effects.get(str(node.target_label))
+        if effects is not None:
+            # The locals of range loops are only read by the routine
+            spilled.update(self._loop_variables & effects.reads)
+            if not self.__in_function() and self._locals:
+                used = effects.reads | effects.writes
+                spilled.update(var for var in self._locals if var in used)
+                reloaded = sorted(var for var in self._locals if var in effects.writes)
+
+        for var in sorted(spilled):
+            self.__add_line(self._indent, "state.%s = %s;" % (var, var))
         code = "f_%s(%s);" % (node.target_label, argument)
         self.__add_line(self._indent, code)
+        for var in reloaded:
+            self.__add_line(self._indent, "%s = state.%s;" % (var, var))
 
     def visit_Return(self, node):
         # pylint: disable=unused-argument
@@ -216,35 +912,96 @@ class Rustify(Visitor):
 
     def visit_Let(self, let_node):
         """ Generate Rust from TinyBasic LET """
-        if isinstance(let_node.rval, parse.BooleanExpression):
-            self._variables.add((let_node.lval.var, VariableTypeEnum.BOOLEAN))
-        else:
-            self._variables.add((let_node.lval.var, VariableTypeEnum.INTEGER))
-
         code = "%s = %s;" % (self.__exp(let_node.lval), self.__exp(let_node.rval),)
         self.__add_line(self._indent, code)
 
+    def __write_pending_text(self):
+        """ Write the text of the literal-only PRINTs just visited in one
+            go, with print! or one write_all of a static byte string """
+        indent, text, position = self._pending_text
+        self._pending_text = None
+        current, self._position = self._position, position
+        if self._buffered_output:
+            code = "state.out.write_all(%s).unwrap();" % byte_string(text)
+        elif text == "\n":
+            code = "println!();"
+        elif text.count("\n") == 1:
+            code = 'println!("%s");' % format_string(text[:-1])
+        else:
+            code = 'print!("%s");' % format_string(text)
+        self.__add_line(indent, code)
+        self._position = current
+
     def visit_Print(self, print_node):
-        """ Generate Rust from TinyBasic PRINT, by ways of the println! macro
-        and the: println!()"{}", arguments), notation. """
-        num = len(print_node.exp_list)
-        arguments = ", ".join([self.__exp(exp) for exp in print_node.exp_list])
-        code = 'println!("%s", %s);' % ("{}" * num, arguments)
+        """ Generate Rust from TinyBasic PRINT. String and integer literals
+        are written as part of the text around the expressions. PRINTs of
+        nothing but literals are collected until something else is
+        generated and then written together.
+
+        Without buffered output the text goes into the format string of a
+        println! macro. With buffered output it is written to the buffered
+        writer as byte strings, and the expressions are written by
+        write_i32(), see WRITE_I32_FUNCTION. """
+        texts = [print_text(exp) for exp in print_node.exp_list]
+        if None not in texts:
+            text = "".join(texts) + "\n"
+            position = self._position
+            if self._pending_text is not None:
+                # Whatever was generated since would have written it
+                text = self._pending_text[1] + text
+                position = self._pending_text[2]
+            self._pending_text = (self._indent, text, position)
+            return
+
+        if not self._buffered_output:
+            template = "".join(
+                "{}" if text is None else format_string(text) for text in texts
+            )
+            arguments = [
+                self.__exp(exp)
+                for exp, text in zip(print_node.exp_list, texts)
+                if text is None
+            ]
+            code = 'println!("%s", %s);' % (template, ", ".join(arguments))
+            self.__add_line(self._indent, code)
+            return
+
+        text = ""
+        for exp, exp_text in zip(print_node.exp_list, texts):
+            if exp_text is not None:
+                text += exp_text
+                continue
+            if text:
+                code = "state.out.write_all(%s).unwrap();" % byte_string(text)
+                self.__add_line(self._indent, code)
+                text = ""
+            self.__add_line(
+                self._indent, "write_i32(&mut state.out, %s);" % self.__exp(exp)
+            )
+        code = "state.out.write_all(%s).unwrap();" % byte_string(text + "\n")
         self.__add_line(self._indent, code)
 
     def visit_Loop(self, loop_node):
         """ Generate Rust code from a Loop statement """
         self.__add_line(self._indent, "loop {")
         self._indent = self._indent + 1
-        for statement in loop_node.statements:
-            self.visit(statement)
+        yield from self.__statements(loop_node.statements)
 
         if loop_node.conditions is not None:
+            position = loop_node.position if self._instrument is not None else None
+            self._counted = None
+            self.__count_statement(position)
             conditions = parse.invert_conditions(loop_node.conditions)
             code = "if %s {" % self.__format_cond(conditions)
             self.__add_line(self._indent, code)
+            if position is not None:
+                self._indent += 1
+                self.__count(position, "not-taken")
+                self._indent -= 1
             self.__add_line(self._indent + 1, "break;")
             self.__add_line(self._indent, "}")
+            if position is not None:
+                self.__count(position, "taken")
 
         self._indent = self._indent - 1
         self.__add_line(self._indent, "}")
@@ -253,15 +1010,54 @@ class Rustify(Visitor):
         # pylint: disable=unused-argument
         self.__add_line(self._indent, "break;")
 
+    def visit_Block(self, node):
+        """ Generate a labeled block from the statements of an inlined
+            GOSUB routine """
+        self.__add_line(self._indent, "'%s: {" % node.name)
+        self._indent += 1
+        yield from self.__statements(node.statements)
+        self._indent -= 1
+        self.__add_line(self._indent, "}")
+
+    def visit_BlockBreak(self, node):
+        self.__add_line(self._indent, "break '%s;" % node.name)
+
     def visit_If(self, if_node):
         """ Generate Rust code from TInyBasic IF statement, the grunt work is
             performed by the self.__format_cond() function. """
+        position = if_node.position if self._instrument is not None else None
         code = "if %s {" % self.__format_cond(if_node.conditions)
         self.__add_line(self._indent, code)
 
         self._indent = self._indent + 1
-        for statement in if_node.statements:
-            self.visit(statement)
+        if position is not None:
+            self.__count(position, "taken")
+        yield from self.__statements(if_node.statements)
         self._indent = self._indent - 1
 
+        if position is not None:
+            self.__add_line(self._indent, "} else {")
+            self._indent += 1
+            self.__count(position, "not-taken")
+            self._indent -= 1
         self.__add_line(self._indent, "}")
+
+
+def rustify(program, out=None, **options):
+    """ Generate Rust code for a program without GOTOs. The code is written
+        to out if given, otherwise it is returned as a str. Options are
+        passed on to Rustify. """
+    rust = Rustify(out, **options)
+    rust.visit(program)
+    if out is None:
+        return rust.getvalue()
+    return None
+
+
+def rustify_bytes(program, encoding="utf-8", **options):
+    """ Like rustify(), but return the Rust code as bytes """
+    buffer = io.BytesIO()
+    text = io.TextIOWrapper(buffer, encoding=encoding, write_through=True)
+    rustify(program, text, **options)
+    text.flush()
+    return buffer.getvalue()
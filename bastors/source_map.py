@@ -0,0 +1,139 @@
+"""
+This module provides source maps of the generated Rust, mapping the lines
+of every file written back to the TinyBasic statements they were generated
+from, see the Position of parse.py. Rustify fills in a SourceMap with its
+source_map option, and --source-map writes it as JSON:
+
+    {"files": {"main.rs": [[rust_line, label, line, col], ...], ...}}
+
+Run as a script it turns the output of a profiler into hot spots of the
+TinyBasic program, the samples of every line of it summed up:
+
+    $ python3 bastors.py --build --source-map prog.map -o prog prog.bas
+    $ perf record ./prog < input
+    $ perf report --stdio --no-children --sort srcline > report.txt
+    $ python3 -m bastors.source_map prog.map report.txt prog.bas
+
+Any text naming Rust lines as file.rs:line can be read, one sample per
+line of text, or as many as the percentage or count the line starts with,
+as in perf report, or the output of perf script -F srcline.
+"""
+from collections import namedtuple
+import json
+import os
+import re
+import sys
+from bastors.parse import Position
+
+# A Rust line, with the percentage or count of samples in front of it
+SAMPLE = re.compile(r"^\s*(?:(\d+(?:\.\d+)?)%?\s+)?.*?([\w.-]+\.rs):(\d+)")
+
+HotSpot = namedtuple("HotSpot", ["line", "label", "samples"])
+
+
+class SourceMap:
+    """ Maps the lines of generated Rust files, by name, to the Position
+        of the TinyBasic statement each was generated from """
+
+    def __init__(self):
+        self.files = dict()
+
+    def add(self, file_name, rust_line, position):
+        """ Map line rust_line of the file file_name to position """
+        self.files.setdefault(file_name, dict())[rust_line] = position
+
+    def lookup(self, file_name, rust_line):
+        """ Return the Position line rust_line of the file named file_name,
+            or with that base name, was generated from, or None """
+        lines = self.files.get(file_name)
+        if lines is None:
+            lines = self.files.get(os.path.basename(file_name), dict())
+        return lines.get(rust_line)
+
+    def as_dict(self):
+        """ Return the source map as a structure suitable for JSON """
+        files = dict()
+        for name, lines in self.files.items():
+            files[name] = [
+                [rust_line] + list(position)
+                for rust_line, position in sorted(lines.items())
+            ]
+        return {"files": files}
+
+    def dump(self, file=sys.stdout):
+        """ Write the source map as JSON to file """
+        json.dump(self.as_dict(), file)
+        print(file=file)
+
+    @classmethod
+    def load(cls, file):
+        """ Return the source map read from the JSON in file """
+        source_map = cls()
+        for name, lines in json.load(file)["files"].items():
+            for rust_line, label, line, col in lines:
+                source_map.add(name, rust_line, Position(label, line, col))
+        return source_map
+
+
+def hot_spots(source_map, lines):
+    """ Return the HotSpots, hottest first, of the profiler output lines,
+        with their samples summed up per line of TinyBasic. Samples in Rust
+        lines not in source_map are left out. """
+    samples = dict()
+    for text in lines:
+        match = SAMPLE.match(text)
+        if match is None:
+            continue
+        weight, file_name, rust_line = match.groups()
+        position = source_map.lookup(file_name, int(rust_line))
+        if position is None:
+            continue
+        key = (position.line, position.label)
+        samples[key] = samples.get(key, 0.0) + float(weight or 1)
+    spots = [HotSpot(line, label, count) for (line, label), count in samples.items()]
+    return sorted(spots, key=lambda spot: (-spot.samples, spot.line))
+
+
+def report(spots, source=None, file=sys.stdout):
+    """ Write the hot spots as a table to file, with the text of the lines
+        of source, the TinyBasic program, if given """
+    texts = source.splitlines() if source is not None else list()
+    total = sum(spot.samples for spot in spots) or 1
+    print("%8s %7s %6s %6s" % ("samples", "share", "line", "label"), file=file)
+    for spot in spots:
+        text = texts[spot.line - 1].strip() if spot.line <= len(texts) else ""
+        print(
+            "%8g %6.1f%% %6d %6s  %s"
+            % (
+                spot.samples,
+                100.0 * spot.samples / total,
+                spot.line,
+                "" if spot.label is None else spot.label,
+                text,
+            ),
+            file=file,
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: %s MAP [PROFILE [SOURCE]]" % sys.argv[0])
+        sys.exit()
+
+    try:
+        with open(sys.argv[1], "r") as FP:
+            SOURCE_MAP = SourceMap.load(FP)
+        if len(sys.argv) > 2:
+            with open(sys.argv[2], "r") as FP:
+                PROFILE = FP.readlines()
+        else:
+            PROFILE = sys.stdin.readlines()
+        SOURCE = None
+        if len(sys.argv) > 3:
+            with open(sys.argv[3], "r") as FP:
+                SOURCE = FP.read()
+    except IOError as err:
+        print("could not read file: %s" % err.filename)
+        sys.exit(1)
+
+    report(hot_spots(SOURCE_MAP, PROFILE), SOURCE)
@@ -2,6 +2,7 @@
 This module provides a base class for implementing a Visitor pattern style
 travelsal of the statements tree.
 """
+import types
 
 
 class Visitor:
@@ -9,21 +10,119 @@ class Visitor:
         structure returned from the Parse module.
 
         Need to implement visit_Program, visit_If, visit_Print, ...
+
+        A visit method for a node with child statements can be written as a
+        generator that yields the children instead of calling visit() on
+        them. The children are then visited from an explicit stack, so that
+        deeply nested programs do not exhaust the Python stack. The value of
+        the yield expression is whatever the visit method of the child
+        returned.
         """
 
+    # Maps a node type to the visit method of the class, or None if the
+    # class has none. Every subclass gets a table of its own, filled in
+    # the first time a node type is visited.
+    _dispatch = dict()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = dict()
+
     def __init__(self, defaultfunc=None):
         self._defaultfunc = defaultfunc
 
+    def __call_visitor(self, node):
+        node_type = type(node)
+        try:
+            method = self._dispatch[node_type]
+        except KeyError:
+            method = getattr(type(self), "visit_" + node_type.__name__, None)
+            self._dispatch[node_type] = method
+
+        if method is None:
+            if self._defaultfunc is None:
+                self._defaultfunc = self.generic
+            return self._defaultfunc(node)
+        return method(self, node)
+
     def visit(self, node):
         """ This method will find the __name__ of the node passed to it and
             call the visit method for that node. If node is a Let namedtuple
-            then visit_Let() will be called. """
-        method = "visit_" + type(node).__name__
-        if self._defaultfunc is None:
-            self._defaultfunc = self.generic
-        visitor = getattr(self, method, self._defaultfunc)
-        return visitor(node)
+            then visit_Let() will be called. The method is looked up once per
+            node type and visitor class. """
+        result = self.__call_visitor(node)
+        if not isinstance(result, types.GeneratorType):
+            return result
+        return self.run(result)
+
+    def run(self, generator):
+        """ Run a generator written like the visit methods to its end,
+            visiting the nodes it yields, and return its value. """
+        stack = [generator]
+        value = None
+        while stack:
+            try:
+                child = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                continue
+
+            value = self.__call_visitor(child)
+            if isinstance(value, types.GeneratorType):
+                stack.append(value)
+                value = None
+        return value
 
     def generic(self, node):  # pylint: disable=R0201
         """ Called when no visit method found for node. """
         raise Exception("no visit method defined for %s" % type(node).__name__)
+
+
+class Transformer(Visitor):
+    """ Basis for passes rewriting the statements tree. Every visit method
+        returns the list of statements that replaces the node it visited,
+        an empty list removes it. Nodes without a visit method are kept as
+        they are. The blocks of If, Loop, For and Block statements are
+        rewritten through visit_block(), which subclasses can override. The
+        tree passed in is not modified.
+        """
+
+    def __init__(self):
+        super().__init__(lambda node: [node])
+        self._context = "main"
+
+    def transform(self, statements):
+        """ Rewrite a block of statements and return the new block """
+        return self.run(self.visit_block(statements))
+
+    def visit_block(self, statements):
+        """ Rewrite a block of statements, meant to be called with yield
+            from by visit methods. """
+        block = list()
+        for statement in statements:
+            block.extend((yield statement))
+        return block
+
+    def visit_Program(self, node):
+        statements = dict()
+        for context, block in node.statements.items():
+            self._context = context
+            statements[context] = yield from self.visit_block(block)
+        return node._replace(statements=statements)
+
+    def visit_If(self, node):
+        statements = yield from self.visit_block(node.statements)
+        return [node._replace(statements=statements)]
+
+    def visit_Loop(self, node):
+        statements = yield from self.visit_block(node.statements)
+        return [node._replace(statements=statements)]
+
+    def visit_For(self, node):
+        statements = yield from self.visit_block(node.statements)
+        return [node._replace(statements=statements)]
+
+    def visit_Block(self, node):
+        statements = yield from self.visit_block(node.statements)
+        return [node._replace(statements=statements)]
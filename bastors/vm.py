@@ -0,0 +1,446 @@
+"""
+This module runs TinyBasic programs directly in Python, without rustc. A
+parsed Program, GOTOs and GOSUBs as they are, is compiled into bytecode, a
+flat array of integers: every instruction is an opcode followed by its
+operands. The VM runs it with one dispatch loop over an operand stack.
+
+The code of main comes first and ends the program, then every GOSUB
+routine follows, returning at its end. GOTO and GOSUB jump to the address
+of the labeled statement. Variables live in numbered slots, the hidden
+bounds of FOR loops too.
+
+Programs behave as the Rust generated for them, built with rustc -O: i32
+arithmetic that wraps around, division rounding toward zero, FOR bounds
+and steps evaluated once before the loop, INPUT reading numbers separated
+by whitespace or commas and ending the program at the end of input, and
+PRINT writing its items back to back. Dividing by zero, or the smallest
+i32 by -1, raises a VMError where the Rust panics.
+
+    $ python3 -m bastors.vm program.bas < input
+"""
+from array import array
+from collections import namedtuple
+import re
+import sys
+import bastors.parse as parse
+from bastors.lex import LexError
+from bastors.constant_folding import I32_MAX, I32_MIN
+from bastors.visitor import Visitor
+
+# The opcodes, followed by the operands listed
+PUSH = 0  # value
+LOAD = 1  # slot
+STORE = 2  # slot
+ADD = 3
+SUB = 4
+MUL = 5
+DIV = 6
+NEG = 7
+JUMP = 8  # address
+JUMP_LT = 9  # address, taken if the second value popped < the first
+JUMP_LE = 10  # address
+JUMP_GT = 11  # address
+JUMP_GE = 12  # address
+JUMP_EQ = 13  # address
+JUMP_NE = 14  # address
+GOSUB = 15  # address
+RETURN = 16
+END = 17
+PRINT_TEXT = 18  # index of the text
+PRINT_VALUE = 19
+PRINT_NEWLINE = 20
+INPUT = 21  # slot
+FOR_TEST = 22  # slot, slot of the stop, slot of the step, address to leave
+FOR_STEP = 23  # slot, slot of the step
+
+OPERANDS = {
+    PUSH: 1,
+    LOAD: 1,
+    STORE: 1,
+    JUMP: 1,
+    JUMP_LT: 1,
+    JUMP_LE: 1,
+    JUMP_GT: 1,
+    JUMP_GE: 1,
+    JUMP_EQ: 1,
+    JUMP_NE: 1,
+    GOSUB: 1,
+    PRINT_TEXT: 1,
+    INPUT: 1,
+    FOR_TEST: 4,
+    FOR_STEP: 2,
+}
+
+# The jump taken for a relation, and for the relation not holding
+JUMPS = {
+    "<": (JUMP_LT, JUMP_GE),
+    "<=": (JUMP_LE, JUMP_GT),
+    ">": (JUMP_GT, JUMP_LE),
+    ">=": (JUMP_GE, JUMP_LT),
+    "=": (JUMP_EQ, JUMP_NE),
+    "<>": (JUMP_NE, JUMP_EQ),
+}
+
+ARITHMETIC = {"+": ADD, "-": SUB, "*": MUL, "/": DIV}
+
+# A number in the input, as the Rust parses an i32
+NUMBER = re.compile(r"[+-]?[0-9]+")
+
+# The bytecode of a program: the code, an array of integers, the texts
+# PRINT writes and the names of the variable slots
+Bytecode = namedtuple("Bytecode", ["code", "texts", "slots"])
+
+
+class VMError(Exception):
+    """ Raised when a program cannot be compiled or fails when run """
+
+
+# pylint: disable=C0103,C0116
+class Compiler(Visitor):
+    """ This class visits the statements of a Program, GOTOs included, and
+        generates the bytecode running it, see the module documentation """
+
+    def __init__(self):
+        super().__init__()
+        self._code = list()
+        self._texts = list()
+        self._slots = dict()
+        self._labels = dict()
+        self._fixups = list()  # (position of an address operand, label)
+
+    def __emit(self, opcode, *operands):
+        self._code.append(opcode)
+        self._code.extend(operands)
+
+    def __slot(self, name):
+        return self._slots.setdefault(name, len(self._slots))
+
+    def __jump(self, opcode, label):
+        """ Emit a jump to the statement of label, filled in at the end """
+        self.__emit(opcode, 0)
+        self._fixups.append((len(self._code) - 1, label))
+
+    def __exp(self, exp):
+        if isinstance(exp, parse.VariableExpression):
+            self.__emit(LOAD, self.__slot(exp.var))
+        elif isinstance(exp, parse.ParenExpression):
+            self.__exp(exp.exp)
+        elif isinstance(exp, parse.ArithmeticExpression):
+            if exp.left is None:
+                self.__exp(exp.right)
+                if exp.operator == "-":
+                    self.__emit(NEG)
+            else:
+                self.__exp(exp.left)
+                self.__exp(exp.right)
+                self.__emit(ARITHMETIC[exp.operator])
+        else:
+            value = int(exp)
+            if not I32_MIN <= value <= I32_MAX:
+                raise VMError("number out of range: %s" % exp)
+            self.__emit(PUSH, value)
+
+    def __conditions(self, conditions):
+        """ Emit the conditions of an IF, jumping past the code emitted
+            next if they do not hold. Return the positions of the address
+            operands of those jumps. && binds tighter than ||, as in Rust,
+            and both stop at the first condition deciding the outcome. """
+        groups = list()
+        for cond in conditions:
+            if cond.type != parse.ConditionEnum.AND or not groups:
+                groups.append(list())
+            groups[-1].append(cond)
+
+        to_then = list()
+        to_else = list()
+        for index, group in enumerate(groups):
+            last_group = index == len(groups) - 1
+            to_next = list()
+            for position, cond in enumerate(group):
+                if not isinstance(cond, parse.Condition):
+                    raise VMError("cannot run a %s" % type(cond).__name__)
+                self.__exp(cond.left)
+                self.__exp(cond.right)
+                holds, fails = JUMPS[cond.operator]
+                if position == len(group) - 1 and not last_group:
+                    self.__emit(holds, 0)
+                    to_then.append(len(self._code) - 1)
+                else:
+                    self.__emit(fails, 0)
+                    (to_else if last_group else to_next).append(len(self._code) - 1)
+            for operand in to_next:
+                self._code[operand] = len(self._code)
+        for operand in to_then:
+            self._code[operand] = len(self._code)
+        return to_else
+
+    def __label(self, node):
+        if node.label is not None:
+            self._labels.setdefault(node.label, len(self._code))
+
+    def visit_Program(self, node):
+        routines = [context for context in node.statements if context != "main"]
+        for context in ["main"] + routines:
+            if context != "main":
+                self._labels.setdefault(context, len(self._code))
+            for statement in node.statements.get(context, list()):
+                yield statement
+            self.__emit(END if context == "main" else RETURN)
+
+        code = array("q", self._code)
+        for operand, label in self._fixups:
+            if label not in self._labels:
+                raise VMError("no line %s to go to" % label)
+            code[operand] = self._labels[label]
+        names = sorted(self._slots, key=self._slots.get)
+        return Bytecode(code, self._texts, names)
+
+    def visit_Let(self, node):
+        self.__label(node)
+        self.__exp(node.rval)
+        self.__emit(STORE, self.__slot(node.lval.var))
+
+    def visit_Print(self, node):
+        self.__label(node)
+        for exp in node.exp_list:
+            if isinstance(exp, str) and exp.startswith('"'):
+                self._texts.append(exp[1:-1])
+                self.__emit(PRINT_TEXT, len(self._texts) - 1)
+            else:
+                self.__exp(exp)
+                self.__emit(PRINT_VALUE)
+        self.__emit(PRINT_NEWLINE)
+
+    def visit_Input(self, node):
+        self.__label(node)
+        for var in node.variables:
+            self.__emit(INPUT, self.__slot(var.var))
+
+    def visit_Goto(self, node):
+        self.__label(node)
+        self.__jump(JUMP, node.target_label)
+
+    def visit_Gosub(self, node):
+        self.__label(node)
+        self.__jump(GOSUB, node.target_label)
+
+    def visit_Return(self, node):
+        self.__label(node)
+        self.__emit(RETURN)
+
+    def visit_End(self, node):
+        self.__label(node)
+        self.__emit(END)
+
+    def visit_If(self, node):
+        self.__label(node)
+        to_else = self.__conditions(node.conditions)
+        for statement in node.statements:
+            yield statement
+        for operand in to_else:
+            self._code[operand] = len(self._code)
+
+    def visit_For(self, node):
+        self.__label(node)
+        var = self.__slot(node.var.var)
+        stop = self.__slot("%s stop %d" % (node.var.var, len(self._code)))
+        step = self.__slot("%s step %d" % (node.var.var, len(self._code)))
+        # The bounds read the variable as it was before the loop
+        self.__exp(node.stop)
+        self.__emit(STORE, stop)
+        self.__exp(node.step)
+        self.__emit(STORE, step)
+        self.__exp(node.start)
+        self.__emit(STORE, var)
+        test = len(self._code)
+        self.__emit(FOR_TEST, var, stop, step, 0)
+        for statement in node.statements:
+            yield statement
+        self.__emit(FOR_STEP, var, step)
+        self.__emit(JUMP, test)
+        self._code[test + 4] = len(self._code)
+
+    def visit_Next(self, node):
+        self.__label(node)
+
+
+def compile_program(program):
+    """ Return the Bytecode running program, a parsed Program """
+    return Compiler().visit(program)
+
+
+def wrap(value):
+    """ Return value wrapped around to an i32 """
+    return ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+class Input:
+    """ Reads the numbers of INPUT from a text file, as INPUT_FUNCTION of
+        rustify.py does """
+
+    def __init__(self, file, out):
+        self._file = file
+        self._out = out
+        self._numbers = list()
+
+    def read(self):
+        """ Return the next number, or None at the end of the input """
+        while True:
+            if not self._numbers:
+                line = self._file.readline()
+                if not line:
+                    return None
+                self._numbers = line.replace(",", " ").split()
+                self._numbers.reverse()
+                continue
+            text = self._numbers.pop()
+            if NUMBER.fullmatch(text) and I32_MIN <= int(text) <= I32_MAX:
+                return int(text)
+            # The rest of the line is dropped
+            self._numbers = list()
+            self._out.write("invalid number\n")
+
+
+def execute(bytecode, stdin=None, stdout=None):  # pylint: disable=R0912,R0915
+    """ Run bytecode with INPUT reading stdin and PRINT writing stdout, the
+        ones of the process by default. Return the number of instructions
+        run. """
+    stdin = sys.stdin if stdin is None else stdin
+    stdout = sys.stdout if stdout is None else stdout
+    code = bytecode.code
+    texts = bytecode.texts
+    slots = [0] * len(bytecode.slots)
+    stack = list()
+    push = stack.append
+    pop = stack.pop
+    calls = list()
+    write = stdout.write
+    numbers = Input(stdin, stdout)
+    pc = 0
+    executed = 0
+
+    while True:
+        executed += 1
+        op = code[pc]
+        if op == LOAD:
+            push(slots[code[pc + 1]])
+            pc += 2
+        elif op == PUSH:
+            push(code[pc + 1])
+            pc += 2
+        elif op == STORE:
+            slots[code[pc + 1]] = pop()
+            pc += 2
+        elif op == ADD:
+            right = pop()
+            stack[-1] = wrap(stack[-1] + right)
+            pc += 1
+        elif op == SUB:
+            right = pop()
+            stack[-1] = wrap(stack[-1] - right)
+            pc += 1
+        elif op == MUL:
+            right = pop()
+            stack[-1] = wrap(stack[-1] * right)
+            pc += 1
+        elif op == DIV:
+            right = pop()
+            left = stack[-1]
+            if right == 0:
+                raise VMError("attempt to divide by zero")
+            if left == I32_MIN and right == -1:
+                raise VMError("attempt to divide with overflow")
+            quotient = abs(left) // abs(right)
+            stack[-1] = quotient if (left < 0) == (right < 0) else -quotient
+            pc += 1
+        elif JUMP <= op <= JUMP_NE:
+            if op == JUMP:
+                pc = code[pc + 1]
+                continue
+            right = pop()
+            left = pop()
+            if op == JUMP_LT:
+                taken = left < right
+            elif op == JUMP_LE:
+                taken = left <= right
+            elif op == JUMP_GT:
+                taken = left > right
+            elif op == JUMP_GE:
+                taken = left >= right
+            elif op == JUMP_EQ:
+                taken = left == right
+            else:
+                taken = left != right
+            pc = code[pc + 1] if taken else pc + 2
+        elif op == FOR_TEST:
+            value = slots[code[pc + 1]]
+            stop = slots[code[pc + 2]]
+            if value > stop if slots[code[pc + 3]] >= 0 else value < stop:
+                pc = code[pc + 4]
+            else:
+                pc += 5
+        elif op == FOR_STEP:
+            var = code[pc + 1]
+            slots[var] = wrap(slots[var] + slots[code[pc + 2]])
+            pc += 3
+        elif op == NEG:
+            stack[-1] = wrap(-stack[-1])
+            pc += 1
+        elif op == PRINT_VALUE:
+            write(str(pop()))
+            pc += 1
+        elif op == PRINT_TEXT:
+            write(texts[code[pc + 1]])
+            pc += 2
+        elif op == PRINT_NEWLINE:
+            write("\n")
+            pc += 1
+        elif op == GOSUB:
+            calls.append(pc + 2)
+            pc = code[pc + 1]
+        elif op == RETURN:
+            if not calls:
+                break  # RETURN in main ends it
+            pc = calls.pop()
+        elif op == INPUT:
+            stdout.flush()
+            value = numbers.read()
+            if value is None:
+                break
+            slots[code[pc + 1]] = value
+            pc += 2
+        else:
+            break  # END
+    stdout.flush()
+    return executed
+
+
+def run(source, stdin=None, stdout=None):
+    """ Parse, compile and run the TinyBasic source, see execute(). Return
+        the number of instructions run. """
+    program = parse.Parser(source).parse()
+    return execute(compile_program(program), stdin, stdout)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit()
+
+    try:
+        FP = open(sys.argv[1], "r")
+        PROGRAM = FP.read()
+    except IOError:
+        print("could not read file: %s" % sys.argv[1])
+        sys.exit()
+
+    try:
+        run(PROGRAM)
+    except parse.ParseError as err:
+        print("parse error: %s" % err)
+        sys.exit(1)
+    except LexError as err:
+        print("syntax error: %s [%d:%d]" % (err, err.line, err.col))
+        sys.exit(1)
+    except VMError as err:
+        print(err, file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Measure how long building the programs in programs/ takes with --build,
+first with an empty binary cache and then again with the binaries cached.
+Requires rustc.
+
+    python3 benchmarks/build_cache.py
+"""
+import glob
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+from bastors.build import BinaryCache, build_rustc
+from bastors.pipeline import transpiler
+
+
+def main():
+    pattern = os.path.join(os.path.dirname(__file__), "..", "programs", "*.bas")
+    sources = dict()
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as file:
+            sources[os.path.basename(path)] = transpiler(opt_level=2).run(file.read())
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = BinaryCache(os.path.join(directory, "cache"))
+        totals = [0.0, 0.0]
+        for name, rust in sources.items():
+            binary = os.path.join(directory, name[:-4])
+            cold = build_rustc(rust, binary, cache)
+            warm = build_rustc(rust, binary, cache)
+            assert not cold.cached and warm.cached
+            totals[0] += cold.time
+            totals[1] += warm.time
+            print("%-22s %7.3fs %7.3fs" % (name, cold.time, warm.time))
+        print("%-22s %7.3fs %7.3fs" % ("total", totals[0], totals[1]))
+
+
+if __name__ == "__main__":
+    main()
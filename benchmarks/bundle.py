@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Measure the time to build a corpus of programs with rustc -O, one binary
+per program, against one --bundle binary holding them all. The corpus is
+the programs in programs/, each included copies times under names of its
+own. Requires rustc.
+
+    python3 benchmarks/bundle.py [copies]
+"""
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+from bastors.bundle import bundle, program_name
+from bastors.pipeline import transpiler
+
+
+def rustc(rust, directory, name):
+    path = os.path.join(directory, name + ".rs")
+    with open(path, "w") as out:
+        out.write(rust)
+    subprocess.check_call(
+        ["rustc", "-O", "-o", path[:-3], path], stderr=subprocess.DEVNULL
+    )
+    return path[:-3]
+
+
+def main(copies):
+    pattern = os.path.join(os.path.dirname(__file__), "..", "programs", "*.bas")
+    sources = list()
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as file:
+            source = file.read()
+        for copy in range(copies):
+            sources.append(("%s-%d" % (program_name(path), copy), source))
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        size = 0
+        for name, source in sources:
+            binary = rustc(transpiler(opt_level=2).run(source), directory, name)
+            size += os.path.getsize(binary)
+        separate = time.perf_counter() - start
+        print(
+            "%d binaries    %7.2fs %10d bytes" % (len(sources), separate, size)
+        )
+
+        start = time.perf_counter()
+        binary = rustc(bundle(sources, opt_level=2), directory, "bundle")
+        bundled = time.perf_counter() - start
+        print(
+            "one bundle     %7.2fs %10d bytes"
+            % (bundled, os.path.getsize(binary))
+        )
+        print("speedup        %7.1fx" % (separate / bundled))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
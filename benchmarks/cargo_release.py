@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Measure a CPU bound program built the way the README shows, with plain
+rustc, with rustc -O, and as a Cargo project written by --cargo, with and
+without target-cpu=native. Prints the run time and the size of every
+binary. Requires rustc and cargo, but no network.
+
+    python3 benchmarks/cargo_release.py [rounds]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+from bastors.cargo import binary_path, create_project
+from bastors.pipeline import transpiler
+
+# Sums the lengths of the Collatz sequences of 1 to N, K times over
+SOURCE = """
+    INPUT N, K
+10  LET S=0
+    LET I=1
+20  LET X=I
+30  IF X=1 THEN GOTO 50
+    LET H=X/2
+    LET S=S+1
+    IF X-H*2=0 THEN GOTO 40
+    LET X=3*X+1
+    GOTO 30
+40  LET X=H
+    GOTO 30
+50  LET I=I+1
+    IF I<=N THEN GOTO 20
+    LET K=K-1
+    IF K>0 THEN GOTO 10
+    PRINT S
+"""
+
+
+def rustc(rust, directory, name, flags):
+    path = os.path.join(directory, name + ".rs")
+    with open(path, "w") as out:
+        out.write(rust)
+    binary = os.path.join(directory, name)
+    subprocess.check_call(
+        ["rustc"] + flags + ["-o", binary, path], stderr=subprocess.DEVNULL
+    )
+    return binary
+
+
+def cargo(rust, directory, name, native):
+    project = os.path.join(directory, name)
+    with open(create_project(project, name, native), "w") as out:
+        out.write(rust)
+    subprocess.check_call(
+        ["cargo", "build", "--release", "--offline", "--locked", "--quiet"],
+        cwd=project,
+        stderr=subprocess.DEVNULL,
+    )
+    return binary_path(project, name)
+
+
+def run(binary, rounds):
+    start = time.perf_counter()
+    output = subprocess.check_output([binary], input=b"100000 %d\n" % rounds)
+    return time.perf_counter() - start, output
+
+
+def main(rounds):
+    rust = transpiler(opt_level=2).run(SOURCE)
+    with tempfile.TemporaryDirectory() as directory:
+        binaries = [
+            ("rustc", rustc(rust, directory, "plain", [])),
+            ("rustc -O", rustc(rust, directory, "optimized", ["-O"])),
+            ("cargo", cargo(rust, directory, "collatz", False)),
+            ("cargo native", cargo(rust, directory, "native", True)),
+        ]
+        outputs = set()
+        for name, binary in binaries:
+            seconds, output = run(binary, rounds)
+            outputs.add(output)
+            print(
+                "%-13s %7.3fs %8d bytes"
+                % (name, seconds, os.path.getsize(binary))
+            )
+        assert len(outputs) == 1, "the binaries print different sums"
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Compare the runtime of nested counting loops, written with GOTO, compiled
+at -O 1, where they stay loop { ... } over variables, and at -O 2, where
+they become Rust range loops. Requires rustc.
+
+    python3 benchmarks/counted_loops.py [outer iterations]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+from bastors.pipeline import transpiler
+
+SOURCE = """
+    INPUT N
+    LET S=0
+    LET I=1
+10  LET J=1
+20  LET S=S+J*I/3
+    LET J=J+1
+    IF J<=1000 THEN GOTO 20
+    LET I=I+1
+    IF I<=N THEN GOTO 10
+    PRINT S
+"""
+
+
+def build(directory, opt_level):
+    rust = transpiler(opt_level=opt_level).run(SOURCE)
+    path = os.path.join(directory, "counted_%d.rs" % opt_level)
+    with open(path, "w") as out:
+        out.write(rust)
+    binary = path[:-3]
+    subprocess.check_call(
+        ["rustc", "-O", "-o", binary, path], stderr=subprocess.DEVNULL
+    )
+    return binary
+
+
+def main(iterations):
+    with tempfile.TemporaryDirectory() as directory:
+        for opt_level in (1, 2):
+            binary = build(directory, opt_level)
+            start = time.perf_counter()
+            output = subprocess.check_output(
+                [binary], input=b"%d\n" % iterations
+            ).decode("ascii")
+            elapsed = time.perf_counter() - start
+            print(
+                "-O %d  result %s, %.3fs, %.1f M iterations/s"
+                % (opt_level, output.strip(), elapsed, iterations / elapsed / 1e3)
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300000)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Transpile synthetic programs nested thousands of levels deep, far beyond the
+Python recursion limit, and report the time spent in each phase.
+
+The program is built directly as a statement tree: a label at the top and
+a chain of nested IF statements with a GOTO back to the label at the
+bottom. Eliminating that GOTO (case 3.2) moves it up through every level.
+
+    python3 benchmarks/deep_nesting.py [depth ...]
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+import bastors.parse as parse
+import bastors.debug as debug
+from bastors.goto_elimination import eliminate_goto
+from bastors.rustify import Rustify
+
+
+def nested_program(depth):
+    """ Return a Program with a GOTO nested depth IF statements deep """
+    cond = parse.Condition(
+        parse.VariableExpression("a"), "<", "10", parse.ConditionEnum.INITIAL
+    )
+    inner = [
+        parse.Let(None, parse.VariableExpression("a"), "1"),
+        parse.If(None, [cond], [parse.Goto(None, 10)]),
+    ]
+    for level in range(depth):
+        inner = [
+            parse.Print(None, ['"level %d"' % level]),
+            parse.If(None, [cond], inner),
+        ]
+    statements = [parse.Print(10, ['"top"'])] + inner + [parse.End(None)]
+    return parse.Program({"main": statements})
+
+
+def run(depth):
+    program = nested_program(depth)
+
+    start = time.perf_counter()
+    eliminate_goto(program)
+    eliminated = time.perf_counter()
+
+    rust = Rustify()
+    rust.visit(program)
+    rust.output(io.StringIO())
+    emitted = time.perf_counter()
+
+    debug.Print(program, io.StringIO()).output()
+    dumped = time.perf_counter()
+
+    print(
+        "depth %6d: eliminate %.3fs, rustify %.3fs, debug dump %.3fs"
+        % (depth, eliminated - start, emitted - eliminated, dumped - emitted)
+    )
+
+
+if __name__ == "__main__":
+    DEPTHS = [int(arg) for arg in sys.argv[1:]] or [1000, 2000, 4000]
+    print("recursion limit: %d" % sys.getrecursionlimit())
+    for DEPTH in DEPTHS:
+        run(DEPTH)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Measure time and peak memory (tracemalloc) of emitting Rust for a large
+program, streamed to a file compared to returned as a str.
+
+    python3 benchmarks/emit_memory.py [statements]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+import bastors.parse as parse
+from bastors.rustify import rustify
+
+
+def large_program(size):
+    """ Return a program of about size statements """
+    statements = list()
+    var = parse.VariableExpression("a")
+    cond = parse.Condition(var, "<", "10", parse.ConditionEnum.INITIAL)
+    for index in range(size // 3):
+        statements.append(
+            parse.Let(None, var, parse.ArithmeticExpression(var, "+", str(index)))
+        )
+        statements.append(
+            parse.If(None, [cond], [parse.Print(None, ['"a is "', var])])
+        )
+    return parse.Program({"main": statements})
+
+
+def measure(name, emit):
+    tracemalloc.start()
+    start = time.perf_counter()
+    emit()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("%-10s %.2fs, peak %.1f MiB" % (name, elapsed, peak / (1 << 20)))
+
+
+if __name__ == "__main__":
+    SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    PROGRAM = large_program(SIZE)
+
+    def streamed():
+        with open(os.devnull, "w", buffering=1 << 20) as out:
+            rustify(PROGRAM, out)
+
+    measure("streamed", streamed)
+    measure("str", lambda: rustify(PROGRAM))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Measure how fast compiled programs consume piped INPUT. A program summing
+numbers until it reads a zero is transpiled and compared with the same
+program as Rustify used to generate it, allocating a String and locking
+stdin for every number read. Requires rustc.
+
+    python3 benchmarks/input_throughput.py [numbers]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+from bastors.pipeline import transpiler
+
+SOURCE = """
+10 INPUT A
+   LET S=S+A
+   IF A<>0 THEN GOTO 10
+   PRINT S
+"""
+
+# What Rustify generated for SOURCE before INPUT reused its buffer
+BASELINE = """
+use std::io;
+struct State {
+    a: i32,
+    s: i32,
+}
+
+fn main() {
+    let mut state: State = State { a: 0, s: 0 };
+    loop {
+        loop {
+            let mut input = String::new();
+            io::stdin().read_line(&mut input).unwrap();
+            match input.trim().parse::<i32>() {
+                Ok(i) => {
+                    state.a = i;
+                    break;
+                }
+                Err(_) => println!("invalid number"),
+            }
+        }
+        state.s = state.s + state.a;
+        if state.a == 0 {
+            break;
+        }
+    }
+    println!("{}", state.s);
+}
+"""
+
+
+def build(rust, directory, name):
+    path = os.path.join(directory, name + ".rs")
+    with open(path, "w") as out:
+        out.write(rust)
+    binary = os.path.join(directory, name)
+    subprocess.check_call(["rustc", "-O", "-o", binary, path])
+    return binary
+
+
+def run(binary, input_path):
+    with open(input_path) as stdin:
+        start = time.perf_counter()
+        output = subprocess.check_output([binary], stdin=stdin)
+        return time.perf_counter() - start, output.decode("ascii").strip()
+
+
+def main(numbers):
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, "input.txt")
+        with open(input_path, "w") as out:
+            out.write("1\n" * numbers + "0\n")
+
+        binaries = [
+            ("allocating", build(BASELINE, directory, "baseline")),
+            ("reused buffer", build(transpiler().run(SOURCE), directory, "reused")),
+        ]
+        for name, binary in binaries:
+            seconds, output = run(binary, input_path)
+            print(
+                "%-14s sum %s, %.3fs, %.1f M numbers/s"
+                % (name, output, seconds, numbers / seconds / 1e6)
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000000)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Compare the runtime of a hot loop compiled with every variable in the
+State struct (-O 0) against main's variables kept in locals (-O 1), which
+rustc can keep in registers. The loop calls a GOSUB routine now and then so
+that spilling around calls is measured too. Requires rustc.
+
+    python3 benchmarks/locals.py [iterations]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+from bastors.pipeline import transpiler
+
+SOURCE = """
+    LET I=0
+    LET S=0
+    LET X=1
+10  LET X=X*17+I
+    LET X=X-X/65536*65536
+    LET S=S+X/3
+    LET I=I+1
+    IF I-I/1000*1000=0 THEN GOSUB 100
+    IF I<%d THEN GOTO 10
+    PRINT S
+    END
+100 LET S=S-S/1024*1024
+    RETURN
+"""
+
+
+def build(source, directory, opt_level):
+    rust = transpiler(opt_level=opt_level).run(source)
+    path = os.path.join(directory, "locals_%d.rs" % opt_level)
+    with open(path, "w") as out:
+        out.write(rust)
+    binary = path[:-3]
+    subprocess.check_call(
+        ["rustc", "-O", "-o", binary, path], stderr=subprocess.DEVNULL
+    )
+    return binary
+
+
+def main(iterations):
+    source = SOURCE % iterations
+    with tempfile.TemporaryDirectory() as directory:
+        for opt_level in (0, 1):
+            binary = build(source, directory, opt_level)
+            start = time.perf_counter()
+            output = subprocess.check_output([binary]).decode("ascii").strip()
+            elapsed = time.perf_counter() - start
+            print(
+                "-O %d  result %s, %.3fs, %.1f M iterations/s"
+                % (opt_level, output, elapsed, iterations / elapsed / 1e6)
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000000)
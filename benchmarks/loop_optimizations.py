@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Compare the runtime of a program with a busy wait FOR loop and loops
+recomputing invariant expressions, compiled at -O 2 and at -O 3, which
+removes the empty loop and hoists the invariant expressions. Both are
+built with rustc -O, whose own loop optimizations already do much the
+same, and without it, which shows what the pass does by itself. Requires
+rustc.
+
+    python3 benchmarks/loop_optimizations.py [outer iterations]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+from bastors.pipeline import transpiler
+
+SOURCE = """
+    INPUT N, A, B
+    LET S=0
+    LET I=1
+10  GOSUB 100
+    LET J=1
+20  IF A<B THEN LET S=S*3+(A*B-A/B)*J
+    IF A>=B THEN LET S=S*5-(A+B)*(A-B)/J
+    LET J=J+1
+    IF J<=1000 THEN GOTO 20
+    LET I=I+1
+    IF I<=N THEN GOTO 10
+    PRINT S
+    END
+100 FOR W=1 TO 2000
+    NEXT W
+    RETURN
+"""
+
+
+def build(directory, opt_level, flags):
+    rust = transpiler(opt_level=opt_level).run(SOURCE)
+    path = os.path.join(directory, "loops_%d.rs" % opt_level)
+    with open(path, "w") as out:
+        out.write(rust)
+    binary = path[:-3]
+    subprocess.check_call(
+        ["rustc", "-C", "overflow-checks=no"]
+        + flags
+        + ["-o", binary, path],
+        stderr=subprocess.DEVNULL,
+    )
+    return binary
+
+
+def main(iterations):
+    with tempfile.TemporaryDirectory() as directory:
+        for flags in (["-O"], []):
+            for opt_level in (2, 3):
+                binary = build(directory, opt_level, flags)
+                start = time.perf_counter()
+                output = subprocess.check_output(
+                    [binary], input=b"%d 3 7\n" % iterations
+                ).decode("ascii")
+                elapsed = time.perf_counter() - start
+                print(
+                    "rustc %-3s -O %d  result %s, %.3fs, %.1f M iterations/s"
+                    % (
+                        " ".join(flags),
+                        opt_level,
+                        output.strip(),
+                        elapsed,
+                        iterations / elapsed / 1e3,
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Compare the runtime of the programs in programs/ compiled with println!
+for every PRINT against one buffered writer over a locked stdout
+(--buffered-output). Requires rustc.
+
+Every program gets a stream of zeroes as input and is run until it exits
+or has written LIMIT bytes, whatever comes first.
+
+    python3 benchmarks/print_buffering.py [limit in bytes]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+from bastors.pipeline import transpiler
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "programs")
+
+
+def compile_program(source, directory, name, options):
+    rust = transpiler(rust_options=options).run(source)
+    path = os.path.join(directory, name + ".rs")
+    with open(path, "w") as out:
+        out.write(rust)
+    binary = os.path.join(directory, name)
+    subprocess.check_call(
+        ["rustc", "-O", "-o", binary, path], stderr=subprocess.DEVNULL
+    )
+    return binary
+
+
+def run(binary, input_path, limit):
+    """ Return the seconds spent and bytes written by binary """
+    written = 0
+    with open(input_path) as stdin:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [binary], stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        while written < limit:
+            chunk = process.stdout.read(1 << 16)
+            if not chunk:
+                break
+            written += len(chunk)
+        elapsed = time.perf_counter() - start
+        process.kill()
+        process.wait()
+    return elapsed, written
+
+
+def main(limit):
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, "input.txt")
+        with open(input_path, "w") as out:
+            out.write("0\n" * 1000000)
+
+        for filename in sorted(os.listdir(PROGRAMS)):
+            if not filename.endswith(".bas"):
+                continue
+            with open(os.path.join(PROGRAMS, filename)) as basic:
+                source = basic.read()
+
+            results = list()
+            for buffered in (False, True):
+                name = "%s_%d" % (filename[:-4].replace("-", "_"), buffered)
+                binary = compile_program(
+                    source, directory, name, {"buffered_output": buffered}
+                )
+                results.append(run(binary, input_path, limit))
+
+            (plain, plain_bytes), (buffered, buffered_bytes) = results
+            print(
+                "%-22s println! %7.3fs %8.1f MB/s, buffered %7.3fs %8.1f MB/s"
+                % (
+                    filename,
+                    plain,
+                    plain_bytes / plain / 1e6,
+                    buffered,
+                    buffered_bytes / buffered / 1e6,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20 * 1000 * 1000)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Measure how fast a compiled report-generating program writes its output.
+The program is transpiled with --buffered-output and compared with the
+same program as Rustify generated it before PRINT was lowered: every PRINT
+a writeln! with its string literals as format arguments, and integers
+formatted through std::fmt. Output goes to /dev/null. Requires rustc.
+
+    python3 benchmarks/print_lowering.py [rows]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+from bastors.pipeline import transpiler
+
+SOURCE = """
+    INPUT N
+    LET I=1
+    LET S=0
+10  PRINT "Report"
+    PRINT "======"
+    PRINT "row, square, total"
+    LET S=S+I*I
+    PRINT "Row ", I, ": ", I*I, " total ", S
+    PRINT "--"
+    LET I=I+1
+    IF I<=N THEN GOTO 10
+    PRINT "Done after ", N, " rows."
+"""
+
+# What Rustify generated for SOURCE, at -O 2, before PRINT was lowered
+BASELINE = """
+use std::io;
+use std::io::BufRead;
+use std::io::Write;
+use std::process;
+struct State {
+    out: io::BufWriter<io::StdoutLock<'static>>,
+    stdin: io::StdinLock<'static>,
+    input: Vec<u8>,
+    input_pos: usize,
+}
+
+fn input_i32(state: &mut State) -> i32 {
+    let separator = |c: u8| c.is_ascii_whitespace() || c == b',';
+    loop {
+        let line = &state.input;
+        let mut pos = state.input_pos;
+        while pos < line.len() && separator(line[pos]) {
+            pos += 1;
+        }
+        if pos == line.len() {
+            state.input.clear();
+            state.input_pos = 0;
+            if state.stdin.read_until(b'\\n', &mut state.input).unwrap() == 0 {
+                state.out.flush().unwrap();
+                process::exit(0x0);
+            }
+            continue;
+        }
+        let start = pos;
+        while pos < line.len() && !separator(line[pos]) {
+            pos += 1;
+        }
+        state.input_pos = pos;
+        let number = std::str::from_utf8(&line[start..pos]).ok();
+        match number.and_then(|n| n.parse::<i32>().ok()) {
+            Some(i) => return i,
+            None => {
+                state.input_pos = state.input.len();
+                writeln!(state.out, "invalid number").unwrap();
+                state.out.flush().unwrap();
+            }
+        }
+    }
+}
+
+fn main() {
+    let mut state: State = State {
+        out: io::BufWriter::with_capacity(1 << 16, io::stdout().lock()),
+        stdin: io::stdin().lock(),
+        input: Vec::new(),
+        input_pos: 0,
+    };
+    let mut c0: i32 = 0;
+    let mut i: i32 = 0;
+    let mut n: i32 = 0;
+    let mut r0: i32 = 0;
+    let mut s: i32 = 0;
+    state.out.flush().unwrap();
+    n = input_i32(&mut state);
+    i = 1;
+    s = 0;
+    r0 = n;
+    if r0 < i {
+        r0 = i;
+    }
+    for i in i..=r0 {
+        writeln!(state.out, "{}", "Report").unwrap();
+        writeln!(state.out, "{}", "======").unwrap();
+        writeln!(state.out, "{}", "row, square, total").unwrap();
+        c0 = i * i;
+        s = s + c0;
+        writeln!(state.out, "{}{}{}{}{}{}", "Row ", i, ": ", c0, " total ", s).unwrap();
+        writeln!(state.out, "{}", "--").unwrap();
+    }
+    i = if r0 >= i { r0 + 1 } else { i };
+    writeln!(state.out, "{}{}{}", "Done after ", n, " rows.").unwrap();
+}
+"""
+
+
+def build(rust, directory, name):
+    path = os.path.join(directory, name + ".rs")
+    with open(path, "w") as out:
+        out.write(rust)
+    binary = os.path.join(directory, name)
+    subprocess.check_call(
+        ["rustc", "-O", "-o", binary, path], stderr=subprocess.DEVNULL
+    )
+    return binary
+
+
+def run(binary, rows):
+    start = time.perf_counter()
+    subprocess.run(
+        [binary], input=b"%d\n" % rows, stdout=subprocess.DEVNULL, check=True
+    )
+    return time.perf_counter() - start
+
+
+def main(rows):
+    with tempfile.TemporaryDirectory() as directory:
+        lowered = transpiler(
+            opt_level=2, rust_options={"buffered_output": True}
+        ).run(SOURCE)
+        binaries = [
+            ("writeln!", build(BASELINE, directory, "baseline")),
+            ("lowered", build(lowered, directory, "lowered")),
+        ]
+        outputs = [
+            subprocess.check_output([binary], input=b"3\n") for _, binary in binaries
+        ]
+        assert outputs[0] == outputs[1], "the programs print different reports"
+        for name, binary in binaries:
+            seconds = run(binary, rows)
+            print("%-9s %.3fs, %.1f M rows/s" % (name, seconds, rows / seconds / 1e6))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000000)
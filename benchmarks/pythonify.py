@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Measure how long a program made of GOTO loops and a GOSUB routine takes to
+run as Python generated by Pythonify, at every optimization level, next to
+the bytecode VM of bastors.vm. The first run of each level includes
+turning the source into Python and compiling it, the second one finds the
+code object cached.
+
+    python3 benchmarks/pythonify.py [iterations]
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+from bastors.pipeline import transpiler
+from bastors.pythonify import execute, load
+from bastors.vm import run
+
+PROGRAM = """INPUT N
+LET I = 1
+LET S = 0
+10 LET J = 1
+20 LET S = S + I * J / 7
+IF S > 100000 THEN LET S = S - 99991
+LET J = J + 1
+IF J <= 100 THEN GOTO 20
+IF I / 10 * 10 = I THEN GOSUB 100
+LET I = I + 1
+IF I <= N THEN GOTO 10
+PRINT S
+END
+100 LET C = C + 1
+IF C / 100 * 100 = C THEN PRINT C
+RETURN
+"""
+
+
+def seconds(func):
+    """ Return the seconds func() took """
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(iterations):
+    inputs = "%d\n" % iterations
+
+    def python(level):
+        code = transpiler(opt_level=level, python=True).run(PROGRAM)
+        execute(load(code), io.StringIO(inputs), io.StringIO())
+
+    for level in range(4):
+        first = seconds(lambda: python(level))
+        cached = seconds(lambda: python(level))
+        print("python -O%d %7.3fs first %7.3fs cached" % (level, first, cached))
+    elapsed = seconds(lambda: run(PROGRAM, io.StringIO(inputs), io.StringIO()))
+    print("vm        %7.3fs" % elapsed)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Measure how long rustc -O takes on a large generated program written as
+one file, and written with --split: routines in module files of their
+own and main outlined into routines. Both are built from scratch, and
+then again incrementally after one line of one routine changed, with
+-C incremental. Requires rustc.
+
+    python3 benchmarks/split_modules.py [routines]
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+from bastors.outlining import OUTLINE_SIZE
+from bastors.pipeline import transpiler
+
+
+def generate(routines, changed=0):
+    """ Return a program of many routines, called from a long main. The
+        changed routine adds another number than the others. """
+    lines = ["INPUT A, B"]
+    for routine in range(routines):
+        lines.append("LET A = A + %d" % routine)
+        lines.append("IF A > 1000 THEN LET A = A - 1000")
+        lines.append("PRINT A, \" \", B")
+        lines.append("GOSUB %d" % (1000 + routine * 10))
+    lines.append("END")
+    for routine in range(routines):
+        lines.append("%d LET B = B * 3 + %d" % (1000 + routine * 10, routine + changed))
+        for step in range(8):
+            lines.append("IF B > %d THEN LET B = B - %d" % (10000 + step, 9000 + step))
+            lines.append("LET A = A + B / %d" % (step + 2))
+        lines.append("RETURN")
+    return "\n".join(lines) + "\n"
+
+
+def build(directory, source, split):
+    """ Transpile and compile source in directory, return the seconds """
+    main = os.path.join(directory, "main.rs")
+    options = {"module_dir": directory} if split else dict()
+    transpiler(
+        out=main, rust_options=options, outline_size=OUTLINE_SIZE if split else None
+    ).run(source)
+    start = time.perf_counter()
+    subprocess.check_call(
+        [
+            "rustc",
+            "-O",
+            "-C",
+            "incremental=%s" % os.path.join(directory, "incremental"),
+            "-o",
+            os.path.join(directory, "main"),
+            main,
+        ],
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def main(routines):
+    with tempfile.TemporaryDirectory() as directory:
+        for name, split in (("one file", False), ("split", True)):
+            path = os.path.join(directory, name.replace(" ", "_"))
+            os.mkdir(path)
+            cold = build(path, generate(routines), split)
+            changed = build(path, generate(routines, changed=1), split)
+            print("%-9s %7.2fs cold %7.2fs after a change" % (name, cold, changed))
+            shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
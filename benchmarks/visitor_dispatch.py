@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Measure the per-node overhead of Visitor dispatch on a large statement tree,
+comparing the cached dispatch table of Visitor with looking up
+"visit_" + type(node).__name__ through getattr() on every visit.
+
+    python3 benchmarks/visitor_dispatch.py [statements]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+import bastors.parse as parse
+from bastors.visitor import Visitor
+
+
+class Counter(Visitor):
+    """ A visitor doing as little as possible per node """
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def visit_Program(self, node):
+        for statements in node.statements.values():
+            for statement in statements:
+                self.visit(statement)
+
+    def visit_If(self, node):
+        self.count += 1
+        for statement in node.statements:
+            self.visit(statement)
+
+    def visit_Let(self, node):  # pylint: disable=unused-argument
+        self.count += 1
+
+    def visit_Print(self, node):  # pylint: disable=unused-argument
+        self.count += 1
+
+
+class GetattrCounter(Counter):
+    """ The same visitor, dispatching the way Visitor used to """
+
+    def visit(self, node):
+        method = "visit_" + type(node).__name__
+        if self._defaultfunc is None:
+            self._defaultfunc = self.generic
+        visitor = getattr(self, method, self._defaultfunc)
+        return visitor(node)
+
+
+def large_program(size):
+    """ Return a flat program of size statements """
+    statements = list()
+    cond = parse.Condition(
+        parse.VariableExpression("a"), "<", "10", parse.ConditionEnum.INITIAL
+    )
+    for index in range(size // 4):
+        statements.append(parse.Let(None, parse.VariableExpression("a"), str(index)))
+        statements.append(parse.Print(None, [parse.VariableExpression("a")]))
+        statements.append(
+            parse.If(None, [cond], [parse.Print(None, ['"less than ten"'])])
+        )
+    return parse.Program({"main": statements})
+
+
+def measure(visitor_class, program, repeat=5):
+    best = None
+    for _ in range(repeat):
+        visitor = visitor_class()
+        start = time.perf_counter()
+        visitor.visit(program)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, visitor.count
+
+
+if __name__ == "__main__":
+    SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 400000
+    PROGRAM = large_program(SIZE)
+    for name, cls in (("getattr", GetattrCounter), ("dispatch table", Counter)):
+        seconds, nodes = measure(cls, PROGRAM)
+        print("%-15s %d nodes, %.1f ns/node" % (name, nodes, seconds / nodes * 1e9))
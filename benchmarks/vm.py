@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Measure how many bytecode instructions per second bastors.vm runs, on a
+program of nested FOR loops, arithmetic, IFs and GOSUBs, and how long it
+takes from the source to its output, next to transpiling it and building
+it with rustc -O, when rustc is there.
+
+    python3 benchmarks/vm.py [iterations]
+"""
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=C0413
+from bastors.pipeline import transpiler
+from bastors.vm import run
+
+PROGRAM = """INPUT N
+LET S = 0
+FOR I = 1 TO N
+FOR J = 1 TO 100
+LET S = S + I * J / 7
+IF S > 100000 THEN LET S = S - 99991
+NEXT J
+IF I / 10 * 10 = I THEN GOSUB 100
+NEXT I
+PRINT S
+END
+100 LET C = C + 1
+IF C / 100 * 100 = C THEN PRINT C
+RETURN
+"""
+
+
+def rustc_seconds(iterations):
+    """ Return the seconds to transpile, build and run PROGRAM with rustc """
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        rs = os.path.join(directory, "vm.rs")
+        transpiler(out=rs).run(PROGRAM)
+        binary = os.path.join(directory, "vm")
+        subprocess.check_call(["rustc", "-O", "-o", binary, rs])
+        subprocess.run(
+            [binary],
+            input=b"%d\n" % iterations,
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        return time.perf_counter() - start
+
+
+def main(iterations):
+    start = time.perf_counter()
+    executed = run(PROGRAM, io.StringIO("%d\n" % iterations), io.StringIO())
+    elapsed = time.perf_counter() - start
+    print(
+        "vm     %7.2fs %12d instructions %10.0f instructions/s"
+        % (elapsed, executed, executed / elapsed)
+    )
+    if shutil.which("rustc") is not None:
+        print("rustc  %7.2fs to transpile, build and run" % rustc_seconds(iterations))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,36 @@
+import unittest
+import bastors.parse as parse
+from bastors.analysis import statement_usage, function_effects
+
+
+class TestAnalysis(unittest.TestCase):
+    def test_statement_usage(self):
+        source = """
+            LET A=B+C*(D-1)
+            IF E>0 THEN PRINT F
+            INPUT G
+            GOSUB 100
+        100 RETURN
+            """
+        program = parse.Parser(source).parse()
+        usage = statement_usage(program.statements["main"])
+        self.assertEqual(usage.reads, {"b", "c", "d", "e", "f"})
+        self.assertEqual(usage.writes, {"a", "g"})
+        self.assertEqual(usage.calls, {"100"})
+
+    def test_function_effects(self):
+        source = """
+            GOSUB 100
+            END
+        100 LET A=1
+            GOSUB 200
+            RETURN
+        200 LET B=C
+            RETURN
+            """
+        program = parse.Parser(source).parse()
+        effects = function_effects(program)
+        self.assertEqual(effects["main"].writes, {"a", "b"})
+        self.assertEqual(effects["main"].reads, {"c"})
+        self.assertEqual(effects["100"].calls, {"200"})
+        self.assertEqual(effects["200"].writes, {"b"})
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from bastors.build import BinaryCache, BuildError, build_rustc
+from bastors.pipeline import transpiler
+
+
+class TestBuild(unittest.TestCase):
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = BinaryCache(os.path.join(directory, "cache"), max_size=250)
+            binary = os.path.join(directory, "binary")
+            with open(binary, "wb") as file:
+                file.write(b"x" * 100)
+
+            keys = [cache.key("program %d" % i, "rustc 1.0", "-O") for i in range(3)]
+            self.assertEqual(len(set(keys)), 3)
+            for age, key in enumerate(keys):
+                path = cache.put(key, binary)
+                os.utime(path, (age, age))
+            # The least recently used binary made room for the last one
+            self.assertIsNone(cache.get(keys[0]))
+            self.assertIsNotNone(cache.get(keys[1]))
+            self.assertIsNotNone(cache.get(keys[2]))
+            self.assertEqual(os.listdir(cache.directory).count(keys[2]), 1)
+            self.assertFalse(
+                [name for name in os.listdir(cache.directory) if name[0] == "."]
+            )
+
+    def test_build(self):
+        rust = transpiler(opt_level=1).run('PRINT "cached"\n')
+        with tempfile.TemporaryDirectory() as directory:
+            cache = BinaryCache(os.path.join(directory, "cache"))
+            results = list()
+            for name in ("first", "second"):
+                results.append(build_rustc(rust, os.path.join(directory, name), cache))
+                output = subprocess.check_output([results[-1].binary])
+                self.assertEqual(output, b"cached\n")
+            self.assertEqual([result.cached for result in results], [False, True])
+
+            # Other flags make another binary
+            result = build_rustc(rust, os.path.join(directory, "third"), cache, [])
+            self.assertFalse(result.cached)
+
+            with self.assertRaises(BuildError):
+                build_rustc("fn main() {", os.path.join(directory, "broken"), cache)
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from bastors.bundle import BundleError, bundle, module_names
+
+
+class TestBundle(unittest.TestCase):
+    def __run(self, command):
+        return subprocess.run(command, input=b"3\n", capture_output=True, check=False)
+
+    def test_module_names(self):
+        self.assertEqual(
+            module_names(["hunt-the-hurkle", "hunt_the_hurkle", "1_1_a", "fn", "main"]),
+            ["hunt_the_hurkle", "hunt_the_hurkle_2", "bas_1_1_a", "bas_fn", "main_2"],
+        )
+
+    def test_same_name(self):
+        with self.assertRaises(BundleError):
+            bundle([("a", "PRINT 1\n"), ("a", "PRINT 2\n")])
+
+    def test_run(self):
+        sources = [
+            ("count", "INPUT N\nFOR I = 1 TO N\nPRINT I\nNEXT I\n"),
+            ("twice", "INPUT N\nGOSUB 100\nPRINT N\nEND\n100 LET N = N * 2\nRETURN\n"),
+            ("hello-world", 'PRINT "Hello"\n'),
+        ]
+        for buffered in (False, True):
+            rust = bundle(
+                sources, opt_level=2, rust_options={"buffered_output": buffered}
+            )
+            with tempfile.TemporaryDirectory() as directory:
+                rs = os.path.join(directory, "bundle.rs")
+                with open(rs, "w") as out:
+                    out.write(rust)
+                binary = os.path.join(directory, "bundle")
+                rc = subprocess.call(
+                    ["rustc", "-o", binary, rs], stderr=subprocess.DEVNULL
+                )
+                self.assertEqual(rc, 0)
+                self.assertEqual(self.__run([binary, "count"]).stdout, b"1\n2\n3\n")
+                self.assertEqual(self.__run([binary, "twice"]).stdout, b"6\n")
+                link = os.path.join(directory, "hello-world")
+                os.symlink(binary, link)
+                self.assertEqual(self.__run([link]).stdout, b"Hello\n")
+
+                process = self.__run([binary, "nonesuch"])
+                self.assertEqual(process.returncode, 2)
+                self.assertIn(b"hello-world", process.stderr)
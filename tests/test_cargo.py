@@ -0,0 +1,44 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from bastors.cargo import binary_path, create_project, package_name
+from bastors.pipeline import transpiler
+
+
+class TestCargo(unittest.TestCase):
+    def test_package_name(self):
+        self.assertEqual(package_name("programs/fibonacci.bas"), "fibonacci")
+        self.assertEqual(package_name("Hunt the Hurkle.bas"), "hunt_the_hurkle")
+        self.assertEqual(package_name("/tmp/1_1_a"), "bas_1_1_a")
+        self.assertEqual(package_name("test.bas"), "bas_test")
+
+    def test_native(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = os.path.join(directory, ".cargo", "config.toml")
+            create_project(directory, "fib", native=True)
+            with open(config) as file:
+                self.assertIn("target-cpu=native", file.read())
+            create_project(directory, "fib")
+            self.assertFalse(os.path.exists(config))
+
+    def test_build(self):
+        source = "INPUT N\nLET A=0\nLET B=1\n10 PRINT A\nLET B=A+B\nLET A=B-A\n"
+        source += "IF B<=N THEN GOTO 10\n"
+        with tempfile.TemporaryDirectory() as directory:
+            transpiler(out=create_project(directory, "fib"), opt_level=2).run(source)
+            with open(os.path.join(directory, "Cargo.toml")) as file:
+                manifest = file.read()
+            for setting in ('lto = "fat"', "codegen-units = 1", 'panic = "abort"'):
+                self.assertIn(setting, manifest)
+
+            rc = subprocess.call(
+                ["cargo", "build", "--release", "--offline", "--locked", "--quiet"],
+                cwd=directory,
+                stderr=subprocess.DEVNULL,
+            )
+            self.assertEqual(rc, 0)
+            output = subprocess.check_output(
+                [binary_path(directory, "fib")], input=b"10\n"
+            )
+            self.assertEqual(output, b"0\n1\n1\n2\n3\n5\n")
@@ -0,0 +1,111 @@
+import os
+import subprocess
+import tempfile
+import unittest
+import bastors.parse as parse
+from bastors.common_subexpressions import (
+    CommonSubexpressionStats,
+    eliminate_common_subexpressions,
+)
+from bastors.goto_elimination import eliminate_goto
+from bastors.rustify import rustify
+
+
+class TestCommonSubexpressions(unittest.TestCase):
+    def __eliminate(self, source):
+        stats = CommonSubexpressionStats()
+        program = eliminate_goto(parse.Parser(source).parse())
+        return eliminate_common_subexpressions(program, stats), stats
+
+    def test_repeated(self):
+        program, stats = self.__eliminate(
+            "LET S=(42*S+127)-((42*S+127)/126*126)\nPRINT S\n"
+        )
+        self.assertEqual(stats.temporaries, 1)
+        self.assertEqual(stats.replaced, 2)
+        temp = parse.VariableExpression("c0")
+        self.assertEqual(
+            program.statements["main"][:2],
+            [
+                parse.Let(
+                    None,
+                    temp,
+                    parse.ArithmeticExpression(
+                        parse.ArithmeticExpression("42", "*", parse.VariableExpression("s")),
+                        "+",
+                        "127",
+                    ),
+                ),
+                parse.Let(
+                    None,
+                    parse.VariableExpression("s"),
+                    parse.ArithmeticExpression(
+                        temp,
+                        "-",
+                        parse.ParenExpression(
+                            parse.ArithmeticExpression(
+                                parse.ArithmeticExpression(temp, "/", "126"), "*", "126"
+                            )
+                        ),
+                    ),
+                    parse.Position(None, 1, 1),
+                ),
+            ],
+        )
+
+    def test_not_repeated(self):
+        sources = [
+            # A is assigned in between
+            "LET X=A*B\nLET A=1\nLET Y=A*B\n",
+            # the routine may assign A
+            "LET X=A*B\nGOSUB 100\nLET Y=A*B\nEND\n100 INPUT A\nRETURN\n",
+        ]
+        for source in sources:
+            _, stats = self.__eliminate(source)
+            self.assertEqual(stats.temporaries, 0, source)
+
+        # The divisions by A are not evaluated unless A is not zero
+        a, b = parse.VariableExpression("a"), parse.VariableExpression("b")
+        b_a = parse.ArithmeticExpression(b, "/", a)
+        conditions = [
+            parse.Condition(a, "<>", "0", parse.ConditionEnum.INITIAL),
+            parse.Condition(b_a, ">", "1", parse.ConditionEnum.AND),
+            parse.Condition(b_a, "<", "5", parse.ConditionEnum.AND),
+        ]
+        program = parse.Program(
+            {"main": [parse.If(None, conditions, [parse.Print(None, [b])])]}
+        )
+        stats = CommonSubexpressionStats()
+        self.assertEqual(eliminate_common_subexpressions(program, stats), program)
+        self.assertEqual(stats.temporaries, 0)
+
+    def test_nested(self):
+        source = """
+            INPUT A, B
+            PRINT (A+B)*(A-B), " ", (A+B)*(A-B)+1, " ", A+B
+            IF B<>0 THEN PRINT A/B+A/B
+            IF B=0 THEN PRINT A*B+A*B
+            """
+        program, stats = self.__eliminate(source)
+        # (A+B)*(A-B), A+B, A/B and A*B
+        self.assertEqual(stats.temporaries, 4)
+
+        with tempfile.TemporaryDirectory() as directory:
+            binaries = list()
+            for name, optimized in (("plain", False), ("cse", True)):
+                rs = os.path.join(directory, "%s.rs" % name)
+                with open(rs, "w") as out:
+                    if optimized:
+                        rustify(program, out)
+                    else:
+                        rustify(eliminate_goto(parse.Parser(source).parse()), out)
+                binaries.append(rs[:-3])
+                rc = subprocess.call(
+                    ["rustc", "-o", binaries[-1], rs], stderr=subprocess.DEVNULL
+                )
+                self.assertEqual(rc, 0)
+            for value in (b"7 3\n", b"-2 0\n", b"5 -9\n"):
+                outputs = [
+                    subprocess.check_output([binary], input=value) for binary in binaries
+                ]
+                self.assertEqual(outputs[0], outputs[1])
@@ -0,0 +1,114 @@
+import os
+import subprocess
+import tempfile
+import unittest
+import bastors.parse as parse
+from bastors.constant_folding import FoldingStats, arithmetic, fold_constants
+from bastors.goto_elimination import eliminate_goto
+from bastors.pipeline import transpiler
+from bastors.rustify import rustify
+
+
+class TestConstantFolding(unittest.TestCase):
+    def __fold(self, source, stats=None):
+        program = eliminate_goto(parse.Parser(source).parse())
+        return rustify(fold_constants(program, stats))
+
+    def test_arithmetic(self):
+        self.assertEqual(arithmetic("/", 7, 2), 3)
+        self.assertEqual(arithmetic("/", -7, 2), -3)
+        self.assertEqual(arithmetic("/", 7, -2), -3)
+        self.assertEqual(arithmetic("-", 123, 120), 3)
+        self.assertIsNone(arithmetic("/", 7, 0))
+        self.assertIsNone(arithmetic("*", 65536, 65536))
+        self.assertIsNone(arithmetic("-", -(1 << 31), 1))
+
+    def test_fold(self):
+        stats = FoldingStats()
+        rust = self.__fold(
+            """
+            LET R=123
+            LET D=R-(R/10*10)
+            LET Q=0-7/2
+            PRINT D, Q, 11-R
+            LET A=B/0
+            """,
+            stats,
+        )
+        self.assertIn("state.d = 3;", rust)
+        self.assertIn("state.q = -3;", rust)
+        self.assertIn('println!("3-3-112");', rust)
+        self.assertIn("state.a = state.b / 0;", rust)
+        self.assertEqual(stats.propagated, 5)
+
+    def test_branches(self):
+        stats = FoldingStats()
+        rust = self.__fold(
+            """
+            LET N=10
+            IF N>5 THEN PRINT "big"
+            IF N<5 THEN PRINT "small"
+            INPUT N
+            IF N>5 THEN PRINT "maybe"
+            """,
+            stats,
+        )
+        self.assertIn('println!("big");\n    state.n', rust)
+        self.assertNotIn("small", rust)
+        self.assertIn("if state.n > 5 {", rust)
+        self.assertEqual(stats.branches, 2)
+
+    def test_flags(self):
+        rust = self.__fold(
+            """
+            10 PRINT "once"
+               GOTO 20
+               PRINT "never"
+            20 END
+            """
+        )
+        self.assertNotIn("never", rust)
+        self.assertNotIn("if ", rust)
+
+    def test_endless_loop(self):
+        # Nothing after a loop that is never left is generated, rustc warns
+        # about unreachable statements
+        rust = self.__fold('10 PRINT "again"\nGOTO 10\nPRINT "never"\nEND\n')
+        self.assertNotIn("never", rust)
+        self.assertNotIn("return;", rust)
+
+    def test_loops_and_calls(self):
+        rust = self.__fold(
+            """
+                LET N=2
+                LET I=0
+            10  LET I=I+1
+                PRINT I*N
+                IF I<3 THEN GOTO 10
+                GOSUB 100
+                PRINT N, I
+                END
+            100 LET N=N*2
+                RETURN
+            """
+        )
+        self.assertIn("state.i = state.i + 1;", rust)
+        self.assertIn("state.i * 2", rust)
+        self.assertIn('println!("{}{}", state.n, state.i);', rust)
+
+    def test_division_by_zero_not_run(self):
+        # The zero is kept in the variable, rustc rejects dividing by a
+        # literal zero even in a branch that is never run
+        source = "LET Y=0\nINPUT X\nIF X>5 THEN PRINT X/Y\nPRINT X\n"
+        stats = FoldingStats()
+        rust = self.__fold(source, stats)
+        self.assertIn("state.x / state.y", rust)
+        self.assertEqual(stats.propagated, 0)
+        with tempfile.TemporaryDirectory() as directory:
+            rs = os.path.join(directory, "division.rs")
+            transpiler(out=rs, opt_level=1).run(source)
+            binary = os.path.join(directory, "division")
+            rc = subprocess.call(["rustc", "-o", binary, rs], stderr=subprocess.DEVNULL)
+            self.assertEqual(rc, 0)
+            output = subprocess.check_output([binary], input=b"3\n")
+        self.assertEqual(output, b"3\n")
@@ -0,0 +1,80 @@
+import os
+import subprocess
+import tempfile
+import unittest
+import bastors.parse as parse
+from bastors.counted_loops import CountedLoopStats, recognize_counted_loops
+from bastors.goto_elimination import eliminate_goto
+from bastors.rustify import rustify
+
+SOURCE = """
+    LET I=1
+10  PRINT I
+    LET I=I+1
+    IF I<=5 THEN GOTO 10
+    PRINT "after ", I
+    INPUT N
+    LET J=0
+20  LET S=S+J
+    LET J=J+3
+    IF J<N THEN GOTO 20
+    PRINT J, " ", S
+    LET K=10
+30  PRINT K
+    LET K=K-4
+    IF 0<=K THEN GOTO 30
+    PRINT K
+"""
+
+
+class TestCountedLoops(unittest.TestCase):
+    def __program(self, source):
+        return eliminate_goto(parse.Parser(source).parse())
+
+    def __run(self, program, inputs):
+        with tempfile.TemporaryDirectory() as directory:
+            rs = os.path.join(directory, "counted.rs")
+            with open(rs, "w") as out:
+                rustify(program, out, promote_locals=True)
+
+            binary = os.path.join(directory, "counted")
+            rc = subprocess.call(["rustc", "-o", binary, rs], stderr=subprocess.DEVNULL)
+            self.assertEqual(rc, 0)
+            return [
+                subprocess.check_output([binary], input=value.encode("ascii"))
+                for value in inputs
+            ]
+
+    def test_recognize(self):
+        program = self.__program(SOURCE)
+        stats = CountedLoopStats()
+        counted = recognize_counted_loops(program, stats)
+        self.assertEqual(stats.loops, 3)
+        self.assertEqual(stats.constant, 2)
+
+        rust = rustify(counted)
+        self.assertIn("for i in 1..6 {", rust)
+        self.assertIn("state.i = 6;", rust)
+        self.assertIn("for j in (state.j..=state.r0).step_by(3) {", rust)
+        self.assertIn("for k in (2..11).rev().step_by(4) {", rust)
+        self.assertIn("state.k = -2;", rust)
+        self.assertNotIn("loop {", rust.split("fn main")[1])
+
+        inputs = ["0\n", "-5\n", "7\n", "9\n", "10\n"]
+        self.assertEqual(self.__run(counted, inputs), self.__run(program, inputs))
+
+    def test_not_counted(self):
+        sources = [
+            # the induction variable is assigned in the body
+            "10 LET I=I+1\n LET I=I*2\n LET I=I+1\n IF I<10 THEN GOTO 10\n",
+            # the bound changes in the body
+            "10 LET N=N+1\n LET I=I+1\n IF I<N THEN GOTO 10\n",
+            # the loop counts away from its bound
+            "10 PRINT I\n LET I=I-1\n IF I<10 THEN GOTO 10\n",
+            # a routine called in the body reads the induction variable
+            "10 GOSUB 100\n LET I=I+1\n IF I<10 THEN GOTO 10\n END\n100 PRINT I\n RETURN\n",
+        ]
+        for source in sources:
+            stats = CountedLoopStats()
+            recognize_counted_loops(self.__program(source), stats)
+            self.assertEqual(stats.loops, 0, source)
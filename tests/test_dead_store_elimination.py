@@ -0,0 +1,155 @@
+import glob
+import os
+import subprocess
+import tempfile
+import time
+import unittest
+import bastors.parse as parse
+from bastors.dead_store_elimination import DeadStoreStats, eliminate_dead_stores
+from bastors.goto_elimination import eliminate_goto
+from bastors.pipeline import transpiler
+from bastors.rustify import rustify
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "programs")
+
+
+class TestDeadStoreElimination(unittest.TestCase):
+    def __eliminate(self, source, stats=None):
+        program = eliminate_goto(parse.Parser(source).parse())
+        return rustify(eliminate_dead_stores(program, stats))
+
+    def test_unused_variables(self):
+        stats = DeadStoreStats()
+        rust = self.__eliminate(
+            """
+                LET U=5
+                LET I=0
+            10  LET I=I+1
+                LET W=I*2
+                LET K=I
+                IF I<10 THEN GOTO 10
+                PRINT K
+            """,
+            stats,
+        )
+        self.assertNotIn("state.u", rust)
+        self.assertNotIn("state.w", rust)
+        self.assertIn("state.k = state.i;", rust)
+        self.assertEqual(stats.stores, 2)
+        self.assertEqual(stats.variables, ["u", "w"])
+
+    def test_overwritten(self):
+        rust = self.__eliminate(
+            """
+            LET A=1
+            LET A=2
+            PRINT A
+            LET A=3
+            """
+        )
+        self.assertNotIn("state.a = 1;", rust)
+        self.assertIn("state.a = 2;", rust)
+        self.assertNotIn("state.a = 3;", rust)
+
+    def test_branches_and_loops(self):
+        rust = self.__eliminate(
+            """
+                LET A=1
+                INPUT B
+                IF B>0 THEN LET A=2
+                PRINT A
+                LET C=0
+            10  LET D=C
+                LET C=C+1
+                IF C<5 THEN GOTO 10
+                PRINT D
+            """
+        )
+        self.assertIn("state.a = 1;", rust)
+        self.assertIn("state.a = 2;", rust)
+        self.assertIn("state.c = state.c + 1;", rust)
+        self.assertIn("state.d = state.c;", rust)
+
+    def test_gosub(self):
+        rust = self.__eliminate(
+            """
+                LET A=1
+                LET B=2
+                GOSUB 100
+                END
+            100 PRINT A
+                LET C=A
+                RETURN
+            200 PRINT C
+                RETURN
+            """
+        )
+        self.assertIn("state.a = 1;", rust)
+        self.assertNotIn("state.b", rust)
+        self.assertIn("state.c = state.a;", rust)
+
+    def test_for_value(self):
+        # The value a FOR loop leaves in its variable is only assigned
+        # where it is read, the variable of the other loop is gone
+        rust = self.__eliminate(
+            """
+            FOR I = 1 TO 15 STEP 2
+            PRINT I
+            NEXT I
+            FOR J = 1 TO 3
+            PRINT J
+            NEXT J
+            PRINT J
+            """
+        )
+        self.assertNotIn("state.i", rust)
+        self.assertIn("for i in (1..16).step_by(2) {", rust)
+        self.assertIn("state.j = 4;", rust)
+
+    def test_input(self):
+        # INPUT reads a number for A either way
+        rust = self.__eliminate(
+            """
+            INPUT A, B
+            PRINT B
+            INPUT A
+            PRINT A
+            """
+        )
+        self.assertIn(
+            "input_i32(&mut state);\n    state.b = input_i32(&mut state);", rust
+        )
+        self.assertEqual(rust.count("state.a = input_i32(&mut state);"), 1)
+
+    def test_no_warnings(self):
+        # Stores the elimination leaves are read, rustc has nothing to
+        # warn about
+        with tempfile.TemporaryDirectory() as directory:
+            for path in sorted(glob.glob(os.path.join(PROGRAMS, "*.bas"))):
+                rs = os.path.join(directory, "program.rs")
+                with open(path) as file:
+                    transpiler(out=rs, opt_level=1).run(file.read())
+                binary = os.path.join(directory, "program")
+                rc = subprocess.call(
+                    ["rustc", "-D", "warnings", "-o", binary, rs],
+                    stderr=subprocess.DEVNULL,
+                )
+                self.assertEqual(rc, 0, path)
+
+    def test_deep_nesting(self):
+        # Every loop is rewritten once, nested loops do not visit their
+        # bodies a number of times exponential in the depth
+        variables = [chr(ord("A") + depth) for depth in range(25)]
+        lines = ["%d LET %s=0" % (10 * (i + 1), v) for i, v in enumerate(variables)]
+        lines.append("LET Z=Z+1")
+        for i, var in reversed(list(enumerate(variables))):
+            lines.append("LET %s=%s+1" % (var, var))
+            lines.append("IF %s<2 THEN GOTO %d" % (var, 10 * (i + 1)))
+        lines.append("PRINT Z")
+        fors = ["FOR %s=1 TO 2" % var for var in variables] + ["LET Z=Z+1"]
+        fors += ["NEXT %s" % var for var in reversed(variables)] + ["PRINT Z"]
+        for source in ("\n".join(lines), "\n".join(fors)):
+            program = eliminate_goto(parse.Parser(source + "\n").parse())
+            start = time.perf_counter()
+            eliminate_dead_stores(program)
+            self.assertLess(time.perf_counter() - start, 2.0)
@@ -8,13 +8,19 @@ If the output does not match, the test will fail and display the diff.
 
 import unittest
 import glob
+import io
 import os
 import subprocess
 import sys
 import tempfile
 import bastors.parse as parse
 import bastors.debug as debug
-from bastors.goto_elimination import eliminate_goto, classify_goto
+from bastors.goto_elimination import (
+    EliminationStats,
+    GotoBudgetError,
+    eliminate_goto,
+    classify_goto,
+)
 from bastors.rustify import Rustify
 
 
@@ -768,3 +774,100 @@ class TestGotoELim(unittest.TestCase):
         purged = eliminate_goto(program)
         self.__assert_ref(purged, "sp2.ref")
         self.__assert_compile(program)
+
+    def test_SP3(self):
+        """
+        A goto inside a labeled conditional goto jumps back to it, the
+        temporary variable must be cleared on every jump
+        """
+        source = """
+            1  INPUT X
+            2  IF X = 1 THEN GOTO 5
+            3  LET X=X-1
+            4  GOTO 2
+            5  PRINT X
+            """
+        try:
+            program = parse.Parser(source).parse()
+        except parse.ParseError as err:
+            self.fail(err)
+
+        self.assertEqual(classify_goto(program), "1.1")
+        purged = eliminate_goto(program)
+        self.__assert_ref(purged, "sp3.ref")
+        self.__assert_compile(program)
+
+    def test_SP4(self):
+        """
+        Negative numbers and negated expressions, dumped with their sign
+        """
+        source = """
+            1  INPUT X
+            2  IF X < -5 THEN GOTO 4
+            3  LET X=-X
+            4  PRINT X, -(X+1)
+            """
+        try:
+            program = parse.Parser(source).parse()
+        except parse.ParseError as err:
+            self.fail(err)
+
+        purged = eliminate_goto(program)
+        self.__assert_ref(purged, "sp4.ref")
+        self.__assert_compile(program)
+
+    def test_stats(self):
+        """
+        The statistics should count the applied cases and the growth
+        """
+        source = """
+            10 LET A=1
+            20 IF A=1 THEN GOTO 50
+            30 LET B=A+2
+            40 PRINT B
+            50 PRINT A
+            60 GOTO 10
+            """
+        program = parse.Parser(source).parse()
+        stats = EliminationStats()
+        eliminate_goto(program, stats=stats)
+
+        self.assertEqual(stats.counts["1.1"], 1)
+        self.assertEqual(stats.counts["1.2"], 1)
+        self.assertEqual(len(stats.steps), 2)
+        self.assertEqual(stats.nodes_before, 7)
+        self.assertEqual(stats.steps[-1].nodes_after, stats.nodes_after)
+        self.assertEqual(stats.as_dict()["temps"], 0)
+
+    def test_max_growth(self):
+        """
+        Exceeding the growth budget should abort the elimination
+        """
+        path = "%s/../programs/hunt-the-hurkle.bas" % os.path.dirname(__file__)
+        with open(path) as basic:
+            program = parse.Parser(basic.read()).parse()
+
+        with self.assertRaises(GotoBudgetError) as ctx:
+            eliminate_goto(program, max_growth=1.05)
+
+        self.assertGreater(ctx.exception.stats.growth(), 1.05)
+
+    def test_deep_nesting(self):
+        """
+        Nesting deeper than the recursion limit should not raise RecursionError
+        """
+        depth = sys.getrecursionlimit() + 500
+        cond = parse.Condition(
+            parse.VariableExpression("a"), "<", "10", parse.ConditionEnum.INITIAL
+        )
+        inner = [parse.If(None, [cond], [parse.Goto(None, 10)])]
+        for _ in range(depth):
+            inner = [parse.Print(None, ['"S"']), parse.If(None, [cond], inner)]
+        program = parse.Program({"main": [parse.Print(10, ['"top"'])] + inner})
+
+        purged = eliminate_goto(program)
+        self.assertIsNone(classify_goto(purged))
+
+        rust = Rustify()
+        rust.visit(purged)
+        rust.output(io.StringIO())
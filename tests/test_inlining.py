@@ -0,0 +1,78 @@
+import os
+import subprocess
+import tempfile
+import unittest
+import bastors.parse as parse
+from bastors.goto_elimination import eliminate_goto
+from bastors.inlining import Block, InlineStats, inline_gosubs
+from bastors.rustify import rustify
+
+SOURCE = """
+    LET I=0
+10  LET I=I+1
+    GOSUB 100
+    GOSUB 200
+    IF I<4 THEN GOTO 10
+    GOSUB 300
+    PRINT "not reached"
+100 PRINT I
+    RETURN
+200 IF I=2 THEN RETURN
+    PRINT "not two"
+    RETURN
+300 PRINT "done"
+    END
+"""
+
+
+class TestInlining(unittest.TestCase):
+    def __program(self, source):
+        return eliminate_goto(parse.Parser(source).parse())
+
+    def __run(self, program):
+        with tempfile.TemporaryDirectory() as directory:
+            rs = os.path.join(directory, "inline.rs")
+            with open(rs, "w") as out:
+                rustify(program, out, promote_locals=True)
+
+            binary = os.path.join(directory, "inline")
+            rc = subprocess.call(["rustc", "-o", binary, rs])
+            self.assertEqual(rc, 0)
+            return subprocess.check_output([binary]).decode("ascii")
+
+    def test_inline(self):
+        program = self.__program(SOURCE)
+        stats = InlineStats()
+        inlined = inline_gosubs(program, stats=stats)
+        self.assertEqual(list(inlined.statements.keys()), ["main"])
+        self.assertEqual(stats.calls, 3)
+        self.assertEqual(sorted(stats.removed), ["100", "200", "300"])
+
+        blocks = [stmt for stmt in inlined.statements["main"] if isinstance(stmt, Block)]
+        self.assertEqual(blocks, [])
+        rust = rustify(inlined)
+        self.assertIn("break 'f_200_", rust)
+        self.assertNotIn("fn f_", rust)
+        self.assertEqual(self.__run(inlined), self.__run(program))
+
+    def test_threshold(self):
+        program = self.__program(SOURCE + "    GOSUB 100\n")
+        inlined = inline_gosubs(program, threshold=1)
+        # 200 and 300 are called once, 100 is called twice and too large
+        self.assertEqual(sorted(inlined.statements.keys(), key=str), [100, "main"])
+        self.assertIs(inline_gosubs(program, threshold=0), program)
+
+    def test_recursion(self):
+        program = self.__program(
+            """
+                GOSUB 100
+                END
+            100 LET N=N+1
+                IF N<3 THEN GOSUB 100
+                PRINT N
+                RETURN
+            """
+        )
+        inlined = inline_gosubs(program)
+        self.assertIn(100, inlined.statements)
+        self.assertEqual(self.__run(inlined).split(), ["3", "3", "3"])
@@ -0,0 +1,66 @@
+import io
+import os
+import subprocess
+import tempfile
+import unittest
+import bastors.parse as parse
+from bastors.instrument import branch_counts, line_counts, read_counts
+from bastors.pipeline import transpiler
+
+SOURCE = """INPUT N
+10 LET I=1
+20 IF I/2*2=I THEN LET E=E+1
+LET I=I+1
+IF I<=N THEN GOTO 20
+GOSUB 100
+PRINT E
+100 IF E>100 THEN END
+RETURN
+"""
+
+
+class TestInstrument(unittest.TestCase):
+    def __counts(self, source, inputs, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            rs = os.path.join(directory, "instrumented.rs")
+            counts = os.path.join(directory, "instrumented.counts")
+            rust_options = dict(options, instrument=counts)
+            transpiler(out=rs, rust_options=rust_options).run(source)
+            binary = os.path.join(directory, "instrumented")
+            rc = subprocess.call(["rustc", "-o", binary, rs], stderr=subprocess.DEVNULL)
+            self.assertEqual(rc, 0)
+            process = subprocess.run(
+                [binary], input=inputs, capture_output=True, check=True
+            )
+            with open(counts) as file:
+                return process.stdout, read_counts(file)
+
+    def test_counts(self):
+        for buffered in (False, True):
+            stdout, counters = self.__counts(SOURCE, b"7\n", buffered_output=buffered)
+            self.assertEqual(stdout, b"3\n")
+            lines = line_counts(counters)
+            self.assertEqual(lines[1], 1)
+            self.assertEqual(lines[3], 7)
+            self.assertEqual(lines[4], 7)
+            self.assertEqual(lines[5], 7)
+            self.assertEqual(lines[8], 1)
+            branches = branch_counts(counters)
+            self.assertEqual(branches[parse.Position(20, 3, 4)], (3, 4))
+            self.assertEqual(branches[parse.Position(None, 5, 1)], (6, 1))
+            self.assertEqual(branches[parse.Position(100, 8, 5)], (0, 1))
+
+    def test_exits(self):
+        # END in a routine, and the end of input in INPUT, end the program
+        source = "INPUT A\nGOSUB 100\nINPUT B\n100 IF A>1 THEN END\nRETURN\n"
+        _, counters = self.__counts(source, b"5\n")
+        self.assertEqual(line_counts(counters)[4], 1)
+        _, counters = self.__counts(source, b"0\n")
+        self.assertEqual(line_counts(counters), {1: 1, 2: 1, 3: 1, 4: 1, 5: 1})
+
+    def test_read_counts(self):
+        counters = read_counts(
+            io.StringIO("3 4 20 statement 12\n3 4 20 taken 5\n3 4 20 not-taken 7\n")
+        )
+        self.assertEqual(line_counts(counters), {3: 12})
+        self.assertEqual(branch_counts(counters), {parse.Position(20, 3, 4): (5, 7)})
@@ -0,0 +1,91 @@
+import os
+import subprocess
+import tempfile
+import unittest
+import bastors.parse as parse
+from bastors.goto_elimination import Loop, eliminate_goto
+from bastors.loop_optimizations import LoopStats, optimize_loops
+from bastors.pipeline import transpiler
+
+SOURCE = """
+    INPUT A, B, N
+    LET I = 0
+10  LET S = S + A * B + I
+    IF A < B THEN LET S = S + 1
+    IF N > 0 THEN LET T = T + 100 / N
+    LET I = I + 1
+    IF I < N THEN GOTO 10
+    PRINT S, " ", T, " ", I
+    FOR J = 1 TO N
+    PRINT J * (A + B)
+    NEXT J
+    FOR K = N TO 1 STEP -3
+    NEXT K
+    PRINT K
+"""
+
+
+class TestLoopOptimizations(unittest.TestCase):
+    def __optimize(self, source):
+        stats = LoopStats()
+        program = optimize_loops(eliminate_goto(parse.Parser(source).parse()), stats)
+        return program.statements["main"], stats
+
+    def test_empty_loops(self):
+        main, stats = self.__optimize(
+            "FOR J = 1 TO 500\nNEXT J\nFOR K = 10 TO 1 STEP -4\nNEXT K\n"
+            "FOR L = 1 TO N STEP 2\nNEXT L\nFOR M = 1 TO 2 STEP N\nNEXT M\n"
+        )
+        self.assertEqual(stats.removed, 3)
+        self.assertEqual(main[0], parse.Let(None, parse.VariableExpression("j"), "501"))
+        self.assertEqual(
+            main[1],
+            parse.Let(
+                None,
+                parse.VariableExpression("k"),
+                parse.ArithmeticExpression(None, "-", "2"),
+            ),
+        )
+        self.assertIsInstance(main[3], parse.If)
+        # The step is not known, so neither is the final value
+        self.assertIsInstance(main[4], parse.For)
+
+    def test_hoist(self):
+        main, stats = self.__optimize(
+            "10 LET S = S + A * B\nLET T = T + 10 / A\nPRINT S\nLET T = T + 10 / B\n"
+            "IF S < A * B THEN GOTO 10\n"
+        )
+        self.assertEqual(stats.hoisted, 2)
+        a_b = parse.ArithmeticExpression(
+            parse.VariableExpression("a"), "*", parse.VariableExpression("b")
+        )
+        ten_a = parse.ArithmeticExpression("10", "/", parse.VariableExpression("a"))
+        self.assertEqual(main[0], parse.Let(None, parse.VariableExpression("h0"), a_b))
+        self.assertEqual(main[1], parse.Let(None, parse.VariableExpression("h1"), ten_a))
+        loop = main[2]
+        self.assertIsInstance(loop, Loop)
+        # Only evaluated after the PRINT, so it might divide by zero
+        self.assertEqual(
+            loop.statements[3].rval.right,
+            parse.ArithmeticExpression("10", "/", parse.VariableExpression("b")),
+        )
+        self.assertEqual(loop.conditions[0].right, parse.VariableExpression("h0"))
+
+    def test_run(self):
+        outputs = list()
+        with tempfile.TemporaryDirectory() as directory:
+            for opt_level in (2, 3):
+                rs = os.path.join(directory, "loops_%d.rs" % opt_level)
+                with open(rs, "w") as out:
+                    out.write(transpiler(opt_level=opt_level).run(SOURCE))
+                binary = rs[:-3]
+                rc = subprocess.call(["rustc", "-o", binary, rs], stderr=subprocess.DEVNULL)
+                self.assertEqual(rc, 0)
+                outputs.append(
+                    [
+                        subprocess.check_output([binary], input=value)
+                        for value in (b"2 3 4\n", b"0 5 0\n", b"3 1 -2\n")
+                    ]
+                )
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[1][0].decode("ascii").split("\n")[0], "34 100 4")
@@ -0,0 +1,70 @@
+import glob
+import os
+import subprocess
+import tempfile
+import unittest
+import bastors.parse as parse
+from bastors.goto_elimination import count_nodes, eliminate_goto
+from bastors.outlining import OutlineStats, outline_main
+from bastors.rustify import rustify
+
+SOURCE = (
+    "INPUT N\n"
+    + "".join(
+        "LET A = A + N * %d\nIF A > 100 THEN LET A = A - 100\nPRINT A\n" % i
+        for i in range(30)
+    )
+    + "10 LET N = N - 1\nGOSUB 100\nIF N > 0 THEN GOTO 10\nPRINT A\nEND\n"
+    + "100 LET A = A + 1\nRETURN\n"
+)
+
+
+class TestOutlining(unittest.TestCase):
+    def __program(self):
+        return eliminate_goto(parse.Parser(SOURCE).parse())
+
+    def __run(self, directory, rs):
+        binary = os.path.join(directory, "outlined")
+        rc = subprocess.call(["rustc", "-o", binary, rs], stderr=subprocess.DEVNULL)
+        self.assertEqual(rc, 0)
+        return subprocess.run(
+            [binary], input=b"3\n", capture_output=True, check=True
+        ).stdout
+
+    def test_outline(self):
+        stats = OutlineStats()
+        program = outline_main(self.__program(), size=16, stats=stats)
+        routines = [name for name in program.statements if str(name).startswith("main_")]
+        self.assertEqual(len(routines), stats.routines)
+        self.assertGreater(stats.routines, 1)
+        self.assertIn(100, program.statements)
+        for name in routines:
+            self.assertLessEqual(count_nodes(program.statements[name])[0], 16)
+        self.assertLess(count_nodes(program.statements["main"])[0], stats.statements)
+
+    def test_small(self):
+        program = self.__program()
+        self.assertIs(outline_main(program, size=1000), program)
+
+    def test_split(self):
+        program = self.__program()
+        with tempfile.TemporaryDirectory() as directory:
+            rs = os.path.join(directory, "outlined.rs")
+            with open(rs, "w") as out:
+                rustify(program, out, promote_locals=True)
+            expected = self.__run(directory, rs)
+
+        for promote_locals in (False, True):
+            with tempfile.TemporaryDirectory() as directory:
+                rs = os.path.join(directory, "main.rs")
+                with open(rs, "w") as out:
+                    rustify(
+                        outline_main(program, size=16),
+                        out,
+                        promote_locals=promote_locals,
+                        module_dir=directory,
+                    )
+                modules = glob.glob(os.path.join(directory, "f_*.rs"))
+                self.assertIn(os.path.join(directory, "f_100.rs"), modules)
+                self.assertIn(os.path.join(directory, "f_main_1.rs"), modules)
+                self.assertEqual(self.__run(directory, rs), expected)
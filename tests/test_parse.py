@@ -32,6 +32,23 @@ class TestParse(unittest.TestCase):
             self.fail(err)
 
 
+    def test_for_expressions(self):
+        program = """ 20 FOR I = N + 1 TO 2 * N STEP -2
+                      30 PRINT I
+                      40 NEXT I
+                """
+        node = parse.Parser(program).parse()
+        loop = node.statements["main"][0]
+        self.assertEqual(
+            loop.start,
+            parse.ArithmeticExpression(parse.VariableExpression("n"), "+", "1"),
+        )
+        self.assertEqual(
+            loop.stop,
+            parse.ArithmeticExpression("2", "*", parse.VariableExpression("n")),
+        )
+        self.assertEqual(loop.step, parse.ArithmeticExpression(None, "-", "2"))
+
     def test_assign(self):
         program = """ 20 I=5
                       30 PRINT I
@@ -56,3 +73,10 @@ class TestParse(unittest.TestCase):
             parser.parse()
         except ParseError as err:
             self.fail(err)
+
+    def test_position(self):
+        program = "REM a comment\n10 PRINT 1\n20 FOR I = 1 TO 2\n  LET A = I\nNEXT I\n"
+        main = parse.Parser(program).parse().statements["main"]
+        self.assertEqual(main[0].position, parse.Position(10, 2, 4))
+        self.assertEqual(main[1].position, parse.Position(20, 3, 4))
+        self.assertEqual(main[1].statements[0].position, parse.Position(None, 4, 3))
@@ -0,0 +1,37 @@
+import os
+import tempfile
+import unittest
+from bastors.build import BuildError
+from bastors.pgo import build_pgo, find_profdata, llvm_version
+from bastors.pipeline import transpiler
+
+SOURCE = """INPUT N
+10 LET S=S+N
+LET N=N-1
+IF N>0 THEN GOTO 10
+PRINT S
+"""
+
+
+class TestPGO(unittest.TestCase):
+    def test_llvm_version(self):
+        self.assertEqual(llvm_version("release: 1.90.0\nLLVM version: 20.1.8\n"), 20)
+        self.assertEqual(llvm_version("Debian LLVM version 14.0.6\n"), 14)
+        self.assertIsNone(llvm_version("no version here"))
+
+    def test_build(self):
+        try:
+            find_profdata()
+        except BuildError as err:
+            self.skipTest(str(err))
+        rust = transpiler(opt_level=2).run(SOURCE)
+        with tempfile.TemporaryDirectory() as directory:
+            training = os.path.join(directory, "training")
+            with open(training, "w") as file:
+                file.write("1000\n")
+            binary = os.path.join(directory, "sum")
+            result = build_pgo(rust, binary, training)
+            self.assertEqual(result.binary, binary)
+            self.assertTrue(os.access(binary, os.X_OK))
+            self.assertGreater(result.plain_time, 0)
+            self.assertGreater(result.pgo_time, 0)
@@ -0,0 +1,48 @@
+import unittest
+from bastors.pipeline import PassManager, transpiler
+
+SOURCE = """
+    10 LET A=1
+       PRINT A
+       IF A<5 THEN GOTO 10
+       END
+"""
+
+
+class TestPipeline(unittest.TestCase):
+    def test_register(self):
+        manager = PassManager()
+        manager.register("double", lambda value: value * 2)
+        manager.register("inc", lambda value: value + 1, before="double")
+        manager.register("neg", lambda value: -value, after="inc")
+
+        self.assertEqual(manager.passes(), ["inc", "neg", "double"])
+        self.assertEqual(manager.run(1), -4)
+        self.assertEqual(manager.results["neg"], -2)
+        self.assertEqual([t.name for t in manager.timings], manager.passes())
+
+    def test_cache(self):
+        cache = dict()
+        first = transpiler(cache=cache)
+        rust = first.run(SOURCE)
+        self.assertFalse(any(timing.cached for timing in first.timings))
+
+        second = transpiler(cache=cache)
+        self.assertEqual(second.run(SOURCE), rust)
+        self.assertTrue(all(timing.cached for timing in second.timings))
+
+        third = transpiler(cache=cache, max_growth=10.0)
+        self.assertEqual(third.run(SOURCE), rust)
+        cached = [timing.cached for timing in third.timings]
+        self.assertEqual(cached, [True, True, False, False])
+
+    def test_timings(self):
+        manager = transpiler(stats=True, measure_memory=True)
+        self.assertIn("fn main()", manager.run(SOURCE))
+
+        timings = manager.timings_dict()
+        names = [timing["name"] for timing in timings["passes"]]
+        self.assertEqual(names, ["lex", "parse", "goto_elimination", "emit"])
+        for timing in timings["passes"]:
+            self.assertGreaterEqual(timing["peak_memory"], 0)
+        self.assertEqual(manager.stats["goto_elimination"].counts["1.2"], 1)
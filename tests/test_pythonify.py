@@ -0,0 +1,71 @@
+import io
+import os
+import unittest
+import bastors.parse as parse
+from bastors.goto_elimination import eliminate_goto
+from bastors.pipeline import transpiler
+from bastors.pythonify import CODE_CACHE, execute, load, pythonify, run
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "programs")
+
+SOURCE = """INPUT A
+GOSUB 100
+PRINT A, " ", I
+LET B = -2147483647 - 1
+PRINT B - 1, " ", B / 3, " ", -7 / 2
+END
+100 IF A > 5 THEN RETURN
+LET A = A * 2
+FOR I = 1 TO 3
+IF A > 11 THEN RETURN
+LET A = A + I
+NEXT I
+RETURN
+"""
+
+
+class TestPythonify(unittest.TestCase):
+    def __run(self, code, inputs=""):
+        out = io.StringIO()
+        execute(load(code), io.StringIO(inputs), out)
+        return out.getvalue()
+
+    def test_levels(self):
+        # Inlining at level 1 turns the routine into a Block, left by
+        # raising an exception
+        for level in range(4):
+            code = transpiler(opt_level=level, python=True).run(SOURCE)
+            self.assertEqual(
+                self.__run(code, "3\n"), "12 4\n2147483647 -715827882 -3\n"
+            )
+            self.assertEqual(self.__run(code, "5\n").split("\n")[0], "13 3")
+            self.assertEqual(self.__run(code, "30\n").split("\n")[0], "30 0")
+            self.assertEqual(self.__run(code), "")
+
+    def test_structure(self):
+        source = "10 INPUT N\nIF N < 0 THEN GOSUB 100\nIF N > 0 THEN GOTO 10\n"
+        source += "100 PRINT N\nRETURN\n"
+        code = pythonify(eliminate_goto(parse.Parser(source).parse()))
+        self.assertIn("def main():\n    global n\n", code)
+        self.assertIn("def f_100():\n    global n\n", code)
+        self.assertIn("    while True:\n", code)
+        self.assertIn("        if not (n > 0):\n            break\n", code)
+        self.assertEqual(self.__run(code, "3 -2 0\n"), "-2\n")
+
+    def test_cache(self):
+        code = transpiler(python=True).run(SOURCE)
+        code_object = load(code)
+        self.assertIs(load(code), code_object)
+        self.assertIn(code_object, CODE_CACHE.values())
+
+    def test_run(self):
+        with open(os.path.join(PROGRAMS, "fibonacci.bas")) as file:
+            out = io.StringIO()
+            run(file.read(), io.StringIO(), out)
+        self.assertEqual(out.getvalue().split()[-3:], ["233", "377", "610"])
+
+    def test_errors(self):
+        code = transpiler(python=True).run("INPUT A\nPRINT 10 / A\n")
+        self.assertEqual(self.__run(code, "x 1\n2\n"), "invalid number\n5\n")
+        with self.assertRaises(ZeroDivisionError):
+            self.__run(code, "0\n")
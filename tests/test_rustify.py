@@ -2,13 +2,15 @@
 This module will attempt to transpile all TinyBasic programs in the programs
 directory and then attemp to compile them using rustc.
 """
+import io
 import os
 import unittest
 import subprocess
+import tempfile
 import bastors.parse as parse
 import bastors.debug as debug
 from bastors.goto_elimination import eliminate_goto, classify_goto
-from bastors.rustify import Rustify
+from bastors.rustify import Rustify, rustify, rustify_bytes
 
 
 class TestRustify(unittest.TestCase):
@@ -34,3 +36,204 @@ class TestRustify(unittest.TestCase):
 
                     purged = eliminate_goto(program)
                     self.__assert_compile(purged, "1_1_a")
+
+    def test_streaming(self):
+        source = """
+            10 LET A=1
+               PRINT "A is ", A
+               IF A<5 THEN GOTO 10
+               GOSUB 100
+               END
+           100 INPUT B
+               RETURN
+            """
+        rust = rustify(eliminate_goto(parse.Parser(source).parse()))
+        self.assertTrue(rust.startswith("use std::io;\n"))
+        self.assertIn("\nstruct State {\n", rust)
+
+        out = io.StringIO()
+        streamed = Rustify(out)
+        streamed.visit(eliminate_goto(parse.Parser(source).parse()))
+        self.assertEqual(out.getvalue(), rust)
+
+        program = eliminate_goto(parse.Parser(source).parse())
+        self.assertEqual(rustify_bytes(program), rust.encode("utf-8"))
+
+    def test_buffered_output(self):
+        source = """
+                LET A=0
+                LET B=1
+            100 PRINT A
+                LET B=A+B
+                LET A=B-A
+                IF B<=100 THEN GOTO 100
+                GOSUB 200
+                PRINT "not reached"
+            200 PRINT "done"
+                END
+            """
+        program = eliminate_goto(parse.Parser(source).parse())
+        with tempfile.TemporaryDirectory() as directory:
+            rs = os.path.join(directory, "buffered.rs")
+            with open(rs, "w") as out:
+                rustify(program, out, buffered_output=True)
+
+            binary = os.path.join(directory, "buffered")
+            rc = subprocess.call(["rustc", "-o", binary, rs])
+            self.assertEqual(rc, 0)
+            output = subprocess.check_output([binary]).decode("ascii")
+            self.assertEqual(output.split(), "0 1 1 2 3 5 8 13 21 34 55 done".split())
+
+    def test_input(self):
+        source = """
+            10 INPUT X,Y
+               PRINT X + Y
+               IF X<>0 THEN GOTO 10
+            """
+        program = eliminate_goto(parse.Parser(source).parse())
+        for buffered in (False, True):
+            with tempfile.TemporaryDirectory() as directory:
+                rs = os.path.join(directory, "input.rs")
+                with open(rs, "w") as out:
+                    rustify(program, out, buffered_output=buffered)
+
+                binary = os.path.join(directory, "input")
+                rc = subprocess.call(["rustc", "-o", binary, rs])
+                self.assertEqual(rc, 0)
+                output = subprocess.check_output(
+                    [binary], input=b"1 2\n3,4\nx 9\n5\n\n6\n0 1\n7 7\n"
+                )
+                self.assertEqual(
+                    output.decode("ascii").split("\n"),
+                    ["3", "7", "invalid number", "11", "1", ""],
+                )
+
+    def test_promote_locals(self):
+        source = """
+                LET I=0
+            10  LET I=I+1
+                GOSUB 100
+                PRINT I, " ", S
+                IF I<5 THEN GOTO 10
+                END
+            100 LET S=S+I
+                RETURN
+            """
+        program = eliminate_goto(parse.Parser(source).parse())
+        rust = rustify(program, promote_locals=True)
+        self.assertIn(
+            "#[allow(unused_assignments)]\n    let mut i: i32 = 0;", rust
+        )
+        self.assertIn("state.i = i;", rust)
+        self.assertIn("s = state.s;", rust)
+        self.assertNotIn("state.i = state.i", rust)
+
+        with tempfile.TemporaryDirectory() as directory:
+            rs = os.path.join(directory, "locals.rs")
+            with open(rs, "w") as out:
+                out.write(rust)
+
+            # The zero i starts with is never read
+            binary = os.path.join(directory, "locals")
+            rc = subprocess.call(["rustc", "-D", "warnings", "-o", binary, rs])
+            self.assertEqual(rc, 0)
+            output = subprocess.check_output([binary]).decode("ascii")
+            self.assertEqual(output.split("\n"), ["1 1", "2 3", "3 6", "4 10", "5 15", ""])
+
+    def test_for(self):
+        source = """
+                INPUT N
+                LET S=-1
+                FOR I = 1 TO N
+                PRINT I
+                NEXT I
+                PRINT "i ", I
+                FOR J = N TO -3 STEP -2
+                GOSUB 100
+                NEXT J
+                PRINT "j ", J
+                FOR K = N * 2 TO N + 10 STEP S + 4
+                LET K = K + 1
+                NEXT K
+                PRINT "k ", K
+                FOR L = 10 TO N STEP S
+                NEXT L
+                PRINT "l ", L
+                END
+            100 PRINT "j ", J
+                RETURN
+            """
+        program = eliminate_goto(parse.Parser(source).parse())
+        rust = rustify(program, promote_locals=True)
+        self.assertIn("for i in 1..=n {", rust)
+        self.assertIn("for j in (-3..=n).rev().step_by(2) {", rust)
+        self.assertIn("state.j = j;", rust)
+        self.assertIn("while if k_step >= 0 { k <= k_stop } else { k >= k_stop } {", rust)
+
+        with tempfile.TemporaryDirectory() as directory:
+            rs = os.path.join(directory, "for.rs")
+            with open(rs, "w") as out:
+                out.write(rust)
+
+            binary = os.path.join(directory, "for")
+            rc = subprocess.call(["rustc", "-o", binary, rs])
+            self.assertEqual(rc, 0)
+            outputs = [
+                subprocess.check_output([binary], input=value).decode("ascii")
+                for value in (b"3\n", b"-4\n")
+            ]
+            self.assertEqual(
+                outputs[0].split("\n"),
+                ["1", "2", "3", "i 4", "j 3", "j 1", "j -1", "j -3", "j -5"]
+                + ["k 14", "l 2", ""],
+            )
+            self.assertEqual(
+                outputs[1].split("\n"), ["i 1", "j -4", "k 8", "l -5", ""],
+            )
+
+    def test_for_unread_variable(self):
+        source = """
+                FOR I = 1 TO 3
+                PRINT "x"
+                NEXT I
+                PRINT I
+            """
+        program = eliminate_goto(parse.Parser(source).parse())
+        rust = rustify(program)
+        self.assertIn("for _ in 1..4 {", rust)
+        self.assertIn("state.i = 4;", rust)
+
+    def test_print(self):
+        source = """
+                INPUT N
+                PRINT "{n}=", N, " ", -N, " ", N * 1000
+                PRINT "a"
+                PRINT "b ", 2
+                IF N > 0 THEN PRINT "positive"
+                PRINT 0, " ", -2147483647 - 1, " ", 99, " ", 100
+            """
+        program = eliminate_goto(parse.Parser(source).parse())
+        expected = [
+            ["{n}=7 -7 7000", "a", "b 2", "positive", "0 -2147483648 99 100", ""],
+            ["{n}=-45 45 -45000", "a", "b 2", "0 -2147483648 99 100", ""],
+        ]
+        for buffered in (False, True):
+            rust = rustify(program, buffered_output=buffered)
+            if buffered:
+                self.assertIn('state.out.write_all(b"a\\nb 2\\n").unwrap();', rust)
+                self.assertIn("write_i32(&mut state.out, state.n * 1000);", rust)
+            else:
+                self.assertIn('print!("a\\nb 2\\n");', rust)
+                self.assertIn('println!("{{n}}={} {} {}", state.n', rust)
+
+            with tempfile.TemporaryDirectory() as directory:
+                rs = os.path.join(directory, "print.rs")
+                with open(rs, "w") as out:
+                    out.write(rust)
+
+                binary = os.path.join(directory, "print")
+                rc = subprocess.call(["rustc", "-o", binary, rs])
+                self.assertEqual(rc, 0)
+                for value, lines in zip((b"7\n", b"-45\n"), expected):
+                    output = subprocess.check_output([binary], input=value)
+                    self.assertEqual(output.decode("ascii").split("\n"), lines)
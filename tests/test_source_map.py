@@ -0,0 +1,86 @@
+import io
+import os
+import tempfile
+import unittest
+import bastors.parse as parse
+from bastors.goto_elimination import eliminate_goto
+from bastors.rustify import rustify
+from bastors.source_map import HotSpot, SourceMap, hot_spots
+
+SOURCE = """INPUT N
+10 LET I=1
+20 LET S=S+I*I
+LET I=I+1
+IF I<=N THEN GOTO 20
+PRINT S
+GOSUB 100
+END
+100 PRINT "done"
+RETURN
+"""
+
+
+class TestSourceMap(unittest.TestCase):
+    def __rustify(self, **options):
+        source_map = SourceMap()
+        program = eliminate_goto(parse.Parser(SOURCE).parse())
+        rust = rustify(program, source_map=source_map, **options)
+        return rust.splitlines(), source_map
+
+    def __line(self, lines, code):
+        return [index for index, line in enumerate(lines, 1) if line.strip() == code][0]
+
+    def test_lines(self):
+        lines, source_map = self.__rustify()
+        add = self.__line(lines, "state.s = state.s + state.i * state.i;")
+        self.assertEqual(source_map.lookup("main.rs", add), parse.Position(20, 3, 4))
+        # The loop condition comes from the GOTO
+        position = source_map.lookup("main.rs", self.__line(lines, "break;"))
+        self.assertEqual(position, parse.Position(None, 5, 1))
+        position = source_map.lookup("main.rs", self.__line(lines, 'println!("done");'))
+        self.assertEqual(position, parse.Position(100, 9, 5))
+        main = self.__line(lines, "fn main() {")
+        self.assertIsNone(source_map.lookup("main.rs", main))
+
+    def test_comments(self):
+        lines, source_map = self.__rustify(line_comments=True)
+        self.assertEqual(
+            lines[self.__line(lines, "// L20")],
+            "        state.s = state.s + state.i * state.i;",
+        )
+        self.assertIn("        // line 4", lines)
+        for rust_line in source_map.files["main.rs"]:
+            self.assertFalse(lines[rust_line - 1].strip().startswith("//"))
+
+    def test_split(self):
+        program = eliminate_goto(parse.Parser(SOURCE).parse())
+        source_map = SourceMap()
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "main.rs"), "w") as out:
+                rustify(program, out, module_dir=directory, source_map=source_map)
+            with open(os.path.join(directory, "f_100.rs")) as routine:
+                lines = routine.read().splitlines()
+        self.assertEqual(
+            source_map.lookup("f_100.rs", self.__line(lines, 'println!("done");')),
+            parse.Position(100, 9, 5),
+        )
+
+    def test_hot_spots(self):
+        lines, source_map = self.__rustify()
+        add = self.__line(lines, "state.s = state.s + state.i * state.i;")
+        print_s = self.__line(lines, 'println!("{}", state.s);')
+        report = [
+            "# Samples: 1K of event 'cycles'",
+            "    60.00%%  main.rs:%d" % add,
+            "    10.00%%  main.rs:%d" % print_s,
+            "     5.00%%  /tmp/build/main.rs:%d" % add,
+            "     4.00%%  io.rs:12",
+            "  /tmp/build/main.rs:%d" % print_s,
+        ]
+        buffer = io.StringIO()
+        source_map.dump(buffer)
+        buffer.seek(0)
+        self.assertEqual(
+            hot_spots(SourceMap.load(buffer), report),
+            [HotSpot(3, 20, 65.0), HotSpot(6, None, 11.0)],
+        )
@@ -0,0 +1,38 @@
+import unittest
+import bastors.parse as parse
+from bastors.visitor import Visitor
+
+
+class Names(Visitor):
+    def visit_If(self, node):
+        names = ["If"]
+        for statement in node.statements:
+            names += yield statement
+        return names
+
+    def visit_Print(self, node):  # pylint: disable=unused-argument
+        return ["Print"]
+
+
+class LoudNames(Names):
+    def visit_Print(self, node):  # pylint: disable=unused-argument
+        return ["PRINT"]
+
+
+class TestVisitor(unittest.TestCase):
+    def test_generator_results(self):
+        cond = parse.TrueFalseCondition("true", parse.ConditionEnum.INITIAL)
+        node = parse.If(None, [cond], [parse.Print(None, []), parse.Print(None, [])])
+        self.assertEqual(Names().visit(node), ["If", "Print", "Print"])
+
+    def test_dispatch_per_class(self):
+        node = parse.Print(None, [])
+        self.assertEqual(Names().visit(node), ["Print"])
+        self.assertEqual(LoudNames().visit(node), ["PRINT"])
+        self.assertEqual(Names().visit(node), ["Print"])
+
+    def test_default(self):
+        visitor = Names(lambda node: type(node).__name__)
+        self.assertEqual(visitor.visit(parse.End(None)), "End")
+        with self.assertRaises(Exception):
+            Names().visit(parse.End(None))
@@ -0,0 +1,98 @@
+import io
+import os
+import subprocess
+import tempfile
+import unittest
+from bastors.pipeline import transpiler
+from bastors.vm import VMError, run
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "programs")
+
+LOOPS = """INPUT N
+FOR I = 1 TO N
+PRINT I
+NEXT I
+PRINT "after ", I
+FOR J = N TO -3 STEP -2
+PRINT J
+NEXT J
+FOR K = 5 TO 1
+PRINT K
+NEXT K
+PRINT "none ", K
+GOSUB 100
+PRINT "left at ", K
+LET I = 3
+FOR I = 1 TO I + 2 STEP I - 2
+NEXT I
+PRINT I
+END
+100 FOR K = 10 TO 1 STEP -1
+IF K = 7 THEN RETURN
+NEXT K
+RETURN
+"""
+
+
+class TestVM(unittest.TestCase):
+    def __run(self, source, inputs=""):
+        out = io.StringIO()
+        run(source, io.StringIO(inputs), out)
+        return out.getvalue()
+
+    def __rust(self, source, inputs):
+        with tempfile.TemporaryDirectory() as directory:
+            rs = os.path.join(directory, "program.rs")
+            transpiler(out=rs).run(source)
+            binary = os.path.join(directory, "program")
+            rc = subprocess.call(["rustc", "-O", "-o", binary, rs])
+            self.assertEqual(rc, 0)
+            process = subprocess.run(
+                [binary], input=inputs.encode(), capture_output=True, check=True
+            )
+            return process.stdout.decode()
+
+    def test_fibonacci(self):
+        with open(os.path.join(PROGRAMS, "fibonacci.bas")) as file:
+            output = self.__run(file.read())
+        self.assertEqual(output.split()[:8], "0 1 1 2 3 5 8 13".split())
+        self.assertEqual(output.split()[-1], "610")
+
+    def test_loops(self):
+        self.assertEqual(
+            self.__run(LOOPS, "3\n"),
+            "1\n2\n3\nafter 4\n3\n1\n-1\n-3\nnone 5\nleft at 7\n6\n",
+        )
+
+    def test_same_as_rust(self):
+        with open(os.path.join(PROGRAMS, "hunt-the-hurkle.bas")) as file:
+            hurkle = file.read()
+        arithmetic = (
+            "10 INPUT A\nPRINT A*A*A*A, \" \", 0-A/3, \" \", -7/2\n"
+            "IF A > 100 THEN IF A < 200 THEN PRINT \"range\"\nGOTO 10\n"
+        )
+        for source, inputs in (
+            (LOOPS, "4\n"),
+            (hurkle, "5 5\n1 2\n3, 4\n9 9\n0 0\n5 1\n"),
+            (arithmetic, "5\nx 7\n-8, 150\n2147483648 4\n250\n"),
+        ):
+            self.assertEqual(self.__run(source, inputs), self.__rust(source, inputs))
+
+    def test_end(self):
+        # END in a routine ends the program, RETURN at the end of it and
+        # the end of input end it too
+        source = (
+            "INPUT A\nGOSUB 100\nPRINT A\nINPUT A\nPRINT A\n"
+            "100 IF A>1 THEN END\nRETURN\n"
+        )
+        self.assertEqual(self.__run(source, "5\n"), "")
+        self.assertEqual(self.__run(source, "1\n"), "1\n")
+        self.assertEqual(self.__run(source, "1\n0\n"), "1\n0\n")
+
+    def test_errors(self):
+        with self.assertRaises(VMError):
+            self.__run("GOTO 10\n")
+        with self.assertRaises(VMError):
+            self.__run("LET A=0\nPRINT 1/A\n")
+        with self.assertRaises(VMError):
+            self.__run("LET A=-2147483647-1\nPRINT A/(0-1)\n")